@@ -0,0 +1,68 @@
+import os
+import json
+import yaml
+
+# Written by the runs template's BackgroundCheckpointIO after every checkpoint
+LATEST_INDEX = 'latest.json'
+DEFAULT_CHECKPOINT_DIR = './checkpoints'
+FINAL_CHECKPOINT = 'final_model.ckpt'
+
+
+def checkpoint_dir(runs_dir):
+    """Absolute checkpoint directory of a run, from misc.checkpoint_dir in its config.yaml"""
+    directory = DEFAULT_CHECKPOINT_DIR
+    config_yaml_path = os.path.join(runs_dir, 'config.yaml')
+    if os.path.exists(config_yaml_path):
+        try:
+            with open(config_yaml_path, 'r') as f:
+                config = yaml.safe_load(f) or {}
+            directory = (config.get('misc') or {}).get('checkpoint_dir') or directory
+        except yaml.YAMLError:
+            pass
+    return os.path.abspath(os.path.join(runs_dir, directory))
+
+
+def latest_checkpoint(runs_dir):
+    """The run's most recent complete checkpoint, or None
+
+    Returns {"path", "epoch", "global_step", "saved_at"}. A checkpoint only
+    counts if latest.json names it and the file still has the size recorded
+    when it was written, so a file cut short by a crash is not resumed from.
+    """
+    directory = checkpoint_dir(runs_dir)
+    try:
+        with open(os.path.join(directory, LATEST_INDEX), 'r') as f:
+            latest = json.load(f)
+        path = os.path.join(directory, os.path.basename(latest["path"]))
+        if os.path.getsize(path) != latest["size"]:
+            return None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return {
+        "path": path,
+        "epoch": latest.get("epoch"),
+        "global_step": latest.get("global_step"),
+        "saved_at": latest.get("saved_at")
+    }
+
+
+def resumable_checkpoint(runs_dir):
+    """latest_checkpoint() unless it is the final checkpoint of a finished training"""
+    checkpoint = latest_checkpoint(runs_dir)
+    if checkpoint is None or os.path.basename(checkpoint["path"]) == FINAL_CHECKPOINT:
+        return None
+    return checkpoint
+
+
+# Written by the runs template whenever it settles on a micro-batch size
+MICRO_BATCH_INDEX = 'micro_batch.json'
+
+
+def recorded_micro_batch_size(runs_dir):
+    """Micro-batch size the run last trained with, or None"""
+    try:
+        with open(os.path.join(runs_dir, MICRO_BATCH_INDEX), 'r') as f:
+            size = json.load(f)["micro_batch_size"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return size if isinstance(size, int) and size > 0 else None
@@ -0,0 +1,112 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import importlib.util
+
+HAS_TORCH = importlib.util.find_spec('torch') is not None and importlib.util.find_spec('numpy') is not None
+if HAS_TORCH:
+    import numpy as np
+    from edgeai.engine import dataset_cache
+
+
+@unittest.skipUnless(HAS_TORCH, "needs numpy and torch")
+class EvictionTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+
+    def _entry(self, key, size, age=0):
+        """A complete entry of size bytes, last used age seconds ago"""
+        directory = os.path.join(self.root, key)
+        os.makedirs(directory)
+        with open(os.path.join(directory, 'data.u8'), 'wb') as f:
+            f.write(b'\0' * size)
+        dataset_cache.attach(directory).close()
+        used = time.time() - age
+        os.utime(f"{directory}.refs", (used, used))
+        return directory
+
+    def _keys(self):
+        return sorted(entry["key"] for entry in dataset_cache.entries(self.root))
+
+    def test_entries_report_references(self):
+        held = self._entry('held', 10)
+        self._entry('free', 20)
+        refs = dataset_cache.attach(held)
+        self.addCleanup(refs.close)
+        found = {entry["key"]: entry for entry in dataset_cache.entries(self.root)}
+        self.assertEqual(set(found), {'held', 'free'})
+        self.assertTrue(found['held']["in_use"])
+        self.assertFalse(found['free']["in_use"])
+        self.assertEqual(found['free']["bytes"], 20)
+
+    def test_partial_builds_are_not_entries(self):
+        self._entry('done', 10)
+        os.makedirs(os.path.join(self.root, 'building.tmp-123'))
+        self.assertEqual(self._keys(), ['done'])
+
+    def test_evicts_idle_entries(self):
+        self._entry('old', 10, age=7200)
+        self._entry('new', 10)
+        self.assertEqual(dataset_cache.evict_unused(self.root, max_idle_seconds=3600), ['old'])
+        self.assertEqual(self._keys(), ['new'])
+
+    def test_evicts_least_recently_used_down_to_budget(self):
+        self._entry('a', 100, age=30)
+        self._entry('b', 100, age=20)
+        self._entry('c', 100, age=10)
+        evicted = dataset_cache.evict_unused(self.root, max_bytes=150, max_idle_seconds=3600)
+        self.assertEqual(evicted, ['a', 'b'])
+        self.assertEqual(self._keys(), ['c'])
+
+    def test_referenced_entries_survive(self):
+        held = self._entry('held', 100, age=7200)
+        refs = dataset_cache.attach(held)
+        self.assertEqual(dataset_cache.evict_unused(self.root, max_bytes=0, max_idle_seconds=0), [])
+        refs.close()
+        self.assertEqual(dataset_cache.evict_unused(self.root, max_bytes=0, max_idle_seconds=0), ['held'])
+        self.assertFalse(os.path.exists(held))
+
+
+@unittest.skipUnless(HAS_TORCH, "needs numpy and torch")
+class MaterializeTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.samples = [(np.full((2, 3, 1), i, dtype=np.uint8), i % 3) for i in range(10)]
+
+    def _materialize(self, dataset, transform_config=None):
+        return dataset_cache.materialize(dataset, None, 'toy', transform_config or {"resize": 2},
+                                         root=self.root, num_workers=0, batch_size=4)
+
+    def test_serves_channels_first_samples(self):
+        cached = self._materialize(self.samples)
+        self.assertEqual(len(cached), 10)
+        sample, label = cached[7]
+        self.assertEqual(tuple(sample.shape), (1, 2, 3))
+        self.assertTrue(bool((sample == 7).all()))
+        self.assertEqual(label, 1)
+
+    def test_hit_skips_loading_the_source(self):
+        self._materialize(self.samples)
+        loads = []
+        cached = self._materialize(lambda: loads.append(1) or self.samples)
+        self.assertEqual(loads, [])
+        self.assertEqual(len(cached), 10)
+
+    def test_transform_config_is_part_of_the_key(self):
+        self._materialize(self.samples)
+        self._materialize(self.samples, {"resize": 4})
+        self.assertEqual(len(dataset_cache.entries(self.root)), 2)
+
+    def test_dataset_holds_its_entry(self):
+        cached = self._materialize(self.samples)
+        self.assertEqual(dataset_cache.evict_unused(self.root, max_bytes=0, max_idle_seconds=0), [])
+        del cached
+        self.assertEqual(len(dataset_cache.evict_unused(self.root, max_bytes=0, max_idle_seconds=0)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
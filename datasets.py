@@ -1,11 +1,27 @@
 import os
+import sys
 import json
 import shutil
+import subprocess
+from threading import Lock
 from flask import Blueprint, jsonify, request, session, render_template
 from auth import session_required
+from metadata import get_store
+from scheduler import DATASET_CACHE_ROOT
+from edgeai.engine.dataset_stats import meta_lock
 
 dataset = Blueprint('datasets', __name__, url_prefix='/datasets')
 
+# Background jobs on a dataset package, by kind
+DATASET_JOB_SCRIPTS = {
+    "stats": os.path.join('edgeai', 'engine', 'dataset_stats.py'),
+    "benchmark": os.path.join('edgeai', 'engine', 'benchmark_dataloader.py')
+}
+
+# Running dataset jobs by (kind, dataset directory)
+job_processes = {}
+jobs_lock = Lock()
+
 @dataset.route('/')
 @session_required
 def root():
@@ -55,9 +71,26 @@ def save_dataset():
         )
         os.makedirs(user_path, exist_ok=True)
 
-        # Save meta.json
-        with open(os.path.join(user_path, "meta.json"), "w") as f:
-            json.dump(data["meta"], f, indent=4)
+        # Statistics stay valid as long as the dataset code is unchanged;
+        # benchmark results are kept across edits to compare them. Locked
+        # against stats / benchmark jobs writing their results meanwhile.
+        meta_path = os.path.join(user_path, "meta.json")
+        code_path = os.path.join(user_path, "datasets.py")
+        with meta_lock(user_path):
+            if os.path.exists(meta_path) and os.path.exists(code_path):
+                with open(code_path) as f:
+                    unchanged = f.read() == data["dataset"]
+                with open(meta_path) as f:
+                    previous = json.load(f)
+                if unchanged and previous.get("stats") and "stats" not in data["meta"]:
+                    data["meta"]["stats"] = previous["stats"]
+                if previous.get("benchmarks") and "benchmarks" not in data["meta"]:
+                    data["meta"]["benchmarks"] = previous["benchmarks"]
+
+            # Save meta.json, replaced whole so readers never see it half written
+            with open(f"{meta_path}.tmp", "w") as f:
+                json.dump(data["meta"], f, indent=4)
+            os.replace(f"{meta_path}.tmp", meta_path)
 
         # Save config.yaml
         with open(os.path.join(user_path, "config.yaml"), "w") as f:
@@ -75,36 +108,11 @@ def save_dataset():
         init_content = f""" """
         with open(f"{user_path}/__init__.py", "w") as f:
             f.write(init_content)
-        # Update project.json
-        project_json_path = os.path.join(
-            '.', 'workspace', session["user"], project_name, 'project.json'
-        )
-        if os.path.exists(project_json_path):
-            with open(project_json_path, 'r') as f:
-                project_data = json.load(f)
-        else:
-            project_data = {"datasets": [], "models": [], "experiments": [], "optimizations": [], "runs": []}
-
-        existing_datasets = project_data.get("datasets", [])
-
         # Add dataset_code_path to meta
         data["meta"]["dataset_code_path"] = user_path
 
-        # Check if dataset already exists
-        dataset_exists = any(d["dataset_name"] == dataset_name for d in existing_datasets)
-        if not dataset_exists:
-            # Append new dataset
-            project_data["datasets"].append(data["meta"])
-        else:
-            # Update existing dataset
-            for idx, dataset in enumerate(existing_datasets):
-                if dataset["dataset_name"] == dataset_name:
-                    project_data["datasets"][idx] = data["meta"]
-                    break
-
-        # Save updated project.json
-        with open(project_json_path, 'w') as f:
-            json.dump(project_data, f, indent=4)
+        # Update the project store - replace the dataset if it exists, append it otherwise
+        get_store(session["user"], project_name).put("datasets", data["meta"])
 
         return jsonify({"message": "Dataset saved successfully"})
     except Exception as e:
@@ -121,15 +129,10 @@ def list_datasets():
         if not project_name:
             raise ValueError("Project name is missing.")
 
-        project_json_path = f'./workspace/{session["user"]}/{project_name}/project.json'
-        
-        # Load dataset information from project.json
-        if os.path.exists(project_json_path):
-            with open(project_json_path, 'r') as f:
-                project_data = json.load(f)
-                datasets = project_data.get("datasets", [])
-        else:
-            datasets = []
+        store = get_store(session["user"], project_name)
+
+        # Load dataset information from the project store
+        datasets = store.list("datasets") if store.exists() else []
 
         # Return the dataset metadata
         return jsonify({"datasets": datasets})
@@ -146,19 +149,8 @@ def reorder_datasets():
         if not project_name or not new_order:
             return jsonify({'error': 'Missing required parameters'})
 
-        project_json_path = f'./workspace/{session["user"]}/{project_name}/project.json'
-        
-        with open(project_json_path, 'r') as f:
-            project_data = json.load(f)
-        
-        # Create a map of dataset names to their full data
-        dataset_map = {d['dataset_name']: d for d in project_data['datasets']}
-        
         # Reorder datasets according to new_order
-        project_data['datasets'] = [dataset_map[name] for name in new_order]
-        
-        with open(project_json_path, 'w') as f:
-            json.dump(project_data, f, indent=4)
+        get_store(session["user"], project_name).reorder("datasets", new_order)
         
         return jsonify({'error': None, 'message': 'Order updated successfully'})
     
@@ -185,21 +177,12 @@ def delete_dataset():
         else:
             print(f"Dataset directory does not exist: {user_path}")
 
-        # Update project.json
-        project_json_path = os.path.join(
-            '.', 'workspace', session["user"], project_name, 'project.json'
-        )
-        if os.path.exists(project_json_path):
-            with open(project_json_path, 'r') as f:
-                project_data = json.load(f)
-            # Remove the dataset from project.json
-            project_data["datasets"] = [
-                d for d in project_data.get("datasets", []) if d["dataset_name"] != dataset_name
-            ]
-            with open(project_json_path, 'w') as f:
-                json.dump(project_data, f, indent=4)
+        # Remove the dataset from the project store
+        store = get_store(session["user"], project_name)
+        if store.exists():
+            store.delete("datasets", dataset_name)
         else:
-            print(f"project.json does not exist at: {project_json_path}")
+            print(f"Project metadata does not exist for: {project_name}")
 
         return jsonify({"message": f"Dataset '{dataset_name}' deleted successfully"})
     except Exception as e:
@@ -222,17 +205,147 @@ def delete_all_datasets():
         if os.path.exists(user_path):
             shutil.rmtree(user_path)
 
-        # Update project.json
-        project_json_path = f'./workspace/{session["user"]}/{project_name}/project.json'
-        if os.path.exists(project_json_path):
-            with open(project_json_path, 'r') as f:
-                project_data = json.load(f)
-
-            project_data["datasets"] = []
-
-            with open(project_json_path, 'w') as f:
-                json.dump(project_data, f, indent=4)
+        # Update the project store
+        store = get_store(session["user"], project_name)
+        if store.exists():
+            store.clear("datasets")
         
         return jsonify({"message": f"All datasets for project '{project_name}' deleted successfully"})
     except Exception as e:
         return jsonify({"error": str(e)})
+
+
+def dataset_dir(user, project_name, dataset_name):
+    return os.path.join('.', 'workspace', user, project_name, 'datasets', dataset_name)
+
+
+def start_job(kind, user_path, args=()):
+    """Run DATASET_JOB_SCRIPTS[kind] on a dataset package in the background, logging to <kind>.log
+
+    Returns False if that job is already running for the package.
+    """
+    if not os.path.exists(os.path.join(user_path, 'datasets.py')):
+        raise ValueError(f"Dataset '{os.path.basename(user_path)}' does not exist.")
+
+    with jobs_lock:
+        process = job_processes.get((kind, user_path))
+        if process is not None and process.poll() is None:
+            return False
+
+        # Materialized samples land in the node's cache, where runs reuse them
+        env = os.environ.copy()
+        env['EDGEAI_DATASET_CACHE'] = os.path.abspath(DATASET_CACHE_ROOT)
+        command = [sys.executable, DATASET_JOB_SCRIPTS[kind], user_path, *args]
+        with open(os.path.join(user_path, f'{kind}.log'), 'w') as log_file:
+            job_processes[(kind, user_path)] = subprocess.Popen(
+                command, stdout=log_file, stderr=subprocess.STDOUT, env=env
+            )
+    return True
+
+
+def job_status(kind, user_path):
+    """{"running", "failed", "log"} of the last job of that kind on a dataset package; log only on failure"""
+    with jobs_lock:
+        process = job_processes.get((kind, user_path))
+        running = process is not None and process.poll() is None
+        failed = process is not None and not running and process.returncode != 0
+
+    log = None
+    log_path = os.path.join(user_path, f'{kind}.log')
+    if failed and os.path.exists(log_path):
+        with open(log_path) as f:
+            log = f.read()[-4000:]
+    return {"running": running, "failed": failed, "log": log}
+
+
+def job_results(user, project_name, dataset_name, key):
+    """meta.json[key] of a dataset package, copied into the project store when it changed"""
+    user_path = dataset_dir(user, project_name, dataset_name)
+    with open(os.path.join(user_path, 'meta.json')) as f:
+        value = json.load(f).get(key)
+
+    # Keep the project store's copy of meta.json in step with the file
+    store = get_store(user, project_name)
+    if value and store.exists():
+        record = store.get("datasets", dataset_name)
+        if record is not None and record.get(key) != value:
+            store.update("datasets", dataset_name, {key: value})
+    return value
+
+
+# Compute per-channel mean/std, class histogram, image sizes and decode times in the background
+@dataset.route('/stats/start', methods=['POST'])
+@session_required
+def start_stats():
+    try:
+        project_name = request.json.get("project_name")
+        dataset_name = request.json.get("dataset_name")
+        if not project_name or not dataset_name:
+            raise ValueError("Project name or dataset name is missing.")
+
+        args = []
+        if request.json.get("max_samples"):
+            args += ['--max-samples', str(int(request.json["max_samples"]))]
+        if not start_job("stats", dataset_dir(session["user"], project_name, dataset_name), args):
+            return jsonify({"message": "Dataset statistics are already being computed"})
+        return jsonify({"message": "Dataset statistics started"})
+    except Exception as e:
+        return jsonify({"error": str(e)})
+
+
+@dataset.route('/stats', methods=['POST'])
+@session_required
+def get_stats():
+    try:
+        project_name = request.json.get("project_name")
+        dataset_name = request.json.get("dataset_name")
+        if not project_name or not dataset_name:
+            raise ValueError("Project name or dataset name is missing.")
+
+        status = job_status("stats", dataset_dir(session["user"], project_name, dataset_name))
+        stats = job_results(session["user"], project_name, dataset_name, "stats")
+        return jsonify({"stats": stats, **status})
+    except Exception as e:
+        return jsonify({"error": str(e)})
+
+
+# Measure how fast the package's Dataset, collate_fn and DataLoader settings deliver batches
+@dataset.route('/benchmark', methods=['POST'])
+@session_required
+def start_benchmark():
+    try:
+        project_name = request.json.get("project_name")
+        dataset_name = request.json.get("dataset_name")
+        if not project_name or not dataset_name:
+            raise ValueError("Project name or dataset name is missing.")
+
+        # Optional overrides of the package's config.yaml
+        args = []
+        for key in ("batch_size", "num_workers", "prefetch_factor", "num_batches"):
+            if request.json.get(key) is not None:
+                args += [f"--{key.replace('_', '-')}", str(int(request.json[key]))]
+        for key in ("pin_memory", "persistent_workers"):
+            if request.json.get(key):
+                args.append(f"--{key.replace('_', '-')}")
+
+        if not start_job("benchmark", dataset_dir(session["user"], project_name, dataset_name), args):
+            return jsonify({"message": "Dataloader benchmark is already running"})
+        return jsonify({"message": "Dataloader benchmark started"})
+    except Exception as e:
+        return jsonify({"error": str(e)})
+
+
+@dataset.route('/benchmark/results', methods=['POST'])
+@session_required
+def get_benchmarks():
+    try:
+        project_name = request.json.get("project_name")
+        dataset_name = request.json.get("dataset_name")
+        if not project_name or not dataset_name:
+            raise ValueError("Project name or dataset name is missing.")
+
+        status = job_status("benchmark", dataset_dir(session["user"], project_name, dataset_name))
+        benchmarks = job_results(session["user"], project_name, dataset_name, "benchmarks")
+        return jsonify({"benchmarks": benchmarks or [], **status})
+    except Exception as e:
+        return jsonify({"error": str(e)})
@@ -0,0 +1,201 @@
+import math
+import torch
+import torch.nn.functional as F
+from torch.utils.data import default_collate
+
+# Shared by the runs template (copied next to each run's engine.py), so it
+# only depends on torch.
+#
+# augmentation keys in config.yaml and their defaults, which follow the
+# albumentations pipeline of libs/dataloader/augment.py. true enables an
+# op with these values, a mapping overrides some of them, false/absent
+# turns it off. Unlike A.OneOf, every enabled op is drawn independently
+# per sample with its own p.
+DEFAULTS = {
+    "random_crop": {"padding": 4},
+    "horizontal_flip": {"p": 0.5},
+    "color_jitter": {"brightness": 0.2, "contrast": 0.2, "saturation": 0.2, "hue": 0.1, "p": 0.3},
+    "gauss_noise": {"var_limit": [10.0, 50.0], "p": 0.3},
+    "gaussian_blur": {"blur_limit": [3, 7], "p": 0.3},
+    "motion_blur": {"blur_limit": [3, 7], "p": 0.3}
+}
+# albumentations names that map onto the ops above
+ALIASES = {
+    "hue_saturation_value": "color_jitter",
+    "random_brightness_contrast": "color_jitter"
+}
+
+# RGB <-> YIQ, hue is a rotation of the I/Q plane
+_RGB_TO_YIQ = [[0.299, 0.587, 0.114], [0.596, -0.274, -0.322], [0.211, -0.523, 0.312]]
+_LUMA = [0.299, 0.587, 0.114]
+
+
+class BatchAugment:
+    """Random augmentation of a whole uint8 image batch (N x C x H x W) with vectorized torch ops
+
+    Every sample gets its own random parameters, but all of them are
+    applied by a handful of batched ops: a gather for crops, a where for
+    flips, per-sample factors and 3x3 color matrices for jitter, a single
+    grouped convolution with one kernel per sample for both blurs. Runs
+    on whatever device the batch is on.
+
+    Returns float images scaled to [0, 1] and normalized with mean/std
+    when given. Batches that are not uint8 are returned unchanged, as
+    they were already converted per sample.
+    """
+    def __init__(self, ops=None, mean=None, std=None):
+        self.ops = ops or {}
+        self.mean = mean
+        self.std = std
+
+    @classmethod
+    def from_config(cls, config, mean=None, std=None):
+        """Build from the augmentation section of config.yaml; normalize.mean/std there win over mean/std"""
+        config = config or {}
+        ops = {}
+        for key, value in config.items():
+            name = ALIASES.get(key, key)
+            if name not in DEFAULTS or not value:
+                continue
+            ops[name] = {**DEFAULTS[name], **(value if isinstance(value, dict) else {}), **ops.get(name, {})}
+        normalize = config.get('normalize') or {}
+        return cls(ops, normalize.get('mean', mean), normalize.get('std', std))
+
+    def __call__(self, images, training=True):
+        if images.dtype != torch.uint8:
+            return images
+        x = images.float()
+        if training and self.ops:
+            x = self.augment(x)
+        x = x / 255.
+        if self.mean is not None and self.std is not None:
+            mean = torch.tensor(self.mean, dtype=x.dtype, device=x.device).view(1, -1, 1, 1)
+            std = torch.tensor(self.std, dtype=x.dtype, device=x.device).view(1, -1, 1, 1)
+            x = (x - mean) / std
+        return x
+
+    def augment(self, x):
+        """Augment a float batch in the 0-255 range"""
+        if "random_crop" in self.ops:
+            x = self._random_crop(x, self.ops["random_crop"])
+        if "horizontal_flip" in self.ops:
+            flip = self._chosen(x, self.ops["horizontal_flip"]["p"])
+            x = torch.where(flip.view(-1, 1, 1, 1), x.flip(3), x)
+        if "color_jitter" in self.ops and x.size(1) == 3:
+            x = self._color_jitter(x, self.ops["color_jitter"])
+        if "gaussian_blur" in self.ops or "motion_blur" in self.ops:
+            x = self._blur(x)
+        if "gauss_noise" in self.ops:
+            x = self._gauss_noise(x, self.ops["gauss_noise"])
+        return x.clamp(0, 255)
+
+    @staticmethod
+    def _chosen(x, p):
+        return torch.rand(x.size(0), device=x.device) < p
+
+    @staticmethod
+    def _uniform(x, low, high):
+        return torch.empty(x.size(0), device=x.device).uniform_(low, high)
+
+    def _random_crop(self, x, params):
+        # Zero padding, then a crop of the original size at a random offset
+        n, c, h, w = x.shape
+        pad = int(params["padding"])
+        if pad <= 0:
+            return x
+        padded = F.pad(x, (pad, pad, pad, pad)).permute(0, 2, 3, 1)
+        top = torch.randint(0, 2 * pad + 1, (n,), device=x.device)
+        left = torch.randint(0, 2 * pad + 1, (n,), device=x.device)
+        rows = (top[:, None] + torch.arange(h, device=x.device))[:, :, None]
+        cols = (left[:, None] + torch.arange(w, device=x.device))[:, None, :]
+        return padded[torch.arange(n, device=x.device)[:, None, None], rows, cols].permute(0, 3, 1, 2)
+
+    def _color_jitter(self, x, params):
+        n = x.size(0)
+        chosen = self._chosen(x, params["p"]).float()
+
+        def factor(amount):
+            # 1 (identity) for samples that were not chosen
+            return 1 + chosen * self._uniform(x, -amount, amount)
+
+        brightness, contrast, saturation = factor(params["brightness"]), factor(params["contrast"]), factor(params["saturation"])
+        hue = chosen * self._uniform(x, -params["hue"], params["hue"])
+
+        x = x * brightness.view(n, 1, 1, 1)
+        luma = torch.tensor(_LUMA, device=x.device).view(1, 3, 1, 1)
+        gray = (x * luma).sum(1, keepdim=True)
+        mean = gray.mean(dim=(2, 3), keepdim=True)
+        x = (x - mean) * contrast.view(n, 1, 1, 1) + mean
+        gray = (x * luma).sum(1, keepdim=True)
+        x = gray + (x - gray) * saturation.view(n, 1, 1, 1)
+
+        # Per-sample RGB -> YIQ -> rotate -> RGB as one 3x3 matrix
+        to_yiq = torch.tensor(_RGB_TO_YIQ, device=x.device)
+        angle = hue * 2 * math.pi
+        rotation = torch.zeros(n, 3, 3, device=x.device)
+        rotation[:, 0, 0] = 1
+        rotation[:, 1, 1], rotation[:, 1, 2] = angle.cos(), -angle.sin()
+        rotation[:, 2, 1], rotation[:, 2, 2] = angle.sin(), angle.cos()
+        matrix = torch.linalg.inv(to_yiq) @ rotation @ to_yiq
+        return torch.einsum('nij,njhw->nihw', matrix, x)
+
+    def _blur(self, x):
+        """Gaussian and motion blur as one grouped convolution with a kernel per sample"""
+        n, c, h, w = x.shape
+        gaussian = self.ops.get("gaussian_blur")
+        motion = self.ops.get("motion_blur")
+        use_gaussian = self._chosen(x, gaussian["p"]) if gaussian else torch.zeros(n, dtype=torch.bool, device=x.device)
+        use_motion = self._chosen(x, motion["p"]) & ~use_gaussian if motion else torch.zeros_like(use_gaussian)
+
+        limits = [op["blur_limit"] for op in (gaussian, motion) if op]
+        size = max(int(limit[1]) for limit in limits) | 1
+        center = size // 2
+        kernels = torch.zeros(n, size, size, device=x.device)
+        kernels[:, center, center] = 1
+
+        if gaussian:
+            sizes = self._odd_sizes(x, gaussian["blur_limit"])
+            # OpenCV's sigma for a kernel size
+            sigma = 0.3 * ((sizes - 1) * 0.5 - 1) + 0.8
+            r = torch.arange(size, device=x.device).float() - center
+            g = torch.exp(-r[None] ** 2 / (2 * sigma[:, None] ** 2)) * (r[None].abs() <= sizes[:, None] // 2)
+            g = g / g.sum(1, keepdim=True)
+            kernels = torch.where(use_gaussian.view(n, 1, 1), g[:, :, None] * g[:, None, :], kernels)
+
+        if motion:
+            sizes = self._odd_sizes(x, motion["blur_limit"])
+            angle = self._uniform(x, 0, math.pi)
+            t = torch.linspace(-1, 1, 4 * size, device=x.device)[None] * (sizes[:, None] // 2)
+            xs = (t * angle.cos()[:, None]).round().long() + center
+            ys = (t * angle.sin()[:, None]).round().long() + center
+            line = torch.zeros(n, size * size, device=x.device).scatter_(1, ys * size + xs, 1.)
+            line = (line / line.sum(1, keepdim=True)).view(n, size, size)
+            kernels = torch.where(use_motion.view(n, 1, 1), line, kernels)
+
+        weight = kernels.repeat_interleave(c, dim=0).unsqueeze(1)
+        padded = F.pad(x.reshape(1, n * c, h, w), (center,) * 4, mode='reflect')
+        return F.conv2d(padded, weight, groups=n * c).view(n, c, h, w)
+
+    def _odd_sizes(self, x, limit):
+        low, high = (int(limit[0]) - 1) // 2, (int(limit[1]) - 1) // 2
+        return (torch.randint(low, high + 1, (x.size(0),), device=x.device) * 2 + 1).float()
+
+    def _gauss_noise(self, x, params):
+        chosen = self._chosen(x, params["p"]).float()
+        sigma = self._uniform(x, *params["var_limit"]).sqrt() * chosen
+        return x + torch.randn_like(x) * sigma.view(-1, 1, 1, 1)
+
+
+class AugmentingCollate:
+    """collate_fn running BatchAugment on the collated batch, in the process that collates
+
+    With num_workers=0 that is the main process; otherwise the worker
+    handles a whole batch at once instead of one sample at a time.
+    """
+    def __init__(self, augment, training=True):
+        self.augment = augment
+        self.training = training
+
+    def __call__(self, batch):
+        images, targets = default_collate(batch)
+        return self.augment(images, self.training), targets
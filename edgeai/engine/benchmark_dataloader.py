@@ -0,0 +1,211 @@
+"""Batch delivery speed of a dataset package through its collate function and DataLoader settings
+
+    python edgeai/engine/benchmark_dataloader.py workspace/<user>/<project>/datasets/<name> --num-workers 8
+
+Instantiates the package's Dataset (datasets.py), collates with its
+collate_fn.py and reads --num-batches batches the way a run would, then
+reports first-batch latency (worker start-up included), steady-state
+samples/s, per-batch wait percentiles and CPU use of the DataLoader
+workers. DataLoader settings come from the dataloader section of the
+package's config.yaml, overridden by the command line. Each result is
+appended to "benchmarks" in the package's meta.json with a digest of the
+package code, so edits can be compared.
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import importlib.util
+import yaml
+import psutil
+import numpy as np
+from torch.utils.data import DataLoader, IterableDataset, default_collate
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from dataset_stats import load_package, update_meta
+
+BENCHMARKS_KEY = 'benchmarks'
+MAX_BENCHMARKS = 20
+# Same defaults as the dataloader section of the runs config
+DEFAULTS = {
+    "batch_size": 128,
+    "num_workers": 4,
+    "prefetch_factor": 2,
+    "pin_memory": False,
+    "persistent_workers": False
+}
+PACKAGE_FILES = ('datasets.py', 'collate_fn.py', 'config.yaml')
+
+
+def load_collate_fn(directory):
+    """custom_collate_fn (or collate_fn) of the package's collate_fn.py, else default_collate"""
+    path = os.path.join(directory, 'collate_fn.py')
+    if not os.path.exists(path):
+        return default_collate
+    spec = importlib.util.spec_from_file_location('dataset_collate', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, 'custom_collate_fn', None) or getattr(module, 'collate_fn', None) or default_collate
+
+
+def package_digest(directory):
+    """sha256 of the package's code and config, to tell edits apart"""
+    hasher = hashlib.sha256()
+    for name in PACKAGE_FILES:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                hasher.update(name.encode() + b'\0' + f.read())
+    return hasher.hexdigest()
+
+
+def loader_settings(directory, overrides=None):
+    """DEFAULTS, then batch_size / dataloader from the package's config.yaml, then overrides"""
+    settings = dict(DEFAULTS)
+    path = os.path.join(directory, 'config.yaml')
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            config = yaml.safe_load(f) or {}
+        if config.get('batch_size'):
+            settings['batch_size'] = config['batch_size']
+        settings.update({k: v for k, v in (config.get('dataloader') or {}).items() if k in DEFAULTS})
+    settings.update({k: v for k, v in (overrides or {}).items() if v is not None})
+    return settings
+
+
+def _batch_size(batch):
+    while isinstance(batch, (list, tuple, dict)):
+        batch = next(iter(batch.values())) if isinstance(batch, dict) else batch[0]
+    return len(batch)
+
+
+def _cpu_seconds(process):
+    try:
+        times = process.cpu_times()
+        return times.user + times.system
+    except psutil.Error:
+        return None
+
+
+def _percentiles(seconds):
+    ms = np.array(seconds) * 1000
+    if not len(ms):
+        return {}
+    return {
+        "mean": round(float(ms.mean()), 3),
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p90": round(float(np.percentile(ms, 90)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+        "max": round(float(ms.max()), 3)
+    }
+
+
+def benchmark(dataset, collate_fn, settings, num_batches=200):
+    """Read num_batches batches and measure the DataLoader
+
+    The first batch (worker start-up and the first fetch) is reported on
+    its own; throughput, batch wait times and CPU use cover the batches
+    after it. CPU use is per worker, in percent of one core.
+    """
+    workers = int(settings['num_workers'])
+    loader = DataLoader(
+        dataset,
+        batch_size=settings['batch_size'],
+        shuffle=not isinstance(dataset, IterableDataset),
+        collate_fn=collate_fn,
+        num_workers=workers,
+        prefetch_factor=settings['prefetch_factor'] if workers > 0 else None,
+        pin_memory=bool(settings['pin_memory']),
+        persistent_workers=bool(settings['persistent_workers']) and workers > 0
+    )
+    main = psutil.Process()
+
+    start = time.perf_counter()
+    iterator = iter(loader)
+    first_batch, waits, samples = None, [], 0
+    worker_cpu, main_cpu = {}, None
+    last = start
+    for _ in range(num_batches):
+        try:
+            batch = next(iterator)
+        except StopIteration:
+            break
+        now = time.perf_counter()
+        if first_batch is None:
+            first_batch = now - start
+            steady_start = now
+            # Workers exist once the first batch is out
+            worker_cpu = {process: _cpu_seconds(process) for process in main.children()}
+            main_cpu = _cpu_seconds(main)
+        else:
+            waits.append(now - last)
+            samples += _batch_size(batch)
+        last = now
+
+    elapsed = last - steady_start if first_batch is not None else 0
+    worker_percent = []
+    for process, begin in worker_cpu.items():
+        end = _cpu_seconds(process)
+        if begin is not None and end is not None and elapsed > 0:
+            worker_percent.append(round(100 * (end - begin) / elapsed, 1))
+    main_end = _cpu_seconds(main)
+    # Shut the workers down
+    del iterator
+
+    return {
+        "settings": settings,
+        "batches": len(waits) + (first_batch is not None),
+        "first_batch_ms": round(first_batch * 1000, 1) if first_batch is not None else None,
+        "samples_per_sec": round(samples / elapsed, 1) if elapsed > 0 else None,
+        "batch_wait_ms": _percentiles(waits),
+        "worker_cpu_percent": round(sum(worker_percent) / len(worker_percent), 1) if worker_percent else None,
+        "per_worker_cpu_percent": worker_percent,
+        "main_cpu_percent": round(100 * (main_end - main_cpu) / elapsed, 1)
+        if elapsed > 0 and main_cpu is not None and main_end is not None else None
+    }
+
+
+def record_benchmark(directory, result):
+    """Append result to "benchmarks" in directory/meta.json, keeping the last MAX_BENCHMARKS"""
+    def append(meta):
+        meta[BENCHMARKS_KEY] = (meta.get(BENCHMARKS_KEY) or [])[-(MAX_BENCHMARKS - 1):] + [result]
+    update_meta(directory, append)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', help="dataset package (datasets.py, collate_fn.py, config.yaml, meta.json)")
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--num-workers', type=int, default=None)
+    parser.add_argument('--prefetch-factor', type=int, default=None)
+    parser.add_argument('--pin-memory', action='store_true', default=None)
+    parser.add_argument('--persistent-workers', action='store_true', default=None)
+    parser.add_argument('--num-batches', type=int, default=200)
+    parser.add_argument('--no-record', action='store_true', help="do not store the result in meta.json")
+    args = parser.parse_args()
+
+    settings = loader_settings(args.directory, {
+        "batch_size": args.batch_size,
+        "num_workers": args.num_workers,
+        "prefetch_factor": args.prefetch_factor,
+        "pin_memory": args.pin_memory,
+        "persistent_workers": args.persistent_workers
+    })
+    dataset = load_package(args.directory)
+    collate_fn = load_collate_fn(args.directory)
+    print(f"Benchmarking {args.directory} with {settings}")
+
+    result = {
+        **benchmark(dataset, collate_fn, settings, args.num_batches),
+        "code_digest": package_digest(args.directory),
+        "run_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    }
+    print(f"first batch {result['first_batch_ms']} ms, {result['samples_per_sec']} samples/s, "
+          f"batch wait {result['batch_wait_ms']}, worker CPU {result['worker_cpu_percent']}%")
+    if not args.no_record:
+        record_benchmark(args.directory, result)
+
+
+if __name__ == '__main__':
+    main()
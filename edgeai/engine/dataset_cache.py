@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import weakref
+import argparse
+import numpy as np
+import torch
+from torch.utils.data import Dataset, DataLoader
+
+# Shared by dataset packages and the runs template (copied next to each
+# run's engine.py), so it only depends on numpy and torch.
+#
+# Layout of one cache entry, <cache root>/<key>/:
+#   data.u8       N samples of a fixed shape, uint8, C-order
+#   targets.npy   N int64 labels
+#   meta.json     {"count", "shape", "source", "transform", "created_at"}
+# Entries are built in a temporary directory and renamed into place, so a
+# directory named <key> is always complete.
+#
+# Every process using an entry holds a shared flock on <key>.refs, so the
+# kernel keeps the reference count and drops it when a process dies.
+# Eviction takes the lock exclusively without blocking, which only
+# succeeds for entries nobody uses. The mtime of <key>.refs is the last
+# attach or detach, for LRU order and idle time.
+CACHE_ENV = 'EDGEAI_DATASET_CACHE'
+MAX_GB_ENV = 'EDGEAI_DATASET_CACHE_MAX_GB'
+IDLE_HOURS_ENV = 'EDGEAI_DATASET_CACHE_IDLE_HOURS'
+DEFAULT_CACHE_ROOT = os.path.join(os.path.expanduser('~'), '.cache', 'edgeai', 'datasets')
+DEFAULT_IDLE_HOURS = 24
+
+
+def cache_root():
+    """Cache directory; the server points EDGEAI_DATASET_CACHE at one per node, shared by all runs"""
+    return os.environ.get(CACHE_ENV) or DEFAULT_CACHE_ROOT
+
+
+def attach(directory):
+    """Take a reference on the entry at directory; it lasts until the returned file is closed"""
+    refs = open(f"{directory}.refs", 'a')
+    fcntl.flock(refs, fcntl.LOCK_SH)
+    os.utime(refs.name)
+    return refs
+
+
+def _detach(refs):
+    try:
+        os.utime(refs.name)
+    except OSError:
+        pass
+    refs.close()
+
+
+def _entry_bytes(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def entries(root=None):
+    """[{"key", "bytes", "last_used", "in_use"}] of the complete entries under root"""
+    root = root or cache_root()
+    if not os.path.isdir(root):
+        return []
+    found = []
+    for key in os.listdir(root):
+        directory = os.path.join(root, key)
+        if not os.path.isdir(directory) or '.tmp-' in key:
+            continue
+        refs_path = f"{directory}.refs"
+        with open(refs_path, 'a') as refs:
+            try:
+                fcntl.flock(refs, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                in_use = False
+            except BlockingIOError:
+                in_use = True
+        found.append({"key": key, "bytes": _entry_bytes(directory), "last_used": os.path.getmtime(refs_path),
+                      "in_use": in_use})
+    return found
+
+
+def evict_unused(root=None, max_bytes=None, max_idle_seconds=None):
+    """Remove entries no process has attached, returns the removed keys
+
+    Unused entries idle for more than max_idle_seconds go first, then the
+    least recently used unused ones until the cache fits max_bytes.
+    Defaults come from EDGEAI_DATASET_CACHE_MAX_GB (no size limit if
+    unset) and EDGEAI_DATASET_CACHE_IDLE_HOURS (24).
+    """
+    root = root or cache_root()
+    if max_bytes is None and os.environ.get(MAX_GB_ENV):
+        max_bytes = float(os.environ[MAX_GB_ENV]) * 1024 ** 3
+    if max_idle_seconds is None:
+        max_idle_seconds = float(os.environ.get(IDLE_HOURS_ENV) or DEFAULT_IDLE_HOURS) * 3600
+
+    found = sorted(entries(root), key=lambda entry: entry["last_used"])
+    total = sum(entry["bytes"] for entry in found)
+    evicted = []
+    for entry in found:
+        idle = time.time() - entry["last_used"] > max_idle_seconds
+        over_budget = max_bytes is not None and total > max_bytes
+        if entry["in_use"] or not (idle or over_budget):
+            continue
+        directory = os.path.join(root, entry["key"])
+        with open(f"{directory}.refs", 'a') as refs:
+            try:
+                fcntl.flock(refs, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Attached since entries() looked
+                continue
+            # Renamed first, so an interrupted removal never leaves a partial <key> directory
+            doomed = f"{directory}.tmp-evict-{os.getpid()}"
+            os.rename(directory, doomed)
+            shutil.rmtree(doomed, ignore_errors=True)
+        total -= entry["bytes"]
+        evicted.append(entry["key"])
+    return evicted
+
+
+def source_fingerprint(root):
+    """Cheap identity of the files under root: relative path, size and mtime of each"""
+    hasher = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            st = os.stat(path)
+            hasher.update(f"{os.path.relpath(path, root)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return hasher.hexdigest()
+
+
+def cache_key(source, transform):
+    """sha256 of the dataset source description and the deterministic transform config"""
+    description = json.dumps({"source": source, "transform": transform}, sort_keys=True, default=str)
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+class _Deterministic(Dataset):
+    """Source samples through the deterministic transform, as uint8 arrays"""
+    def __init__(self, dataset, transform):
+        self.dataset = dataset
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        sample, target = self.dataset[index]
+        if self.transform is not None:
+            sample = self.transform(sample)
+        array = np.asarray(sample, dtype=np.uint8)
+        if array.ndim == 2:
+            array = array[:, :, None]
+        return torch.from_numpy(np.ascontiguousarray(array)), int(target)
+
+
+def _build(directory, dataset, transform, meta, num_workers, batch_size):
+    tmp_dir = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        loader = DataLoader(_Deterministic(dataset, transform), batch_size=batch_size, num_workers=num_workers)
+        count = len(dataset)
+        data, targets, position = None, np.empty(count, dtype=np.int64), 0
+        for samples, labels in loader:
+            if data is None:
+                meta["shape"] = list(samples.shape[1:])
+                data = np.memmap(os.path.join(tmp_dir, 'data.u8'), dtype=np.uint8, mode='w+',
+                                 shape=(count, *meta["shape"]))
+            data[position:position + len(samples)] = samples.numpy()
+            targets[position:position + len(samples)] = labels.numpy()
+            position += len(samples)
+        if data is not None:
+            data.flush()
+            del data
+        np.save(os.path.join(tmp_dir, 'targets.npy'), targets)
+        meta.update({"count": count, "created_at": time.time()})
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        os.rename(tmp_dir, directory)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+class MemmapDataset(Dataset):
+    """Samples served from a materialized cache entry
+
+    __getitem__ returns a uint8 tensor viewing the mapped file (CHW for
+    images, no copy) and the label. transform, if given, runs per sample
+    on that tensor, e.g. random augmentation and conversion to float.
+
+    All processes mapping an entry (runs, DDP ranks, DataLoader workers)
+    share the same page cache pages, so host memory stays at one copy per
+    node. The dataset holds a reference on the entry (see attach()) from
+    construction, and each process that maps it takes its own.
+    """
+    def __init__(self, directory, transform=None, channels_first=True, refs=None):
+        self.directory = directory
+        self.transform = transform
+        self.channels_first = channels_first
+        self._attach(refs)
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        self.targets = np.load(os.path.join(directory, 'targets.npy'))
+        self._data = None
+
+    def _attach(self, refs=None):
+        self._refs = refs or attach(self.directory)
+        weakref.finalize(self, _detach, self._refs)
+
+    @property
+    def data(self):
+        # Mapped lazily so each DataLoader worker maps the file itself;
+        # copy-on-write mode gives writable tensors without copying pages
+        if self._data is None:
+            if self._refs is None:
+                self._attach()
+            self._data = np.memmap(os.path.join(self.directory, 'data.u8'), dtype=np.uint8, mode='c',
+                                   shape=(self.meta["count"], *self.meta["shape"]))
+        return self._data
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_data"] = None
+        state["_refs"] = None
+        return state
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def __getitem__(self, index):
+        sample = torch.from_numpy(self.data[index])
+        if self.channels_first and sample.dim() == 3:
+            sample = sample.permute(2, 0, 1)
+        if self.transform is not None:
+            sample = self.transform(sample)
+        return sample, int(self.targets[index])
+
+
+def materialize(dataset, transform, source, transform_config, post_transform=None, root=None,
+                num_workers=None, batch_size=256):
+    """Apply the deterministic part of a pipeline once and serve the result from a memory map
+
+    dataset yields (sample, int label), or is a callable returning such a
+    dataset, called only when the entry has to be built so a cache hit
+    skips loading the source. transform (e.g. Resize) must be
+    deterministic and give samples of one fixed shape convertible to
+    uint8. source and transform_config describe both for the cache key:
+    a changed source (see source_fingerprint()) or transform config makes
+    a new entry. The first caller builds the entry under a file lock while
+    concurrent callers (other ranks, other runs) wait and then share it.
+    Before building, unused entries are evicted per evict_unused().
+    post_transform runs per sample on the cached uint8 tensor.
+    """
+    root = root or cache_root()
+    os.makedirs(root, exist_ok=True)
+    key = cache_key(source, transform_config)
+    directory = os.path.join(root, key)
+    # Referenced before the entry is looked at, so it cannot be evicted in between
+    refs = attach(directory)
+    if not os.path.isdir(directory):
+        with open(os.path.join(root, f"{key}.lock"), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not os.path.isdir(directory):
+                evicted = evict_unused(root)
+                if evicted:
+                    print(f"Evicted unused dataset cache entries: {', '.join(evicted)}")
+                if num_workers is None:
+                    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+                    num_workers = min(8, cpus or 1)
+                if callable(dataset):
+                    dataset = dataset()
+                start_time = time.time()
+                print(f"Materializing {len(dataset)} samples into {directory}")
+                _build(directory, dataset, transform, {"source": source, "transform": transform_config},
+                       num_workers, batch_size)
+                print(f"Materialized in {time.time() - start_time:.1f}s")
+    return MemmapDataset(directory, transform=post_transform, refs=refs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List or evict materialized dataset cache entries")
+    parser.add_argument('command', choices=['list', 'evict'])
+    parser.add_argument('--root', default=None)
+    parser.add_argument('--max-gb', type=float, default=None, help="evict unused entries down to this size")
+    parser.add_argument('--idle-hours', type=float, default=None, help="evict unused entries idle this long")
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for entry in entries(args.root):
+            last_used = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry["last_used"]))
+            print(f"{entry['key'][:16]}  {entry['bytes'] / 1024 ** 2:10.1f} MB  {last_used}  "
+                  f"{'in use' if entry['in_use'] else 'unused'}")
+    else:
+        max_bytes = args.max_gb * 1024 ** 3 if args.max_gb is not None else None
+        max_idle = args.idle_hours * 3600 if args.idle_hours is not None else None
+        evicted = evict_unused(args.root, max_bytes, max_idle)
+        print(f"Evicted {len(evicted)} entries")
+
+
+if __name__ == '__main__':
+    main()
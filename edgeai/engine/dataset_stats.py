@@ -0,0 +1,330 @@
+"""Per-channel mean/std, class histogram, image sizes and decode times of a dataset package in one pass
+
+    python edgeai/engine/dataset_stats.py workspace/<user>/<project>/datasets/<name> --workers 8
+
+Samples are read once through a DataLoader; every worker folds its samples
+into a DatasetStats and the partial results are merged (Welford / Chan et
+al. for the channel moments), so nothing but the running state is kept.
+The result goes to "stats" in the package's meta.json, where
+normalization() picks it up.
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import inspect
+import argparse
+import contextlib
+import importlib.util
+from collections import Counter
+import numpy as np
+import torch
+from torch.utils.data import Dataset, IterableDataset, DataLoader
+
+# Shared by dataset packages and the runs template (copied next to each
+# run's engine.py), so it only depends on numpy and torch.
+STATS_KEY = 'stats'
+MAX_IMAGE_SIZES = 20
+# Decode-time histogram: log-spaced bins from 1 us to 100 s, about 6% wide
+DECODE_MIN_SECONDS = 1e-6
+DECODE_BINS_PER_DECADE = 40
+DECODE_DECADES = 8
+
+
+class ChannelMoments:
+    """Count, mean and sum of squared deviations per channel, mergeable"""
+    def __init__(self, channels=0):
+        self.count = 0
+        self.mean = np.zeros(channels)
+        self.m2 = np.zeros(channels)
+
+    def add(self, count, mean, m2):
+        if count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = count, np.array(mean, dtype=np.float64), np.array(m2, dtype=np.float64)
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def merge(self, other):
+        self.add(other.count, other.mean, other.m2)
+
+    def std(self):
+        return np.sqrt(self.m2 / max(self.count, 1))
+
+
+class DecodeHistogram:
+    """Count, sum, max and log-spaced fixed-bin histogram of decode times, mergeable
+
+    Memory stays constant however many samples are added; percentiles are
+    read from the bins and so are accurate to about one bin width.
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+        # Bin 0 takes everything below DECODE_MIN_SECONDS, the last bin everything above the range
+        self.bins = np.zeros(DECODE_BINS_PER_DECADE * DECODE_DECADES + 2, dtype=np.int64)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if seconds < DECODE_MIN_SECONDS:
+            index = 0
+        else:
+            index = 1 + int(np.log10(seconds / DECODE_MIN_SECONDS) * DECODE_BINS_PER_DECADE)
+        self.bins[min(index, len(self.bins) - 1)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.bins += other.bins
+
+    def percentile(self, q):
+        """Geometric middle of the bin holding the q-th percentile, capped at the largest time seen"""
+        index = int(np.searchsorted(np.cumsum(self.bins), q / 100 * self.count))
+        if index == 0:
+            return min(DECODE_MIN_SECONDS, self.max)
+        value = DECODE_MIN_SECONDS * 10 ** ((index - 0.5) / DECODE_BINS_PER_DECADE)
+        return min(value, self.max)
+
+
+def _channels(sample):
+    """(C x pixels float64 array scaled to [0, 1] for uint8 input, (height, width)) of an image sample"""
+    if isinstance(sample, torch.Tensor):
+        array = sample.numpy()
+        if array.ndim == 2:
+            array = array[None]
+    else:
+        # PIL images and numpy arrays are H x W (x C)
+        array = np.asarray(sample)
+        array = array[None] if array.ndim == 2 else array.transpose(2, 0, 1)
+    pixels = array.reshape(array.shape[0], -1).astype(np.float64)
+    if array.dtype == np.uint8:
+        pixels /= 255.
+    return pixels, array.shape[1:]
+
+
+class DatasetStats:
+    """Mergeable statistics of a stream of (image, label) samples"""
+    def __init__(self):
+        self.moments = ChannelMoments()
+        self.classes = Counter()
+        self.sizes = Counter()
+        self.decode = DecodeHistogram()
+
+    def update(self, sample, target, seconds):
+        pixels, size = _channels(sample)
+        mean = pixels.mean(1)
+        self.moments.add(pixels.shape[1], mean, ((pixels - mean[:, None]) ** 2).sum(1))
+        self.sizes[f"{size[0]}x{size[1]}"] += 1
+        if isinstance(target, torch.Tensor) and target.numel() == 1:
+            target = target.item()
+        if isinstance(target, (int, np.integer)):
+            self.classes[int(target)] += 1
+        self.decode.add(seconds)
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.classes.update(other.classes)
+        self.sizes.update(other.sizes)
+        self.decode.merge(other.decode)
+        return self
+
+    def to_dict(self):
+        decode = self.decode
+        sizes = self.sizes.most_common(MAX_IMAGE_SIZES)
+        other_sizes = sum(self.sizes.values()) - sum(count for _, count in sizes)
+        return {
+            "samples": decode.count,
+            "mean": [round(float(v), 6) for v in self.moments.mean],
+            "std": [round(float(v), 6) for v in self.moments.std()],
+            "class_histogram": {str(label): count for label, count in sorted(self.classes.items())},
+            "image_sizes": {**dict(sizes), **({"other": other_sizes} if other_sizes else {})},
+            "decode_ms": {
+                "mean": round(decode.total / decode.count * 1000, 3),
+                "p50": round(decode.percentile(50) * 1000, 3),
+                "p90": round(decode.percentile(90) * 1000, 3),
+                "p99": round(decode.percentile(99) * 1000, 3),
+                "max": round(decode.max * 1000, 3)
+            } if decode.count else {}
+        }
+
+
+def _timed(dataset, index):
+    start = time.perf_counter()
+    sample, target = dataset[index]
+    return sample, target, time.perf_counter() - start
+
+
+class _Samples(Dataset):
+    """Map-style dataset yielding one-sample DatasetStats, computed in the worker"""
+    def __init__(self, dataset, indices):
+        self.dataset = dataset
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        stats = DatasetStats()
+        stats.update(*_timed(self.dataset, self.indices[index]))
+        return stats
+
+
+class _Stream(IterableDataset):
+    """Iterable dataset yielding one-sample DatasetStats; the dataset splits itself across workers"""
+    def __init__(self, dataset, max_samples=None):
+        self.dataset = dataset
+        self.max_samples = max_samples
+
+    def __iter__(self):
+        iterator = iter(self.dataset)
+        produced = 0
+        while self.max_samples is None or produced < self.max_samples:
+            start = time.perf_counter()
+            try:
+                sample, target = next(iterator)
+            except StopIteration:
+                return
+            stats = DatasetStats()
+            stats.update(sample, target, time.perf_counter() - start)
+            produced += 1
+            yield stats
+
+
+def _merge_all(batch):
+    # collate_fn: one DatasetStats per chunk leaves the worker
+    merged = DatasetStats()
+    for stats in batch:
+        merged.merge(stats)
+    return merged
+
+
+def compute_stats(dataset, num_workers=None, chunk_size=256, max_samples=None, seed=0):
+    """Stream dataset once and return its statistics as a dict
+
+    dataset yields (image, label) with images as tensors (C x H x W),
+    PIL images or arrays (H x W x C); uint8 images are scaled to [0, 1]
+    so mean/std fit Normalize and BatchAugment. max_samples limits the
+    pass to a random subset. Iterable datasets read with several workers
+    must split themselves across workers, as shards.ShardedDataset does.
+    """
+    if num_workers is None:
+        cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+        num_workers = min(8, cpus or 1)
+    if isinstance(dataset, IterableDataset):
+        # Each worker stops after its share of max_samples
+        share = None if max_samples is None else -(-max_samples // max(num_workers, 1))
+        source = _Stream(dataset, share)
+    else:
+        indices = np.arange(len(dataset))
+        if max_samples is not None and max_samples < len(indices):
+            indices = np.sort(np.random.default_rng(seed).choice(indices, max_samples, replace=False))
+        source = _Samples(dataset, indices)
+
+    start_time = time.time()
+    loader = DataLoader(source, batch_size=chunk_size, num_workers=num_workers, collate_fn=_merge_all)
+    stats = DatasetStats()
+    for partial in loader:
+        stats.merge(partial)
+    return {
+        **stats.to_dict(),
+        "elapsed_sec": round(time.time() - start_time, 1),
+        "computed_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    }
+
+
+@contextlib.contextmanager
+def meta_lock(directory):
+    """Exclusive lock (directory/meta.json.lock) around a read-modify-write of directory/meta.json
+
+    Statistics, benchmark jobs and saves from the server all rewrite the
+    whole file; without the lock one of them can drop the others' keys.
+    """
+    with open(os.path.join(directory, 'meta.json.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def update_meta(directory, update):
+    """Apply update(meta) to directory/meta.json under meta_lock, replacing the file atomically"""
+    meta_path = os.path.join(directory, 'meta.json')
+    with meta_lock(directory):
+        meta = {}
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+        update(meta)
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f, indent=4)
+        os.replace(tmp_path, meta_path)
+
+
+def write_stats(directory, stats):
+    """Store stats under "stats" in directory/meta.json"""
+    update_meta(directory, lambda meta: meta.update({STATS_KEY: stats}))
+
+
+def load_stats(directory):
+    """The "stats" of directory/meta.json, or None"""
+    try:
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            return json.load(f).get(STATS_KEY)
+    except (OSError, ValueError):
+        return None
+
+
+def normalization(directory, mean=None, std=None):
+    """(mean, std) measured for the dataset package in directory, else the given defaults"""
+    stats = load_stats(directory)
+    if not stats or not stats.get("mean") or not stats.get("std"):
+        return mean, std
+    if mean is not None and len(stats["mean"]) != len(mean):
+        return mean, std
+    return tuple(stats["mean"]), tuple(stats["std"])
+
+
+def load_package(directory):
+    """Import datasets.py of a dataset package and instantiate its Dataset
+
+    Like the runs template, asks for the package's uint8 cache if it has
+    one, so statistics and benchmarks see the samples runs train on.
+    """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.path.abspath(directory))
+    spec = importlib.util.spec_from_file_location('dataset_package', os.path.join(directory, 'datasets.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    cache = {'cache': True} if 'cache' in inspect.signature(module.Dataset).parameters else {}
+    return module.Dataset(**cache)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', help="dataset package (datasets.py, meta.json)")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--max-samples', type=int, default=None)
+    args = parser.parse_args()
+
+    dataset = load_package(args.directory)
+    print(f"Computing statistics of {args.directory}")
+    stats = compute_stats(dataset, args.workers, args.chunk_size, args.max_samples)
+    write_stats(args.directory, stats)
+    print(f"{stats['samples']} samples in {stats['elapsed_sec']}s: mean {stats['mean']}, std {stats['std']}")
+
+
+if __name__ == '__main__':
+    main()
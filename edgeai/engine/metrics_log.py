@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import atexit
+import threading
+
+# Layout inside a job/run directory:
+#   metrics/values-000001.jsonl  append-only segments, one record per line
+#   progress.json                small snapshot, replaced atomically
+#
+# A record is [timestamp, {key: [index, value], ...}] where index is the
+# 1-based position of the point in that key's series, so merged records
+# give the same {key: [[index, value], ...]} shape values.json used to hold.
+METRICS_DIR = 'metrics'
+SEGMENT_PREFIX = 'values-'
+SEGMENT_SUFFIX = '.jsonl'
+
+
+def _segment_name(number):
+    return f"{SEGMENT_PREFIX}{number:06d}{SEGMENT_SUFFIX}"
+
+
+def _list_segments(job_dir):
+    """Sorted (number, path) of the job's metric segments"""
+    metrics_dir = os.path.join(job_dir, METRICS_DIR)
+    if not os.path.isdir(metrics_dir):
+        return []
+    segments = []
+    for name in os.listdir(metrics_dir):
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+            try:
+                number = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            except ValueError:
+                continue
+            segments.append((number, os.path.join(metrics_dir, name)))
+    return sorted(segments)
+
+
+def write_json_atomic(path, data):
+    """Replace a JSON file in one step so readers never see it half-written"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class MetricsWriter:
+    """Buffered, append-only metrics sink
+
+    add() and update_progress() only touch memory. A background thread
+    appends buffered records to the current segment every flush_interval
+    seconds, or as soon as flush_bytes are pending, and rewrites the
+    progress.json snapshot when it changed. Segments roll over at
+    segment_bytes. close() flushes everything; it also runs at exit.
+    """
+    def __init__(self, job_dir, flush_interval=2.0, flush_bytes=64 * 1024, segment_bytes=8 * 1024 * 1024):
+        self.job_dir = job_dir
+        self.metrics_dir = os.path.join(job_dir, METRICS_DIR)
+        self.progress_path = os.path.join(job_dir, 'progress.json')
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.segment_bytes = segment_bytes
+        os.makedirs(self.metrics_dir, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.io_lock = threading.Lock()
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.counts = {}
+        self.progress = {}
+        self.progress_dirty = False
+
+        # Continue an existing series (e.g. a resumed run)
+        segments = _list_segments(job_dir)
+        self.segment = segments[-1][0] if segments else 1
+        for _, path in segments:
+            for _, points in _read_records(path)[0]:
+                for key, (index, _) in points.items():
+                    self.counts[key] = max(self.counts.get(key, 0), index)
+        if os.path.exists(self.progress_path):
+            try:
+                with open(self.progress_path, 'r') as f:
+                    self.progress = json.load(f)
+            except ValueError:
+                pass
+
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def add(self, updates):
+        """Append one point to each series in updates"""
+        with self.lock:
+            points = {}
+            for key, value in updates.items():
+                self.counts[key] = self.counts.get(key, 0) + 1
+                points[key] = [self.counts[key], value]
+            line = json.dumps([round(time.time(), 3), points], separators=(',', ':')) + '\n'
+            self.buffer.append(line)
+            self.buffered_bytes += len(line)
+            full = self.buffered_bytes >= self.flush_bytes
+        if full:
+            self.wakeup.set()
+
+    def update_progress(self, updates):
+        with self.lock:
+            self.progress.update(updates)
+            self.progress_dirty = True
+
+    def flush(self):
+        with self.io_lock:
+            with self.lock:
+                lines, self.buffer, self.buffered_bytes = self.buffer, [], 0
+                progress = dict(self.progress) if self.progress_dirty else None
+                self.progress_dirty = False
+
+            if lines:
+                path = os.path.join(self.metrics_dir, _segment_name(self.segment))
+                if os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes:
+                    self.segment += 1
+                    path = os.path.join(self.metrics_dir, _segment_name(self.segment))
+                # Whole lines in one write; readers skip an unterminated last line
+                with open(path, 'a') as f:
+                    f.write(''.join(lines))
+            if progress is not None:
+                write_json_atomic(self.progress_path, progress)
+
+    def _loop(self):
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Metrics flush failed: {e}")
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        self.thread.join(timeout=5)
+        self.flush()
+
+
+def _read_records(path, offset=0):
+    """Records of the complete lines in a segment from byte offset on, and the offset after them
+
+    An unterminated last line is a record still being written; it is read
+    by the next call.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    records = [json.loads(line) for line in data[:end].splitlines() if line]
+    return records, offset + end
+
+
+def read_values(job_dir, since=None):
+    """Metric series of a job, optionally only what was appended after a cursor
+
+    since is the cursor returned by a previous call ("segment:offset").
+    Returns (values, cursor) where values is {key: [[index, value], ...]}.
+    Jobs written before the segment format fall back to values.json, with
+    cursor None.
+    """
+    segments = _list_segments(job_dir)
+    if not segments:
+        values_path = os.path.join(job_dir, 'values.json')
+        if not os.path.exists(values_path):
+            return {}, None
+        with open(values_path, 'r') as f:
+            return json.load(f), None
+
+    start_segment, start_offset = segments[0][0], 0
+    if since:
+        start_segment, start_offset = (int(part) for part in str(since).split(':'))
+
+    values = {}
+    cursor = f"{start_segment}:{start_offset}"
+    for number, path in segments:
+        if number < start_segment:
+            continue
+        records, end = _read_records(path, start_offset if number == start_segment else 0)
+        for _, points in records:
+            for key, point in points.items():
+                values.setdefault(key, []).append(point)
+        cursor = f"{number}:{end}"
+    return values, cursor
+
+
+def read_progress(job_dir):
+    with open(os.path.join(job_dir, 'progress.json'), 'r') as f:
+        return json.load(f)
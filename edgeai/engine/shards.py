@@ -0,0 +1,386 @@
+"""Sharded dataset format for datasets larger than host memory
+
+    python edgeai/engine/shards.py convert --image-folder /data/train /data/train-shards
+    python edgeai/engine/shards.py convert --numpy images.npy labels.npy /data/train-shards
+
+A sharded dataset is a directory of packed record files read front to
+back, so training streams at disk bandwidth instead of seeking per sample:
+
+    index.json          {"version", "encoding", "shape", "classes", "count", "shards": [...]}
+    shard-000000.bin    records back to back
+    shard-000000.idx    int64 (offset, length, label) per record
+
+encoding is "image" (encoded JPEG/PNG bytes as found in the source, decoded
+on read) or "raw" (uint8 arrays of one fixed shape). Read it with
+ShardedDataset, an IterableDataset, e.g. from a dataset package:
+
+    from shards import ShardedDataset
+    class Dataset(ShardedDataset):
+        def __init__(self):
+            super().__init__('/data/train-shards')
+"""
+import io
+import os
+import copy
+import json
+import queue
+import random
+import argparse
+import threading
+import multiprocessing
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+
+FORMAT_VERSION = 1
+INDEX_FILE = 'index.json'
+DEFAULT_SHARD_BYTES = 256 * 1024 * 1024
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+
+
+def _shard_name(number):
+    return f"shard-{number:06d}"
+
+
+class ShardWriter:
+    """Appends records to shard files of about shard_bytes each, then writes index.json on close()"""
+    def __init__(self, out_dir, encoding, shape=None, classes=None, shard_bytes=DEFAULT_SHARD_BYTES):
+        if encoding not in ('image', 'raw'):
+            raise ValueError(f"Unknown encoding '{encoding}', expected 'image' or 'raw'")
+        self.out_dir = out_dir
+        self.encoding = encoding
+        self.shape = list(shape) if shape is not None else None
+        self.classes = classes
+        self.shard_bytes = shard_bytes
+        self.shards = []
+        self.data_file = None
+        self.entries = []
+        os.makedirs(out_dir, exist_ok=True)
+
+    def _open_shard(self):
+        name = _shard_name(len(self.shards))
+        self.shards.append({"name": name, "count": 0, "bytes": 0})
+        self.data_file = open(os.path.join(self.out_dir, f"{name}.bin"), 'wb')
+        self.entries = []
+
+    def _close_shard(self):
+        if self.data_file is None:
+            return
+        self.data_file.close()
+        name = self.shards[-1]["name"]
+        np.array(self.entries, dtype=np.int64).reshape(-1, 3).tofile(os.path.join(self.out_dir, f"{name}.idx"))
+        self.data_file = None
+
+    def write(self, record, label):
+        if self.data_file is None or self.shards[-1]["bytes"] >= self.shard_bytes:
+            self._close_shard()
+            self._open_shard()
+        shard = self.shards[-1]
+        self.entries.append((shard["bytes"], len(record), int(label)))
+        self.data_file.write(record)
+        shard["bytes"] += len(record)
+        shard["count"] += 1
+
+    def close(self):
+        self._close_shard()
+        index = {
+            "version": FORMAT_VERSION,
+            "encoding": self.encoding,
+            "shape": self.shape,
+            "classes": self.classes,
+            "count": sum(shard["count"] for shard in self.shards),
+            "shards": self.shards
+        }
+        # Written last: a directory with index.json is a complete dataset
+        with open(os.path.join(self.out_dir, INDEX_FILE), 'w') as f:
+            json.dump(index, f, indent=2)
+        return index
+
+
+def from_image_folder(root, out_dir, shard_bytes=DEFAULT_SHARD_BYTES, seed=0):
+    """Convert an ImageFolder tree (root/<class>/<image>) to shards, keeping the encoded bytes
+
+    Files are written in a shuffled order, so every shard holds a mix of
+    classes and shard-level shuffling is enough at training time.
+    """
+    classes = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    files = []
+    for label, class_name in enumerate(classes):
+        for dirpath, _, filenames in os.walk(os.path.join(root, class_name)):
+            files.extend((os.path.join(dirpath, name), label) for name in sorted(filenames)
+                         if name.lower().endswith(IMAGE_EXTENSIONS))
+    random.Random(seed).shuffle(files)
+
+    writer = ShardWriter(out_dir, 'image', classes=classes, shard_bytes=shard_bytes)
+    for path, label in files:
+        with open(path, 'rb') as f:
+            writer.write(f.read(), label)
+    return writer.close()
+
+
+def from_numpy(data, targets, out_dir, shard_bytes=DEFAULT_SHARD_BYTES, seed=0, classes=None):
+    """Convert an N x ... uint8 array (e.g. N x H x W x C images) and N labels to raw shards"""
+    data = np.asarray(data)
+    if data.dtype != np.uint8:
+        raise ValueError(f"Raw shards hold uint8 samples, got {data.dtype}")
+    order = np.random.default_rng(seed).permutation(len(data))
+    writer = ShardWriter(out_dir, 'raw', shape=data.shape[1:], classes=classes, shard_bytes=shard_bytes)
+    for i in order:
+        writer.write(np.ascontiguousarray(data[i]).tobytes(), targets[i])
+    return writer.close()
+
+
+def decode_image(record):
+    """Encoded image bytes to a uint8 CHW tensor"""
+    from PIL import Image
+    with Image.open(io.BytesIO(record)) as image:
+        array = np.asarray(image.convert('RGB'))
+    return torch.from_numpy(array.copy()).permute(2, 0, 1)
+
+
+class ShardedDataset(IterableDataset):
+    """Streams a sharded dataset sequentially, shard by shard
+
+    Shards are shuffled per epoch (seed + epoch) and dealt out to the
+    readers, every DataLoader worker of every DDP rank, so each reads whole
+    shards front to back. Shards left over when they do not divide evenly
+    (all of them when there are fewer shards than readers) are split into
+    one contiguous record range per reader instead; every record is read
+    by exactly one reader. A shuffle buffer of shuffle_buffer samples
+    mixes records across the shards a worker reads, and a background
+    thread reads the next prefetch_shards parts while the current one is
+    decoded.
+
+    Every rank yields len(self) samples per epoch, so DDP ranks always run
+    the same number of steps. That quota is split over the rank's workers
+    by how many records each reads; a rank holding a few records more or
+    less than its quota drops or repeats them, which changes with the
+    shard order every epoch. Samples are uint8 CHW tensors (image) or
+    arrays of the stored shape (raw) before transform.
+
+    set_epoch() and skip mirror the runs template's ResumableSampler. Both
+    live in shared memory so persistent DataLoader workers, which hold
+    their own copy of the dataset, see them; skip applies to the epoch it
+    was set in and is split over the workers like the quota. Use
+    evaluation_copy() for validation.
+    """
+    def __init__(self, root, shuffle=True, seed=42, shuffle_buffer=1024, prefetch_shards=2, transform=None,
+                 decode=None):
+        self.root = root
+        with open(os.path.join(root, INDEX_FILE), 'r') as f:
+            self.index = json.load(f)
+        if self.index.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported shard format version {self.index.get('version')} in {root}")
+        self.classes = self.index.get("classes")
+        self.shuffle = shuffle
+        self.seed = seed
+        self.shuffle_buffer = shuffle_buffer
+        self.prefetch_shards = prefetch_shards
+        self.transform = transform
+        self.decode = decode or (decode_image if self.index["encoding"] == 'image' else self._decode_raw)
+        # epoch, epoch of skip, skip
+        self._position = multiprocessing.RawArray('q', [0, -1, 0])
+        self.num_replicas = 1
+        self.rank = 0
+
+    def set_distributed(self, num_replicas, rank):
+        self.num_replicas = num_replicas
+        self.rank = rank
+
+    def set_epoch(self, epoch):
+        self._position[0] = epoch
+
+    def evaluation_copy(self):
+        """Unshuffled copy with its own epoch and skip, e.g. for validation"""
+        dataset = copy.copy(self)
+        dataset.shuffle = False
+        dataset._position = multiprocessing.RawArray('q', [0, -1, 0])
+        return dataset
+
+    @property
+    def epoch(self):
+        return self._position[0]
+
+    @property
+    def skip(self):
+        return self._position[2] if self._position[1] == self._position[0] else 0
+
+    @skip.setter
+    def skip(self, samples):
+        self._position[1], self._position[2] = self._position[0], samples
+
+    def __len__(self):
+        # Per rank
+        return self.index["count"] // self.num_replicas
+
+    def _decode_raw(self, record):
+        return torch.from_numpy(np.frombuffer(bytearray(record), dtype=np.uint8).reshape(self.index["shape"]))
+
+    def _read_shard(self, part):
+        """Bytes and (offset, length, label) entries of one part (shard, index, parts) of a shard"""
+        shard, index, parts = part
+        path = os.path.join(self.root, shard["name"])
+        entries = np.fromfile(f"{path}.idx", dtype=np.int64).reshape(-1, 3)
+        entries = entries[len(entries) * index // parts:len(entries) * (index + 1) // parts].copy()
+        if not len(entries):
+            return b'', entries
+        # Records are stored back to back, so a part is one contiguous read
+        start, end = entries[0, 0], entries[-1, 0] + entries[-1, 1]
+        with open(f"{path}.bin", 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        entries[:, 0] -= start
+        return data, entries
+
+    def _prefetched(self, parts):
+        """Yield (data, entries) of each part, read ahead on a background thread"""
+        loaded = queue.Queue(maxsize=max(1, self.prefetch_shards))
+        stop = threading.Event()
+
+        def reader():
+            try:
+                for part in parts:
+                    if stop.is_set():
+                        return
+                    loaded.put(self._read_shard(part))
+            except Exception as e:
+                loaded.put(e)
+                return
+            loaded.put(None)
+
+        thread = threading.Thread(target=reader, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = loaded.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            # Unblock the reader if it waits on a full queue
+            while thread.is_alive():
+                try:
+                    loaded.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    def _records(self, parts, rng):
+        """Records of the parts, in order or shuffled within each part"""
+        for data, entries in self._prefetched(parts):
+            order = np.arange(len(entries))
+            if self.shuffle:
+                rng.shuffle(order)
+            for i in order:
+                start, length, label = entries[i]
+                yield data[start:start + length], int(label)
+
+    @staticmethod
+    def _parts(shards, readers, reader):
+        """(shard, index, parts) read by one of readers: whole shards dealt round-robin, then its
+        contiguous record range of each shard left over"""
+        whole = len(shards) // readers * readers
+        return [(shard, 0, 1) for shard in shards[reader:whole:readers]] + \
+               [(shard, reader, readers) for shard in shards[whole:]]
+
+    @staticmethod
+    def _part_count(part):
+        shard, index, parts = part
+        return shard["count"] * (index + 1) // parts - shard["count"] * index // parts
+
+    @staticmethod
+    def _quotas(per_rank, counts):
+        """per_rank samples split over workers by the records each reads (counts); the
+        remainder goes to the workers with the most records"""
+        rank_count = sum(counts)
+        if rank_count:
+            quotas = [per_rank * count // rank_count for count in counts]
+        else:
+            quotas = [per_rank // len(counts)] * len(counts)
+        largest = sorted(range(len(counts)), key=lambda w: -counts[w])
+        for i in range(per_rank - sum(quotas)):
+            quotas[largest[i % len(counts)]] += 1
+        return quotas
+
+    def __iter__(self):
+        worker = get_worker_info()
+        num_workers, worker_id = (worker.num_workers, worker.id) if worker is not None else (1, 0)
+        epoch = self.epoch
+        rng = np.random.default_rng(self.seed + epoch * 1000003 + self.rank * 1009 + worker_id)
+
+        shards = list(self.index["shards"])
+        if self.shuffle:
+            np.random.default_rng(self.seed + epoch).shuffle(shards)
+        readers = self.num_replicas * num_workers
+        first = self.rank * num_workers
+        counts = [sum(self._part_count(part) for part in self._parts(shards, readers, first + w))
+                  for w in range(num_workers)]
+        parts = self._parts(shards, readers, first + worker_id)
+
+        per_rank = len(self)
+        quota = self._quotas(per_rank, counts)[worker_id]
+        skip = self.skip * quota // per_rank if per_rank else 0
+
+        def stream():
+            # Wrap around when the worker's records are fewer than its quota
+            while True:
+                produced = False
+                for record in self._records(parts, rng):
+                    produced = True
+                    yield record
+                if not produced:
+                    return
+
+        buffer = []
+        emitted = 0
+        for record, label in stream():
+            if emitted >= quota:
+                break
+            if self.shuffle and self.shuffle_buffer > 1:
+                buffer.append((record, label))
+                if len(buffer) < self.shuffle_buffer:
+                    continue
+                record, label = buffer.pop(rng.integers(len(buffer)))
+            emitted += 1
+            if emitted <= skip:
+                continue
+            yield self._sample(record, label)
+        # Drain the buffer up to the quota
+        while buffer and emitted < quota:
+            record, label = buffer.pop(rng.integers(len(buffer)))
+            emitted += 1
+            if emitted > skip:
+                yield self._sample(record, label)
+
+    def _sample(self, record, label):
+        sample = self.decode(record)
+        if self.transform is not None:
+            sample = self.transform(sample)
+        return sample, label
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    convert = subparsers.add_parser('convert')
+    source = convert.add_mutually_exclusive_group(required=True)
+    source.add_argument('--image-folder', metavar='ROOT', help="root/<class>/<image> tree")
+    source.add_argument('--numpy', nargs=2, metavar=('DATA', 'TARGETS'), help=".npy files of uint8 samples and labels")
+    convert.add_argument('out_dir')
+    convert.add_argument('--shard-mb', type=int, default=DEFAULT_SHARD_BYTES // (1024 * 1024))
+    convert.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    shard_bytes = args.shard_mb * 1024 * 1024
+    if args.image_folder:
+        index = from_image_folder(args.image_folder, args.out_dir, shard_bytes, args.seed)
+    else:
+        data = np.load(args.numpy[0], mmap_mode='r')
+        index = from_numpy(data, np.load(args.numpy[1]), args.out_dir, shard_bytes, args.seed)
+    print(f"Wrote {index['count']} samples in {len(index['shards'])} shards to {args.out_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import torch
+import torch.distributed as dist
+
+# Shared by edgeai/engine/train.py and the runs template (copied next to
+# each run's engine.py), so it only depends on torch.
+
+
+def _all_reduce(tensor):
+    """Sum a tensor over all ranks (no-op outside torch.distributed)"""
+    if not (dist.is_available() and dist.is_initialized()):
+        return tensor
+    # gloo's CUDA support is partial; a CPU round trip once per epoch is cheap
+    if dist.get_backend() == 'gloo' and tensor.is_cuda:
+        reduced = tensor.cpu()
+        dist.all_reduce(reduced)
+        return reduced.to(tensor.device)
+    tensor = tensor.clone()
+    dist.all_reduce(tensor)
+    return tensor
+
+
+class RunningMean:
+    """Weighted mean kept as a device-resident sum and a host-side weight, O(1) per update"""
+    def __init__(self, device):
+        self.device = device
+        self.reset()
+
+    def reset(self):
+        self.total = torch.zeros((), dtype=torch.float64, device=self.device)
+        self.weight = 0.0
+
+    def update(self, value, weight=1):
+        # Weights are host numbers (batch sizes), so this never syncs
+        self.total += value.detach().double() * weight
+        self.weight += weight
+
+    def mean(self):
+        """The current mean as a device tensor, without a host sync"""
+        return self.total / max(self.weight, 1)
+
+    def compute(self, sync=False):
+        if sync:
+            state = _all_reduce(torch.stack([self.total, torch.tensor(self.weight, dtype=torch.float64, device=self.device)]))
+            total, weight = state.tolist()
+        else:
+            total, weight = self.total.item(), self.weight
+        return total / weight if weight else 0.0
+
+
+class ConfusionMatrix:
+    """num_classes x num_classes counts (rows: target, columns: prediction) built with bincount on the device"""
+    def __init__(self, num_classes, device):
+        self.num_classes = num_classes
+        self.device = device
+        self.reset()
+
+    def reset(self):
+        self.matrix = torch.zeros(self.num_classes * self.num_classes, dtype=torch.int64, device=self.device)
+
+    def update(self, predictions, targets):
+        index = targets.reshape(-1).long() * self.num_classes + predictions.reshape(-1).long()
+        self.matrix += torch.bincount(index, minlength=self.num_classes * self.num_classes)
+
+    def compute(self, sync=False):
+        matrix = _all_reduce(self.matrix) if sync else self.matrix
+        return matrix.view(self.num_classes, self.num_classes)
+
+
+class StreamingMetrics:
+    """Loss, accuracy and per-class metrics accumulated on the device
+
+    update() queues tensor ops only; nothing reaches the host or other
+    ranks until compute(). Pass sync=True at epoch end to reduce across
+    ranks first (one collective per state tensor); without it the values
+    are this rank's own, e.g. for progress lines.
+
+    Accuracy and the confusion matrix are tracked for classification
+    outputs (N x C scores with integer targets). num_classes defaults to C
+    of the first batch; per-class metrics need num_classes <= max_classes.
+    """
+    def __init__(self, device, num_classes=None, max_classes=1000):
+        self.device = device
+        self.num_classes = num_classes
+        self.max_classes = max_classes
+        self.loss = RunningMean(device)
+        self.confusion = None
+        self.reset()
+
+    def reset(self):
+        self.loss.reset()
+        self.correct = torch.zeros((), dtype=torch.int64, device=self.device)
+        self.total = 0
+        if self.confusion is not None:
+            self.confusion.reset()
+
+    def update(self, loss, outputs, targets):
+        batch_size = targets.size(0)
+        self.loss.update(loss, batch_size)
+        if outputs.dim() != 2 or targets.dim() != 1 or targets.is_floating_point():
+            return
+        predictions = outputs.detach().argmax(1)
+        self.correct += predictions.eq(targets).sum()
+        # Batch sizes are known on the host, no sync needed
+        self.total += batch_size
+
+        if self.confusion is None:
+            num_classes = self.num_classes or outputs.size(1)
+            if num_classes <= self.max_classes:
+                self.confusion = ConfusionMatrix(num_classes, self.device)
+        if self.confusion is not None:
+            self.confusion.update(predictions, targets)
+
+    def compute(self, sync=False, per_class=False):
+        """{"loss", "accuracy"} (accuracy as a fraction), plus per-class
+        precision, recall, F1 and the confusion matrix if per_class is set"""
+        results = {"loss": self.loss.compute(sync)}
+        if sync:
+            counts = _all_reduce(torch.stack([self.correct, torch.tensor(self.total, device=self.device)]))
+            correct, total = counts.tolist()
+        else:
+            correct, total = self.correct.item(), self.total
+        results["accuracy"] = correct / total if total else 0.0
+
+        if per_class and self.confusion is not None:
+            matrix = self.confusion.compute(sync).double()
+            true_positives = matrix.diagonal()
+            precision = true_positives / matrix.sum(0).clamp(min=1)
+            recall = true_positives / matrix.sum(1).clamp(min=1)
+            f1 = 2 * precision * recall / (precision + recall).clamp(min=1e-12)
+            results.update({
+                "per_class_precision": precision.tolist(),
+                "per_class_recall": recall.tolist(),
+                "per_class_f1": f1.tolist(),
+                "confusion_matrix": matrix.long().tolist()
+            })
+        return results
@@ -1,12 +1,27 @@
 import os
 import json
+import math
 import time
+import functools
 import torch
 from torch.utils.data import DataLoader
 import logging
 
+try:
+    from edgeai.engine.metrics_log import MetricsWriter, write_json_atomic
+    from edgeai.engine.streaming_metrics import StreamingMetrics
+except ImportError:
+    # Imported with edgeai/engine itself on sys.path
+    from metrics_log import MetricsWriter, write_json_atomic
+    from streaming_metrics import StreamingMetrics
+
 class JSONLogging:
-    """Handles logging for GUI updates"""
+    """Handles logging for GUI updates
+
+    Values are appended to metrics/values-*.jsonl segments and progress is
+    kept in memory; a background thread flushes both (see MetricsWriter),
+    so logging does not grow more expensive as the run gets longer.
+    """
     def __init__(self, working_path):
         self.working_path = working_path
         self.paths = {
@@ -15,30 +30,89 @@ class JSONLogging:
             "progress": os.path.join(self.working_path, "progress.json"),
             "values": os.path.join(self.working_path, "values.json")
         }
+        self.writer = MetricsWriter(working_path)
 
     def update(self, target, updates):
         """Update progress or meta information"""
-        with open(self.paths[target], "r") as f:
-            struct = json.load(f)
-        
+        if target == "progress":
+            self.writer.update_progress(updates)
+            return
+
+        struct = {}
+        if os.path.exists(self.paths[target]):
+            with open(self.paths[target], "r") as f:
+                struct = json.load(f)
+
         for key, value in updates.items():
             struct[key] = value
 
-        with open(self.paths[target], "w") as f:
-            json.dump(struct, f)
+        write_json_atomic(self.paths[target], struct)
 
     def add(self, target, updates):
         """Add new values (e.g., loss, accuracy) to tracking"""
+        if target != "values":
+            raise ValueError(f"Unknown series target: {target}")
+        self.writer.add(updates)
+
+    def read(self, target):
+        """Current content of meta or progress, {} if not written yet"""
+        if not os.path.exists(self.paths[target]):
+            return {}
         with open(self.paths[target], "r") as f:
-            struct = json.load(f)
+            return json.load(f)
 
-        for key, value in updates.items():
-            if key not in struct:
-                struct[key] = []
-            struct[key].append([len(struct[key]) + 1, value])
+    def close(self):
+        self.writer.close()
+
+PRECISIONS = ("fp32", "fp16-mixed", "bf16-mixed")
+
+def resolve_precision(precision, device):
+    """Autocast dtype (None for fp32) and whether gradients need scaling
+
+    fp16 autocast is only used on CUDA; elsewhere fp16-mixed falls back to
+    bf16-mixed, which also runs on CPU-only hosts. bf16 on a GPU without
+    bf16 support falls back to fp16-mixed.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {', '.join(PRECISIONS)}")
+    if precision == "fp16-mixed" and device.type != 'cuda':
+        logging.warning("fp16-mixed needs CUDA, using bf16-mixed instead")
+        precision = "bf16-mixed"
+    if precision == "bf16-mixed" and device.type == 'cuda' and not torch.cuda.is_bf16_supported():
+        logging.warning("This GPU does not support bf16, using fp16-mixed instead")
+        precision = "fp16-mixed"
+
+    if precision == "fp16-mixed":
+        # fp16 gradients underflow without loss scaling
+        return torch.float16, True
+    if precision == "bf16-mixed":
+        # bf16 has fp32's exponent range, no scaling needed
+        return torch.bfloat16, False
+    return None, False
 
-        with open(self.paths[target], "w") as f:
-            json.dump(struct, f)
+def is_out_of_memory(error):
+    """True for CUDA OOMs and failed CPU allocations"""
+    if isinstance(error, torch.cuda.OutOfMemoryError):
+        return True
+    message = str(error)
+    return isinstance(error, RuntimeError) and ("out of memory" in message or "can't allocate memory" in message)
+
+def step_batches(loader, effective_batch_size):
+    """Group loader batches into optimizer steps of at least effective_batch_size samples
+
+    The last step of an epoch may be smaller. Batches stay where the loader
+    put them (usually host memory) until they are split into micro-batches.
+    """
+    inputs, targets, size = [], [], 0
+    for batch_inputs, batch_targets in loader:
+        inputs.append(batch_inputs)
+        targets.append(batch_targets)
+        size += batch_targets.size(0)
+        if size >= effective_batch_size:
+            yield (torch.cat(inputs), torch.cat(targets)) if len(inputs) > 1 else (inputs[0], targets[0])
+            inputs, targets, size = [], [], 0
+    if inputs:
+        yield (torch.cat(inputs), torch.cat(targets)) if len(inputs) > 1 else (inputs[0], targets[0])
 
 def get_default_ingredients(config, model):
     """Get default training components if not specified"""
@@ -85,6 +159,17 @@ def train(
         scheduler: Optional scheduler (default: StepLR)
         criterion: Optional loss function (default: CrossEntropyLoss)
         device: Optional device (default: cuda if available)
+
+    config['precision'] selects fp32 (default), fp16-mixed or bf16-mixed.
+    Mixed modes keep fp32 weights and run forward/loss under autocast.
+
+    config['effective_batch_size'] (default: the loader's batch size) is the
+    number of samples per optimizer step. Each step runs as micro-batches
+    with accumulated gradients; on out-of-memory the micro-batch size is
+    halved and the step retried. The size in use is kept in job_dir's
+    meta.json as micro_batch_size; a later call with the same job_dir
+    (e.g. a restarted job) starts from it. A new job_dir starts from
+    config['micro_batch_size'] if set, else the effective batch size.
     """
     # Setup logging
     logger = JSONLogging(job_dir)
@@ -99,72 +184,108 @@ def train(
     
     # Move model to device
     model = model.to(device)
+
+    # Mixed precision: autocast for forward passes, GradScaler for fp16
+    autocast_dtype, use_scaler = resolve_precision(config.get('precision', 'fp32'), device)
+    autocast = functools.partial(torch.autocast, device.type, dtype=autocast_dtype, enabled=autocast_dtype is not None)
+    scaler = torch.amp.GradScaler(device.type, enabled=use_scaler)
     
+    # Micro-batching: start from the size an earlier run in this job_dir settled on
+    loader_batch_size = getattr(train_loader, 'batch_size', None) or 1
+    effective_batch_size = config.get('effective_batch_size') or loader_batch_size
+    micro_batch_size = min(logger.read("meta").get('micro_batch_size') or config.get('micro_batch_size')
+                           or effective_batch_size, effective_batch_size)
+    logger.update("meta", {"effective_batch_size": effective_batch_size, "micro_batch_size": micro_batch_size})
+    steps_per_epoch = math.ceil(len(train_loader) / max(1, math.ceil(effective_batch_size / loader_batch_size)))
+
+    def accumulate(inputs, targets):
+        """Forward/backward one step batch in micro-batches, returns per-micro-batch (loss, outputs, targets)"""
+        optimizer.zero_grad(set_to_none=True)
+        results = []
+        for micro_inputs, micro_targets in zip(inputs.split(micro_batch_size), targets.split(micro_batch_size)):
+            micro_inputs = micro_inputs.to(device, non_blocking=True)
+            micro_targets = micro_targets.to(device, non_blocking=True)
+            with autocast():
+                outputs = model(micro_inputs)
+                loss = criterion(outputs, micro_targets)
+            # Weighted so the summed gradients match one pass over the whole step batch
+            scaler.scale(loss * (micro_targets.size(0) / targets.size(0))).backward()
+            results.append((loss.detach(), outputs.detach(), micro_targets))
+        return results
+
     # Training loop
     best_acc = 0
     num_epochs = config.get('epochs', 100)
     
+    # Device-resident accumulators, read back only at logging points
+    train_metrics = StreamingMetrics(device)
+    val_metrics = StreamingMetrics(device)
+
     for epoch in range(num_epochs):
         # Training phase
         model.train()
-        running_loss = 0.0
-        correct = 0
-        total = 0
+        train_metrics.reset()
         
-        for batch_idx, (inputs, targets) in enumerate(train_loader):
-            inputs, targets = inputs.to(device), targets.to(device)
-            
-            optimizer.zero_grad()
-            outputs = model(inputs)
-            loss = criterion(outputs, targets)
-            loss.backward()
-            optimizer.step()
-            
-            # Calculate accuracy
-            _, predicted = outputs.max(1)
-            total += targets.size(0)
-            correct += predicted.eq(targets).sum().item()
+        for batch_idx, (inputs, targets) in enumerate(step_batches(train_loader, effective_batch_size)):
+            while True:
+                out_of_memory = False
+                try:
+                    results = accumulate(inputs, targets)
+                    break
+                except Exception as e:
+                    if not is_out_of_memory(e) or micro_batch_size == 1:
+                        raise
+                    out_of_memory = True
+                # Outside the except block so the traceback no longer pins the step's tensors
+                if out_of_memory:
+                    optimizer.zero_grad(set_to_none=True)
+                    if device.type == 'cuda':
+                        torch.cuda.empty_cache()
+                    micro_batch_size //= 2
+                    logging.warning(f"Out of memory, retrying step with micro-batch size {micro_batch_size}")
+                    logger.update("meta", {"micro_batch_size": micro_batch_size})
+
+            scaler.step(optimizer)
+            scaler.update()
             
-            # Update running loss
-            running_loss += loss.item()
+            # Accumulate loss and accuracy on the device
+            for loss, outputs, micro_targets in results:
+                train_metrics.update(loss, outputs, micro_targets)
             
-            # Update GUI progress
+            # Update GUI progress (the only point the metrics are read back)
             if batch_idx % config.get('log_frequency', 10) == 0:
                 progress = {
-                    "progress": (epoch * len(train_loader) + batch_idx) / (num_epochs * len(train_loader)) * 100,
+                    "progress": (epoch * steps_per_epoch + batch_idx) / (num_epochs * steps_per_epoch) * 100,
                     "epoch": epoch,
                     "message": f"Training... Epoch: {epoch}"
                 }
                 logger.update("progress", progress)
                 
+                train_results = train_metrics.compute()
                 metrics = {
-                    "loss": running_loss / (batch_idx + 1),
-                    "accuracy": 100. * correct / total
+                    "loss": train_results["loss"],
+                    "accuracy": 100. * train_results["accuracy"]
                 }
                 logger.add("values", metrics)
         
         # Validation phase
         model.eval()
-        val_loss = 0
-        correct = 0
-        total = 0
+        val_metrics.reset()
         
         with torch.no_grad():
             for inputs, targets in val_loader:
-                inputs, targets = inputs.to(device), targets.to(device)
-                outputs = model(inputs)
-                loss = criterion(outputs, targets)
-                
-                val_loss += loss.item()
-                _, predicted = outputs.max(1)
-                total += targets.size(0)
-                correct += predicted.eq(targets).sum().item()
+                inputs, targets = inputs.to(device, non_blocking=True), targets.to(device, non_blocking=True)
+                with autocast():
+                    outputs = model(inputs)
+                    loss = criterion(outputs, targets)
+                val_metrics.update(loss, outputs, targets)
         
-        val_acc = 100. * correct / total
+        val_results = val_metrics.compute()
+        val_loss, val_acc = val_results["loss"], 100. * val_results["accuracy"]
         
         # Update GUI with validation results
         metrics = {
-            "val_loss": val_loss / len(val_loader),
+            "val_loss": val_loss,
             "val_accuracy": val_acc
         }
         logger.add("values", metrics)
@@ -184,5 +305,6 @@ def train(
         "message": "Training completed",
         "best_accuracy": best_acc
     })
+    logger.close()
 
     return model
\ No newline at end of file
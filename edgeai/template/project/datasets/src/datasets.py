@@ -10,9 +10,22 @@ from torchvision.datasets import CIFAR100
 from tqdm import tqdm
 import urllib.request
 
+try:
+    # Copied next to engine.py in every run
+    from dataset_cache import materialize, source_fingerprint
+except ImportError:
+    materialize = None
+try:
+    # Mean/std measured by the dataset stats job, stored in meta.json
+    from dataset_stats import normalization
+except ImportError:
+    normalization = None
+
+MEAN, STD = (0.5071, 0.4865, 0.4409), (0.2673, 0.2564, 0.2762)
+
 class Dataset(TorchDataset):
     def __init__(self, root: str = "/Data1/CIFAR100/", train: bool = True, download: bool = True, 
-                 transform=None, target_transform=None):
+                 transform=None, target_transform=None, img_size: int = 224, cache: bool = False):
         """
         A simple wrapper around the torchvision CIFAR100 dataset.
 
@@ -24,13 +37,26 @@ class Dataset(TorchDataset):
                                             and returns a transformed version.
             target_transform (callable, optional): A function/transform that takes in the target
                                                    and transforms it.
+            img_size (int): Side length images are resized to by the default transform.
+            cache (bool): With the default transforms, resize every image once into a
+                          memory-mapped uint8 cache shared by later runs, instead of
+                          decoding and resizing it again in every epoch. Samples are
+                          then uint8 CHW tensors instead of normalized floats; the
+                          runs template opts in and augments and normalizes them per
+                          batch with the mean/std attributes.
         """
+        self.mean, self.std = MEAN, STD
+        if normalization is not None:
+            self.mean, self.std = normalization(os.path.dirname(os.path.abspath(__file__)), MEAN, STD)
+        normalize = T.Normalize(self.mean, self.std)
+        use_cache = cache and transform is None and target_transform is None and materialize is not None
+
         # Default transforms if none provided
-        if transform is None:
+        if transform is None and not use_cache:
             transform = T.Compose([
-                T.Resize((224, 224)),
+                T.Resize((img_size, img_size)),
                 T.ToTensor(),
-                T.Normalize((0.5071, 0.4865, 0.4409), (0.2673, 0.2564, 0.2762))
+                normalize
             ])
 
         # Override default download progress with custom one
@@ -50,18 +76,35 @@ class Dataset(TorchDataset):
                                          reporthook=custom_progress_hook(t),
                                          data=data)
 
-        # Patch the urlretrieve for this download
-        urllib.request.urlretrieve = custom_urlretrieve
+        def load(transform):
+            # Patch the urlretrieve for this download
+            urllib.request.urlretrieve = custom_urlretrieve
+            try:
+                return CIFAR100(root=root,
+                                train=train,
+                                download=download,
+                                transform=transform,
+                                target_transform=target_transform)
+            finally:
+                # Restore original urlretrieve
+                urllib.request.urlretrieve = original_urlretrieve
+
+        if not use_cache:
+            self.dataset = load(transform)
+            return
 
-        try:
-            self.dataset = CIFAR100(root=root,
-                                  train=train, 
-                                  download=download,
-                                  transform=transform, 
-                                  target_transform=target_transform)
-        finally:
-            # Restore original urlretrieve
-            urllib.request.urlretrieve = original_urlretrieve
+        base_folder = os.path.join(root, CIFAR100.base_folder)
+        # The cache key needs the files; otherwise CIFAR100 is only loaded
+        # (and its archive checked) when the cache entry is built
+        source = load(None) if not os.path.isdir(base_folder) else (lambda: load(None))
+        # Resize is deterministic and runs once; conversion to float,
+        # normalization and random augmentation happen per batch
+        self.dataset = materialize(
+            source,
+            T.Resize((img_size, img_size)),
+            source={"name": "CIFAR100", "train": train, "files": source_fingerprint(base_folder)},
+            transform_config={"resize": [img_size, img_size]}
+        )
 
     def __getitem__(self, index: int):
         return self.dataset[index]
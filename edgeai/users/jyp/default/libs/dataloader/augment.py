@@ -2,13 +2,21 @@ import albumentations as A
 from albumentations.pytorch import ToTensorV2
 import numpy as np
 
+MEAN = [0.4914, 0.4822, 0.4465]
+STD = [0.2023, 0.1994, 0.2010]
+
 def get_transforms(config, is_training=True):
     """Get transforms for training/validation
     
     For CIFAR100:
     - Training: Strong augmentations for regularization
     - Validation: Only normalize and convert to tensor
+
+    Normalization uses config['mean'] / config['std'] when set, e.g. from
+    the dataset's meta.json stats (edgeai/engine/dataset_stats.py).
     """
+    mean = config.get('mean', MEAN)
+    std = config.get('std', STD)
     if is_training:
         return A.Compose([
             A.RandomCrop(32, 32),
@@ -23,17 +31,11 @@ def get_transforms(config, is_training=True):
                 A.GaussianBlur(p=0.3),
                 A.MotionBlur(p=0.3),
             ], p=0.3),
-            A.Normalize(
-                mean=[0.4914, 0.4822, 0.4465],  # CIFAR100 mean
-                std=[0.2023, 0.1994, 0.2010],   # CIFAR100 std
-            ),
+            A.Normalize(mean=mean, std=std),
             ToTensorV2(),
         ])
     else:
         return A.Compose([
-            A.Normalize(
-                mean=[0.4914, 0.4822, 0.4465],
-                std=[0.2023, 0.1994, 0.2010],
-            ),
+            A.Normalize(mean=mean, std=std),
             ToTensorV2(),
         ])
\ No newline at end of file
@@ -1,14 +1,116 @@
+import os
+import glob
+import tempfile
+import weakref
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, get_worker_info
 import numpy as np
 from PIL import Image
 
+SHARED_PREFIX = 'edgeai-shared-'
+
+def _unlink_owned(path, pid):
+    # Forked workers inherit the finalizer; only the creating process removes the file
+    if os.getpid() == pid:
+        os.unlink(path)
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def sweep_shared(directory):
+    """Remove SharedArray files left in directory by processes that no longer exist (e.g. SIGKILLed runs)"""
+    for path in glob.glob(os.path.join(directory, f'{SHARED_PREFIX}*.bin')):
+        try:
+            pid = int(os.path.basename(path)[len(SHARED_PREFIX):].split('-')[0])
+        except ValueError:
+            continue
+        if not _pid_alive(pid):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+class SharedArray:
+    """Read-only numpy array in a file under /dev/shm, mapped by every process that uses it
+
+    DataLoader workers map the same pages instead of faulting in private
+    copy-on-write copies, and pickling (spawn) passes the path, not the
+    data. The file is removed when the creating process drops the array;
+    its name carries the creator's pid, so files of processes that were
+    killed before that are swept by the next SharedArray.
+    """
+    def __init__(self, array, directory=None):
+        array = np.ascontiguousarray(array)
+        if directory is None:
+            directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        sweep_shared(directory)
+        fd, self.path = tempfile.mkstemp(prefix=f'{SHARED_PREFIX}{os.getpid()}-', suffix='.bin', dir=directory)
+        os.close(fd)
+        self.shape, self.dtype = array.shape, array.dtype
+        buffer = np.memmap(self.path, dtype=self.dtype, mode='w+', shape=self.shape)
+        buffer[:] = array
+        buffer.flush()
+        del buffer
+        self._array = None
+        self._finalizer = weakref.finalize(self, _unlink_owned, self.path, os.getpid())
+
+    @property
+    def array(self):
+        # Mapped lazily, so each worker maps the file itself
+        if self._array is None:
+            self._array = np.memmap(self.path, dtype=self.dtype, mode='r', shape=self.shape)
+        return self._array
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_array"] = None
+        state["_finalizer"] = None
+        return state
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+def memory_usage(pid='self'):
+    """RSS, PSS (shared pages split between their users) and shared RSS of a process in MB, Linux only"""
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                fields = line.split()
+                if fields[0] in ('Rss:', 'Pss:', 'Shared_Clean:', 'Shared_Dirty:'):
+                    usage[fields[0][:-1]] = int(fields[1]) / 1024
+    except OSError:
+        return {}
+    return {
+        "rss_mb": round(usage.get('Rss', 0), 1),
+        "pss_mb": round(usage.get('Pss', 0), 1),
+        "shared_mb": round(usage.get('Shared_Clean', 0) + usage.get('Shared_Dirty', 0), 1)
+    }
+
 class CIFAR100Dataset(Dataset):
-    """Custom CIFAR100 dataset with albumentations augmentations"""
-    def __init__(self, data, targets, transform=None):
+    """Custom CIFAR100 dataset with albumentations augmentations
+
+    With dtype set, samples are stored as they come (e.g. uint8 in a
+    SharedArray) and converted one at a time when they are loaded.
+    report_every > 0 prints the RSS/PSS of the process every report_every
+    samples it loads, e.g. per DataLoader worker.
+    """
+    def __init__(self, data, targets, transform=None, dtype=None, report_every=0):
         self.data = data
         self.targets = targets
         self.transform = transform
+        self.dtype = dtype
+        self.report_every = report_every
+        self.loaded = 0
 
     def __len__(self):
         return len(self.data)
@@ -17,18 +119,40 @@ class CIFAR100Dataset(Dataset):
         img = self.data[idx]
         target = self.targets[idx]
 
+        if self.dtype is not None:
+            # Also a writable copy of the read-only shared sample
+            img = img.astype(self.dtype)
         if self.transform:
             img = self.transform(image=img)['image']
 
+        if self.report_every:
+            self.loaded += 1
+            if self.loaded % self.report_every == 0:
+                worker = get_worker_info()
+                name = f"worker {worker.id}" if worker is not None else "main"
+                print(f"[{name}] {self.loaded} samples, memory {memory_usage()}")
+
         return img, target
 
 def prepare_data(config, data, targets, transform):
-    """Prepare data for training/validation"""
+    """Prepare data for training/validation
+
+    config['low_memory'] keeps the images uint8 in a SharedArray that
+    DataLoader workers share, converting each sample to float32 when it
+    is loaded instead of the whole array up front (4x smaller, and no
+    per-worker copies). config['memory_report_every'] sets how often
+    each process prints its memory use.
+    """
+    report_every = config.get('memory_report_every', 0)
+    if config.get('low_memory', False) and isinstance(data, np.ndarray) and data.dtype == np.uint8:
+        shared = SharedArray(data)
+        return CIFAR100Dataset(shared, targets, transform, dtype=np.float32, report_every=report_every)
+
     # Convert uint8 images to float32
     if isinstance(data, np.ndarray):
         data = data.astype(np.float32)
-    
+
     # Create dataset with transforms
-    dataset = CIFAR100Dataset(data, targets, transform)
-    
-    return dataset
\ No newline at end of file
+    dataset = CIFAR100Dataset(data, targets, transform, report_every=report_every)
+
+    return dataset
@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import signal
+import shutil
+import tempfile
+import unittest
+import subprocess
+import importlib.util
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+ENGINE_TEMPLATE = os.path.join(REPO, 'edgeai', 'template', 'project', 'runs', 'engine.txt')
+
+# Two CPU ranks training a tiny model with the template's GracefulStop
+DDP_SCRIPT = '''
+import os
+import sys
+import time
+import contextlib
+import importlib.util
+import importlib.machinery
+import torch
+import pytorch_lightning as pl
+from torch.utils.data import DataLoader, TensorDataset
+from pytorch_lightning.strategies import DDPStrategy
+
+sys.path.insert(0, os.path.join(sys.argv[2], 'edgeai', 'engine'))
+loader = importlib.machinery.SourceFileLoader('engine', sys.argv[1])
+engine = importlib.util.module_from_spec(importlib.util.spec_from_loader('engine', loader))
+loader.exec_module(engine)
+
+
+class Tiny(pl.LightningModule):
+    def __init__(self):
+        super().__init__()
+        self.layer = torch.nn.Linear(4, 2)
+
+    def step_phase(self, name):
+        return contextlib.nullcontext()
+
+    def training_step(self, batch, batch_idx):
+        if batch_idx == 3 and self.global_rank == 0:
+            open('ready', 'w').close()
+        time.sleep(0.05)
+        inputs, targets = batch
+        return torch.nn.functional.cross_entropy(self.layer(inputs), targets)
+
+    def configure_optimizers(self):
+        return torch.optim.SGD(self.parameters(), lr=0.1)
+
+    def train_dataloader(self):
+        return DataLoader(TensorDataset(torch.randn(4096, 4), torch.randint(0, 2, (4096,))), batch_size=2)
+
+
+if __name__ == '__main__':
+    graceful_stop = engine.GracefulStop(os.path.abspath('interrupted.ckpt'))
+    trainer = pl.Trainer(accelerator='cpu', devices=2, strategy=DDPStrategy(process_group_backend='gloo'),
+                         max_epochs=1, callbacks=[graceful_stop], logger=False, enable_checkpointing=False,
+                         enable_progress_bar=False)
+    trainer.fit(Tiny())
+    print(f"saved {graceful_stop.saved}")
+'''
+
+
+@unittest.skipUnless(importlib.util.find_spec('pytorch_lightning') and os.name == 'posix',
+                     "needs pytorch_lightning and process groups")
+class GracefulStopDDPTest(unittest.TestCase):
+    def setUp(self):
+        self.run_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.run_dir, ignore_errors=True)
+
+    def test_sigterm_saves_interrupted_checkpoint(self):
+        script = os.path.join(self.run_dir, 'ddp_run.py')
+        with open(script, 'w') as f:
+            f.write(DDP_SCRIPT)
+        # The server signals the run's whole process group, DDP ranks included
+        process = subprocess.Popen([sys.executable, script, ENGINE_TEMPLATE, REPO], cwd=self.run_dir,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                   start_new_session=True)
+        try:
+            deadline = time.time() + 120
+            while not os.path.exists(os.path.join(self.run_dir, 'ready')):
+                if process.poll() is not None:
+                    self.fail(f"run exited before SIGTERM:\n{process.stdout.read()}")
+                self.assertLess(time.time(), deadline, "training did not start")
+                time.sleep(0.1)
+            os.killpg(process.pid, signal.SIGTERM)
+            output, _ = process.communicate(timeout=60)
+        finally:
+            if process.poll() is None:
+                os.killpg(process.pid, signal.SIGKILL)
+                process.wait()
+
+        self.assertEqual(process.returncode, 0, output)
+        self.assertIn("saved True", output)
+        self.assertTrue(os.path.exists(os.path.join(self.run_dir, 'interrupted.ckpt')))
+
+
+if __name__ == '__main__':
+    unittest.main()
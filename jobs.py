@@ -3,9 +3,11 @@ import os
 import shutil
 import subprocess
 import datetime
+import time
 
 from flask import Blueprint, render_template, send_from_directory, jsonify, request, session
 from auth import login_required, session_required
+from edgeai.engine.metrics_log import read_values, read_progress
 
 jobs = Blueprint('jobs', __name__)
 
@@ -25,14 +27,27 @@ def list():
     }
 
     try:
+        # With "since" (the cursor of a previous call) only jobs whose
+        # progress changed after it are returned; "known" (the job ids the
+        # caller already shows) gets back the ones deleted since in "removed"
+        since = request.json.get('since')
+        msg['cursor'] = time.time()
+
         path = f"./edgeai/users/{session['user']}/{request.json['project_name']}/jobs"
         dirs = sorted(os.listdir(path))
+        msg['removed'] = sorted(set(request.json.get('known') or []) - set(dirs))
         for dir_ in dirs:
+            try:
+                changed_at = os.path.getmtime(f"{path}/{dir_}/progress.json")
+            except FileNotFoundError:
+                # Not started writing progress yet, or deleted while listing
+                continue
+            if since is not None and changed_at <= float(since):
+                continue
             msg['res'][dir_] = {}
             with open(f"{path}/{dir_}/meta.json", 'r') as f:
                 msg['res'][dir_]['meta'] = json.loads(f.read())
-            with open(f"{path}/{dir_}/progress.json", 'r') as f:
-                msg['res'][dir_]['progress'] = json.loads(f.read())
+            msg['res'][dir_]['progress'] = read_progress(f"{path}/{dir_}")
 
             s_time = datetime.datetime.fromtimestamp(int(dir_) / 1000000)
 
@@ -127,9 +142,9 @@ def graph():
     }
 
     try:
-        path = f"./edgeai/users/{session['user']}/{request.json['project_name']}/jobs/{request.json['job_name']}/values.json"
-        with open(path, 'r') as f:
-            msg['res'] = json.loads(f.read())
+        # "since" is the cursor of a previous call; only points appended after it are returned
+        path = f"./edgeai/users/{session['user']}/{request.json['project_name']}/jobs/{request.json['job_name']}"
+        msg['res'], msg['cursor'] = read_values(path, request.json.get('since'))
 
     except Exception as e:
         msg['err'] = str(e)
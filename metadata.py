@@ -0,0 +1,497 @@
+import os
+import sys
+import copy
+import json
+import sqlite3
+import tempfile
+import contextlib
+from abc import ABC, abstractmethod
+from threading import Lock, RLock
+
+# Backend used by get_store(): 'sqlite' (default) or 'json' (legacy project.json)
+METADATA_BACKEND = os.environ.get('EDGEAI_METADATA_BACKEND', 'sqlite')
+
+WORKSPACE_ROOT = 'workspace'
+
+# Record collections kept per project and the field that names each record
+COLLECTIONS = {
+    "datasets": "dataset_name",
+    "models": "model_name",
+    "runs": "run_name",
+    "optimizations": "optimize_method_name",
+}
+
+SCHEMA_VERSION = 1
+
+
+def project_dir(user, project_name):
+    return os.path.join(WORKSPACE_ROOT, user, project_name)
+
+
+def empty_project(user, project_name):
+    project_data = {"project_name": project_name, "user_name": user}
+    for kind in COLLECTIONS:
+        project_data[kind] = []
+    return project_data
+
+
+class MetadataStore(ABC):
+    """Common interface of the project metadata backends
+
+    Records are plain dicts (the same entries project.json has always held)
+    and are addressed by collection ("runs", "models", ...) and name.
+    """
+    def __init__(self, user, project_name):
+        self.user = user
+        self.project_name = project_name
+        self.project_dir = project_dir(user, project_name)
+        self.json_path = os.path.join(self.project_dir, 'project.json')
+
+    def lock(self):
+        """Per-project lock for read-check-write sequences spanning several calls"""
+        return metadata_cache.lock(self.json_path)
+
+    @abstractmethod
+    def exists(self):
+        ...
+
+    @abstractmethod
+    def create(self, project_data):
+        ...
+
+    @abstractmethod
+    def get_project(self):
+        ...
+
+    @abstractmethod
+    def list(self, kind):
+        ...
+
+    @abstractmethod
+    def get(self, kind, name):
+        ...
+
+    def list_by_status(self, kind, status):
+        return [r for r in self.list(kind) if r.get("status") == status]
+
+    @abstractmethod
+    def put(self, kind, record):
+        """Insert or replace a record, returns True if it already existed"""
+        ...
+
+    @abstractmethod
+    def update(self, kind, name, fields):
+        """Merge fields into one record, returns the updated record or None"""
+        ...
+
+    @abstractmethod
+    def delete(self, kind, name):
+        ...
+
+    @abstractmethod
+    def clear(self, kind):
+        ...
+
+    @abstractmethod
+    def reorder(self, kind, names):
+        ...
+
+    @abstractmethod
+    def add_item(self, key, value):
+        ...
+
+    @abstractmethod
+    def remove_item(self, key, value):
+        ...
+
+
+class MetadataCache:
+    """Parsed project.json files shared by every request of this process
+
+    Entries are revalidated against the file's mtime and size, so a poll of
+    /runs/list or /project/json only parses the file again after it changed.
+    Mutations hold the per-project lock handed out by lock().
+    """
+    def __init__(self):
+        self._guard = Lock()
+        self._entries = {}
+        self._locks = {}
+
+    def lock(self, path):
+        with self._guard:
+            if path not in self._locks:
+                self._locks[path] = RLock()
+            return self._locks[path]
+
+    def load(self, path):
+        """Return the cached data of path, or None if the file does not exist"""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            with self._guard:
+                self._entries.pop(path, None)
+            return None
+
+        signature = (st.st_mtime_ns, st.st_size)
+        with self._guard:
+            entry = self._entries.get(path)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+
+        with open(path, 'r') as f:
+            data = json.load(f)
+        with self._guard:
+            self._entries[path] = (signature, data)
+        return data
+
+    def save(self, path, data):
+        """Write path atomically (temp file + rename) and cache the written data"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.project.', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=4)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        st = os.stat(path)
+        with self._guard:
+            self._entries[path] = ((st.st_mtime_ns, st.st_size), data)
+
+
+metadata_cache = MetadataCache()
+
+
+class JSONStore(MetadataStore):
+    """Legacy backend keeping the whole project in project.json
+
+    Reads are served from metadata_cache. list() and get_project() return
+    the shared cached objects and must not be modified by the caller; get()
+    and update() return copies.
+    """
+    def exists(self):
+        return os.path.exists(self.json_path)
+
+    def _load(self):
+        project_data = metadata_cache.load(self.json_path)
+        if project_data is None:
+            return empty_project(self.user, self.project_name)
+        return project_data
+
+    @contextlib.contextmanager
+    def _mutate(self):
+        with self.lock():
+            project_data = copy.deepcopy(self._load())
+            yield project_data
+            metadata_cache.save(self.json_path, project_data)
+
+    def create(self, project_data):
+        with self.lock():
+            metadata_cache.save(self.json_path, project_data)
+
+    def get_project(self):
+        return self._load()
+
+    def list(self, kind):
+        return self._load().get(kind, [])
+
+    def get(self, kind, name):
+        key = COLLECTIONS[kind]
+        record = next((r for r in self.list(kind) if r.get(key) == name), None)
+        return copy.deepcopy(record)
+
+    def put(self, kind, record):
+        key = COLLECTIONS[kind]
+        with self._mutate() as project_data:
+            records = project_data.setdefault(kind, [])
+            for i, existing in enumerate(records):
+                if existing.get(key) == record[key]:
+                    records[i] = record
+                    return True
+            records.append(record)
+            return False
+
+    def update(self, kind, name, fields):
+        key = COLLECTIONS[kind]
+        with self._mutate() as project_data:
+            record = next((r for r in project_data.get(kind, []) if r.get(key) == name), None)
+            if record is not None:
+                record.update(fields)
+        return copy.deepcopy(record)
+
+    def delete(self, kind, name):
+        key = COLLECTIONS[kind]
+        with self._mutate() as project_data:
+            project_data[kind] = [r for r in project_data.get(kind, []) if r.get(key) != name]
+
+    def clear(self, kind):
+        with self._mutate() as project_data:
+            project_data[kind] = []
+
+    def reorder(self, kind, names):
+        key = COLLECTIONS[kind]
+        with self._mutate() as project_data:
+            record_map = {r[key]: r for r in project_data.get(kind, [])}
+            project_data[kind] = [record_map[name] for name in names]
+
+    def add_item(self, key, value):
+        with self._mutate() as project_data:
+            if key in project_data and value not in project_data[key]:
+                project_data[key].append(value)
+
+    def remove_item(self, key, value):
+        with self._mutate() as project_data:
+            if key in project_data:
+                project_data[key] = [item for item in project_data[key] if item != value]
+
+
+class SQLiteStore(MetadataStore):
+    """Project metadata in workspace/<user>/<project>/project.db
+
+    One row per record, so updating a run touches a single row instead of
+    re-serializing the whole project. The database runs in WAL mode so
+    polling readers never block the writer, and every mutation happens in
+    a BEGIN IMMEDIATE transaction so concurrent requests cannot lose each
+    other's writes. An existing project.json is imported the first time
+    the database is opened.
+    """
+    _init_lock = Lock()
+    _initialized = set()
+
+    def __init__(self, user, project_name):
+        super().__init__(user, project_name)
+        self.db_path = os.path.join(self.project_dir, 'project.db')
+
+    def exists(self):
+        return os.path.exists(self.db_path) or os.path.exists(self.json_path)
+
+    def _connect(self):
+        # A deleted and re-created project needs its schema again
+        fresh = not os.path.exists(self.db_path)
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA busy_timeout = 30000')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        with SQLiteStore._init_lock:
+            if fresh or self.db_path not in SQLiteStore._initialized:
+                self._init_db(conn)
+                SQLiteStore._initialized.add(self.db_path)
+        return conn
+
+    def _init_db(self, conn):
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS project (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            for kind in COLLECTIONS:
+                conn.execute(
+                    f'CREATE TABLE IF NOT EXISTS {kind} ('
+                    'name TEXT PRIMARY KEY, position INTEGER NOT NULL, status TEXT, data TEXT NOT NULL)'
+                )
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {kind}_position ON {kind} (position)')
+            conn.execute('CREATE INDEX IF NOT EXISTS runs_status ON runs (status)')
+
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version < SCHEMA_VERSION:
+                if os.path.exists(self.json_path):
+                    with open(self.json_path, 'r') as f:
+                        self._import(conn, json.load(f))
+                conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _import(self, conn, project_data):
+        for key, value in project_data.items():
+            if key in COLLECTIONS:
+                for position, record in enumerate(value):
+                    conn.execute(
+                        f'INSERT OR REPLACE INTO {key} (name, position, status, data) VALUES (?, ?, ?, ?)',
+                        (record[COLLECTIONS[key]], position, record.get("status"), json.dumps(record))
+                    )
+            else:
+                conn.execute('INSERT OR REPLACE INTO project (key, value) VALUES (?, ?)',
+                             (key, json.dumps(value)))
+
+    @contextlib.contextmanager
+    def _read(self):
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _check_kind(kind):
+        if kind not in COLLECTIONS:
+            raise ValueError(f"Unknown metadata collection: {kind}")
+
+    def create(self, project_data):
+        os.makedirs(self.project_dir, exist_ok=True)
+        with self._transaction() as conn:
+            self._import(conn, project_data)
+
+    def get_project(self):
+        project_data = empty_project(self.user, self.project_name)
+        with self._read() as conn:
+            for key, value in conn.execute('SELECT key, value FROM project'):
+                project_data[key] = json.loads(value)
+            for kind in COLLECTIONS:
+                project_data[kind] = [
+                    json.loads(data) for (data,) in conn.execute(f'SELECT data FROM {kind} ORDER BY position')
+                ]
+        return project_data
+
+    def list(self, kind):
+        self._check_kind(kind)
+        with self._read() as conn:
+            return [json.loads(data) for (data,) in conn.execute(f'SELECT data FROM {kind} ORDER BY position')]
+
+    def get(self, kind, name):
+        self._check_kind(kind)
+        with self._read() as conn:
+            row = conn.execute(f'SELECT data FROM {kind} WHERE name = ?', (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def list_by_status(self, kind, status):
+        self._check_kind(kind)
+        with self._read() as conn:
+            rows = conn.execute(f'SELECT data FROM {kind} WHERE status = ? ORDER BY position', (status,))
+            return [json.loads(data) for (data,) in rows]
+
+    def put(self, kind, record):
+        self._check_kind(kind)
+        name = record[COLLECTIONS[kind]]
+        with self._transaction() as conn:
+            existed = conn.execute(f'SELECT 1 FROM {kind} WHERE name = ?', (name,)).fetchone() is not None
+            if existed:
+                conn.execute(f'UPDATE {kind} SET status = ?, data = ? WHERE name = ?',
+                             (record.get("status"), json.dumps(record), name))
+            else:
+                conn.execute(
+                    f'INSERT INTO {kind} (name, position, status, data) '
+                    f'VALUES (?, (SELECT COALESCE(MAX(position), -1) + 1 FROM {kind}), ?, ?)',
+                    (name, record.get("status"), json.dumps(record))
+                )
+        return existed
+
+    def update(self, kind, name, fields):
+        self._check_kind(kind)
+        with self._transaction() as conn:
+            row = conn.execute(f'SELECT data FROM {kind} WHERE name = ?', (name,)).fetchone()
+            if row is None:
+                return None
+            record = json.loads(row[0])
+            record.update(fields)
+            conn.execute(f'UPDATE {kind} SET name = ?, status = ?, data = ? WHERE name = ?',
+                         (record[COLLECTIONS[kind]], record.get("status"), json.dumps(record), name))
+        return record
+
+    def delete(self, kind, name):
+        self._check_kind(kind)
+        with self._transaction() as conn:
+            conn.execute(f'DELETE FROM {kind} WHERE name = ?', (name,))
+
+    def clear(self, kind):
+        self._check_kind(kind)
+        with self._transaction() as conn:
+            conn.execute(f'DELETE FROM {kind}')
+
+    def reorder(self, kind, names):
+        self._check_kind(kind)
+        with self._transaction() as conn:
+            existing = {name for (name,) in conn.execute(f'SELECT name FROM {kind}')}
+            missing = [name for name in names if name not in existing]
+            if missing:
+                raise KeyError(missing[0])
+            conn.execute(f'DELETE FROM {kind} WHERE name NOT IN ({",".join("?" * len(names))})', names)
+            conn.executemany(f'UPDATE {kind} SET position = ? WHERE name = ?',
+                             [(position, name) for position, name in enumerate(names)])
+
+    def add_item(self, key, value):
+        if key in COLLECTIONS:
+            if isinstance(value, dict) and self.get(key, value.get(COLLECTIONS[key])) is None:
+                self.put(key, value)
+            return
+        with self._transaction() as conn:
+            row = conn.execute('SELECT value FROM project WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return
+            items = json.loads(row[0])
+            if value not in items:
+                items.append(value)
+                conn.execute('UPDATE project SET value = ? WHERE key = ?', (json.dumps(items), key))
+
+    def remove_item(self, key, value):
+        if key in COLLECTIONS:
+            if isinstance(value, dict) and self.get(key, value.get(COLLECTIONS[key])) == value:
+                self.delete(key, value[COLLECTIONS[key]])
+            return
+        with self._transaction() as conn:
+            row = conn.execute('SELECT value FROM project WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return
+            items = [item for item in json.loads(row[0]) if item != value]
+            conn.execute('UPDATE project SET value = ? WHERE key = ?', (json.dumps(items), key))
+
+
+BACKENDS = {
+    'json': JSONStore,
+    'sqlite': SQLiteStore,
+}
+
+
+def get_store(user, project_name):
+    """Return the metadata store of a project using the configured backend"""
+    return BACKENDS[METADATA_BACKEND](user, project_name)
+
+
+def iter_projects():
+    """Yield (user, project_name) of every project directory in the workspace"""
+    if not os.path.exists(WORKSPACE_ROOT):
+        return
+    for user in sorted(os.listdir(WORKSPACE_ROOT)):
+        user_dir = os.path.join(WORKSPACE_ROOT, user)
+        # Dot directories hold shared server state (e.g. .snapshots)
+        if user.startswith('.') or not os.path.isdir(user_dir):
+            continue
+        for project_name in sorted(os.listdir(user_dir)):
+            if os.path.isdir(os.path.join(user_dir, project_name)):
+                yield user, project_name
+
+
+def migrate_workspace():
+    """One-shot import of every workspace/<user>/<project>/project.json into SQLite"""
+    migrated = []
+    for user, project_name in iter_projects():
+        store = SQLiteStore(user, project_name)
+        if not os.path.exists(store.json_path):
+            continue
+        store._connect().close()
+        migrated.append(f"{user}/{project_name}")
+    return migrated
+
+
+if __name__ == '__main__':
+    # python metadata.py migrate
+    if len(sys.argv) > 1 and sys.argv[1] == 'migrate':
+        for name in migrate_workspace():
+            print(f"Migrated {name}")
+    else:
+        print("usage: python metadata.py migrate")
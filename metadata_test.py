@@ -0,0 +1,104 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import metadata
+from metadata import JSONStore, SQLiteStore, MetadataStore, empty_project, iter_projects
+
+
+class StoreTests:
+    """Behaviour both backends share; mixed into one TestCase per backend"""
+    backend = None
+
+    def setUp(self):
+        self.workspace = tempfile.mkdtemp()
+        patcher = mock.patch.object(metadata, 'WORKSPACE_ROOT', self.workspace)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.workspace, ignore_errors=True)
+        os.makedirs(os.path.join(self.workspace, 'alice', 'demo'))
+        self.store = self.backend('alice', 'demo')
+        self.store.create(empty_project('alice', 'demo'))
+
+    def test_put_get_update(self):
+        self.assertFalse(self.store.put("runs", {"run_name": "r1", "status": "Queued"}))
+        self.assertTrue(self.store.put("runs", {"run_name": "r1", "status": "Running"}))
+        record = self.store.update("runs", "r1", {"pid": 42})
+        self.assertEqual(record, {"run_name": "r1", "status": "Running", "pid": 42})
+        self.assertEqual(self.store.get("runs", "r1"), record)
+        self.assertIsNone(self.store.get("runs", "missing"))
+        self.assertIsNone(self.store.update("runs", "missing", {"pid": 1}))
+
+    def test_list_keeps_insertion_order_and_reorder(self):
+        for name in ("a", "b", "c"):
+            self.store.put("models", {"model_name": name})
+        self.assertEqual([r["model_name"] for r in self.store.list("models")], ["a", "b", "c"])
+        self.store.reorder("models", ["c", "a", "b"])
+        self.assertEqual([r["model_name"] for r in self.store.list("models")], ["c", "a", "b"])
+
+    def test_list_by_status(self):
+        self.store.put("runs", {"run_name": "r1", "status": "Running"})
+        self.store.put("runs", {"run_name": "r2", "status": "Stopped"})
+        self.store.put("runs", {"run_name": "r3", "status": "Running"})
+        self.assertEqual([r["run_name"] for r in self.store.list_by_status("runs", "Running")], ["r1", "r3"])
+
+    def test_delete_and_clear(self):
+        self.store.put("datasets", {"dataset_name": "d1"})
+        self.store.put("datasets", {"dataset_name": "d2"})
+        self.store.delete("datasets", "d1")
+        self.assertEqual([r["dataset_name"] for r in self.store.list("datasets")], ["d2"])
+        self.store.clear("datasets")
+        self.assertEqual(self.store.list("datasets"), [])
+
+    def test_get_project(self):
+        self.store.put("runs", {"run_name": "r1"})
+        project = self.store.get_project()
+        self.assertEqual(project["project_name"], "demo")
+        self.assertEqual(project["runs"], [{"run_name": "r1"}])
+        self.assertEqual(project["models"], [])
+
+
+class JSONStoreTest(StoreTests, unittest.TestCase):
+    backend = JSONStore
+
+
+class SQLiteStoreTest(StoreTests, unittest.TestCase):
+    backend = SQLiteStore
+
+    def test_imports_existing_project_json(self):
+        os.makedirs(os.path.join(self.workspace, 'bob', 'legacy'))
+        project = empty_project('bob', 'legacy')
+        project["runs"] = [{"run_name": "old", "status": "Completed"}]
+        with open(os.path.join(self.workspace, 'bob', 'legacy', 'project.json'), 'w') as f:
+            json.dump(project, f)
+        store = SQLiteStore('bob', 'legacy')
+        self.assertEqual(store.get("runs", "old"), {"run_name": "old", "status": "Completed"})
+
+    def test_unknown_collection(self):
+        with self.assertRaises(ValueError):
+            self.store.list("checkpoints")
+
+
+class MetadataStoreTest(unittest.TestCase):
+    def test_incomplete_backend_fails_on_instantiation(self):
+        class Partial(MetadataStore):
+            def exists(self):
+                return True
+
+        with self.assertRaises(TypeError):
+            Partial('alice', 'demo')
+
+    def test_iter_projects_skips_dot_directories(self):
+        workspace = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workspace, ignore_errors=True)
+        for path in ('alice/demo', 'alice/other', '.snapshots/objects', 'bob/p'):
+            os.makedirs(os.path.join(workspace, path))
+        with mock.patch.object(metadata, 'WORKSPACE_ROOT', workspace):
+            self.assertEqual(list(iter_projects()), [('alice', 'demo'), ('alice', 'other'), ('bob', 'p')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ import json
 import shutil
 from flask import Blueprint, jsonify, request, session, render_template
 from auth import session_required
+from metadata import get_store
 
 models = Blueprint('models', __name__, url_prefix='/models')
 
@@ -64,40 +65,10 @@ def save_model():
         with open(f"{user_path}/__init__.py", "w") as f:
             f.write(init_content)
 
-        # Update project.json
-        project_json_path = f'./workspace/{session["user"]}/{project_name}/project.json'
-        if os.path.exists(project_json_path):
-            with open(project_json_path, 'r') as f:
-                project_data = json.load(f)
-        else:
-            project_data = {
-                "datasets": [], 
-                "models": [], 
-                "runs": [], 
-                "optimizations": []
-            }
-
-        existing_models = project_data.get("models", [])
+        # Update the project store - replace the model if it exists, append it otherwise
         model_meta = data["meta"].copy()
         model_meta["model_save_path"] = user_path
-
-        # Check if model exists - if yes, update it
-        model_exists = False
-        for i, existing_model in enumerate(existing_models):
-            if existing_model["model_name"] == model_name:
-                existing_models[i] = model_meta
-                model_exists = True
-                break
-
-        # If model doesn't exist, append it
-        if not model_exists:
-            existing_models.append(model_meta)
-
-        project_data["models"] = existing_models
-
-        # Save updated project.json
-        with open(project_json_path, 'w') as f:
-            json.dump(project_data, f, indent=4)
+        model_exists = get_store(session["user"], project_name).put("models", model_meta)
 
         return jsonify({
             "error": None, 
@@ -118,19 +89,8 @@ def reorder_models():
         if not project_name or not new_order:
             return jsonify({'error': 'Missing required parameters'})
 
-        project_json_path = f'./workspace/{session["user"]}/{project_name}/project.json'
-        
-        with open(project_json_path, 'r') as f:
-            project_data = json.load(f)
-        
-        # Create a map of model names to their full data
-        model_map = {m['model_name']: m for m in project_data['models']}
-        
         # Reorder models according to new_order
-        project_data['models'] = [model_map[name] for name in new_order]
-        
-        with open(project_json_path, 'w') as f:
-            json.dump(project_data, f, indent=4)
+        get_store(session["user"], project_name).reorder("models", new_order)
         
         return jsonify({'error': None, 'message': 'Order updated successfully'})
     
@@ -146,15 +106,10 @@ def list_models():
         if not project_name:
             raise ValueError("Project name is missing.")
 
-        project_json_path = f'./workspace/{session["user"]}/{project_name}/project.json'
-        
-        # Load model information from project.json
-        if os.path.exists(project_json_path):
-            with open(project_json_path, 'r') as f:
-                project_data = json.load(f)
-                models = project_data.get("models", [])
-        else:
-            models = []
+        store = get_store(session["user"], project_name)
+
+        # Load model information from the project store
+        models = store.list("models") if store.exists() else []
 
         # Return the model metadata
         return jsonify({"models": models})
@@ -177,16 +132,10 @@ def delete_model():
         if os.path.exists(user_path):
             shutil.rmtree(user_path)
 
-        # Update project.json
-        project_json_path = f'./workspace/{session["user"]}/{project_name}/project.json'
-        if os.path.exists(project_json_path):
-            with open(project_json_path, 'r') as f:
-                project_data = json.load(f)
-
-            project_data["models"] = [m for m in project_data.get("models", []) if m["model_name"] != model_name]
-
-            with open(project_json_path, 'w') as f:
-                json.dump(project_data, f, indent=4)
+        # Update the project store
+        store = get_store(session["user"], project_name)
+        if store.exists():
+            store.delete("models", model_name)
         
         return jsonify({"message": f"Model '{model_name}' deleted successfully"})
     except Exception as e:
@@ -207,16 +156,10 @@ def delete_all_models():
         if os.path.exists(user_path):
             shutil.rmtree(user_path)
 
-        # Update project.json
-        project_json_path = f'./workspace/{session["user"]}/{project_name}/project.json'
-        if os.path.exists(project_json_path):
-            with open(project_json_path, 'r') as f:
-                project_data = json.load(f)
-
-            project_data["models"] = []
-
-            with open(project_json_path, 'w') as f:
-                json.dump(project_data, f, indent=4)
+        # Update the project store
+        store = get_store(session["user"], project_name)
+        if store.exists():
+            store.clear("models")
         
         return jsonify({"message": f"All models for project '{project_name}' deleted successfully"})
     except Exception as e:
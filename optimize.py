@@ -3,6 +3,7 @@ import json
 import shutil
 from flask import Blueprint, jsonify, request, session, render_template
 from auth import session_required
+from metadata import get_store
 
 optimizations = Blueprint('optimizations', __name__, url_prefix='/optimizations')
 
@@ -93,33 +94,8 @@ def save_optimization():
         with open(os.path.join(user_path, "meta.json"), "w") as f:
             json.dump(meta, f, indent=4)
 
-        # Update project.json
-        project_json_path = os.path.join(
-            '.', 'workspace', session["user"], project_name, 'project.json'
-        )
-        if os.path.exists(project_json_path):
-            with open(project_json_path, 'r') as f:
-                project_data = json.load(f)
-        else:
-            project_data = {"datasets": [], "models": [], "experiments": [], "optimizations": [], "runs": []}
-
-        existing_optimizations = project_data.get("optimizations", [])
-
-        # Check if optimization already exists
-        optimization_exists = any(o["optimize_method_name"] == optimize_method_name for o in existing_optimizations)
-        if not optimization_exists:
-            # Append new optimization
-            project_data["optimizations"].append(meta)
-        else:
-            # Update existing optimization
-            for idx, optimization in enumerate(existing_optimizations):
-                if optimization["optimize_method_name"] == optimize_method_name:
-                    project_data["optimizations"][idx] = meta
-                    break
-
-        # Save updated project.json
-        with open(project_json_path, 'w') as f:
-            json.dump(project_data, f, indent=4)
+        # Update the project store - replace the optimization if it exists, append it otherwise
+        get_store(session["user"], project_name).put("optimizations", meta)
 
         print(f"Optimization '{optimize_method_name}' saved successfully.")
 
@@ -137,15 +113,10 @@ def list_optimizations():
         if not project_name:
             raise ValueError("Project name is missing.")
 
-        project_json_path = f'./workspace/{session["user"]}/{project_name}/project.json'
+        store = get_store(session["user"], project_name)
 
-        # Load optimization information from project.json
-        if os.path.exists(project_json_path):
-            with open(project_json_path, 'r') as f:
-                project_data = json.load(f)
-                optimizations = project_data.get("optimizations", [])
-        else:
-            optimizations = []
+        # Load optimization information from the project store
+        optimizations = store.list("optimizations") if store.exists() else []
 
         print(f"Loaded optimizations: {optimizations}")
 
@@ -174,19 +145,13 @@ def delete_optimization():
         else:
             print(f"Optimization directory does not exist: {user_path}")
 
-        # Update project.json
-        project_json_path = f'./workspace/{session["user"]}/{project_name}/project.json'
-        if os.path.exists(project_json_path):
-            with open(project_json_path, 'r') as f:
-                project_data = json.load(f)
-
-            project_data["optimizations"] = [o for o in project_data.get("optimizations", []) if o["optimize_method_name"] != optimize_method_name]
-
-            with open(project_json_path, 'w') as f:
-                json.dump(project_data, f, indent=4)
-            print(f"Updated project.json after deleting optimization '{optimize_method_name}'")
+        # Update the project store
+        store = get_store(session["user"], project_name)
+        if store.exists():
+            store.delete("optimizations", optimize_method_name)
+            print(f"Updated project metadata after deleting optimization '{optimize_method_name}'")
         else:
-            print(f"project.json does not exist at: {project_json_path}")
+            print(f"Project metadata does not exist for: {project_name}")
 
         return jsonify({"message": f"Optimization '{optimize_method_name}' deleted successfully"})
     except Exception as e:
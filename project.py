@@ -1,9 +1,9 @@
 import os
 import shutil
 import re
-import json
 from flask import Blueprint, jsonify, request, session
 from auth import session_required
+from metadata import get_store
 
 # Define Blueprint
 project = Blueprint('project', __name__)
@@ -54,9 +54,7 @@ def create_project():
                 "optimizations": []
             }
 
-            json_path = os.path.join(project_directory, 'project.json')
-            with open(json_path, 'w') as f:
-                json.dump(project_json, f, indent=4)
+            get_store(user_name, project_name).create(project_json)
 
             # Update session with current project
             session['project'] = project_name
@@ -92,15 +90,12 @@ def get_project_json():
         if not project_name:
             return jsonify({'err': "No project selected.", 'res': {}})
 
-        project_json_path = f'./workspace/{session["user"]}/{project_name}/project.json'
+        store = get_store(session["user"], project_name)
 
-        if not os.path.exists(project_json_path):
+        if not store.exists():
             return jsonify({'err': "project.json not found.", 'res': {}})
 
-        with open(project_json_path, 'r') as f:
-            project_data = json.load(f)
-
-        return jsonify({'err': None, 'res': project_data})
+        return jsonify({'err': None, 'res': store.get_project()})
     except Exception as e:
         return jsonify({'err': f"Error reading project.json: {str(e)}", 'res': {}})
 
@@ -120,26 +115,18 @@ def update_project_json():
         if not project_name:
             raise ValueError("Project name is required.")
 
-        project_json_path = f'./workspace/{session["user"]}/{project_name}/project.json'
-
-        # Load existing project.json
-        with open(project_json_path, 'r') as f:
-            project_data = json.load(f)
+        store = get_store(session["user"], project_name)
+        if not store.exists():
+            raise FileNotFoundError(f"Project '{project_name}' not found.")
 
         # Perform the requested action
         if action == 'add':
-            if key in project_data and value not in project_data[key]:
-                project_data[key].append(value)
+            store.add_item(key, value)
         elif action == 'remove':
-            if key in project_data:
-                project_data[key] = [item for item in project_data[key] if item != value]
+            store.remove_item(key, value)
         else:
             raise ValueError("Invalid action specified.")
 
-        # Save updated project.json
-        with open(project_json_path, 'w') as f:
-            json.dump(project_data, f, indent=4)
-
         msg['res'] = "project.json updated successfully."
 
     except Exception as e:
@@ -1,51 +1,39 @@
 import os
-import json
 import shutil
 import subprocess
 import time
 import yaml
 import torch
-from threading import Lock
-from flask import Blueprint, jsonify, request, session, render_template, send_from_directory
+from flask import Blueprint, Response, jsonify, request, session, render_template, send_from_directory, stream_with_context
 from auth import session_required
+from metadata import get_store
+from snapshots import snapshot_tree, tree_digest, verify_snapshot
+from checkpoints import resumable_checkpoint
+from scheduler import (GPUManager, RunQueue, RunScheduler, RunSupervisor, STOP_GRACE_SECONDS, DATASET_CACHE_ROOT,
+                       popen_session_kwargs)
+from streaming import (LOG_DEFAULT_TAIL_LINES, LOG_TAIL_LINES_LIMIT, LOG_DEFAULT_MAX_BYTES, LOG_MAX_BYTES_LIMIT,
+                       read_log_delta, read_log_tail, stream_run_events)
 
 runs = Blueprint('runs', __name__, url_prefix='/runs')
 
-class GPUManager:
-    def __init__(self):
-        self.lock = Lock()
-        self.gpu_status = {i: False for i in range(torch.cuda.device_count())}
-
-    def allocate_gpus(self, num_gpus=1):
-        with self.lock:
-            available = [gpu_id for gpu_id, in_use in self.gpu_status.items() if not in_use]
-            if len(available) >= num_gpus:
-                allocated = available[:num_gpus]
-                for gpu_id in allocated:
-                    self.gpu_status[gpu_id] = True
-                return allocated
-            return None
-
-    def release_gpus(self, gpu_ids):
-        with self.lock:
-            for gpu_id in gpu_ids:
-                if gpu_id in self.gpu_status:
-                    self.gpu_status[gpu_id] = False
+# Engine-side modules the runs template and dataset packages import from the run directory
+ENGINE_MODULES = [
+    os.path.join('edgeai', 'engine', 'streaming_metrics.py'),
+    os.path.join('edgeai', 'engine', 'dataset_cache.py'),
+    os.path.join('edgeai', 'engine', 'batch_augment.py'),
+    os.path.join('edgeai', 'engine', 'shards.py'),
+    os.path.join('edgeai', 'engine', 'dataset_stats.py')
+]
 
-gpu_manager = GPUManager()
+# torch.compile (Inductor/Triton) caches, per project and model package content
+COMPILE_CACHE_DIR = '.compile_cache'
 
-def update_project_json(user, project_name, run_metadata):
-    workspace_dir = os.path.join('workspace', user, project_name)
-    project_json_path = os.path.join(workspace_dir, 'project.json')
-    
-    project_data = {"runs": []}
-    if os.path.exists(project_json_path):
-        with open(project_json_path, 'r') as f:
-            project_data = json.load(f)
+gpu_manager = GPUManager()
 
-    project_data["runs"].append(run_metadata)
-    with open(project_json_path, 'w') as f:
-        json.dump(project_data, f, indent=4)
+def copy_engine_modules(runs_dir):
+    """Place ENGINE_MODULES next to a run's engine.py"""
+    for path in ENGINE_MODULES:
+        shutil.copy(path, runs_dir)
 
 @runs.route('/get_file', methods=['GET'])
 @session_required
@@ -115,6 +103,7 @@ def create_run():
         engine_py_content = data['engine_py']
         config_yaml_content = data.get('config_yaml', '')
         num_gpus = data.get('num_gpus', 1)
+        memory_mb = data.get('memory_mb') or None
 
         workspace_dir = os.path.join('workspace', user, project_name)
         runs_dir = os.path.join(workspace_dir, 'runs', run_name)
@@ -131,11 +120,12 @@ def create_run():
             (os.path.join(workspace_dir, 'optimizations', optimization_name), os.path.join(runs_dir, 'optimization', optimization_name))
         ]:
             if os.path.exists(src):
-                shutil.copytree(src, dst)
+                snapshot_tree(src, dst)
                 open(os.path.join(os.path.dirname(dst), '__init__.py'), 'w').close()
 
         with open(os.path.join(runs_dir, 'engine.py'), 'w') as f:
             f.write(engine_py_content)
+        copy_engine_modules(runs_dir)
 
         if config_yaml_content.strip():
             with open(os.path.join(runs_dir, 'config.yaml'), 'w') as f:
@@ -150,10 +140,11 @@ def create_run():
             "status": "Not Running",
             "gpu_ids": [],
             "pid": None,
-            "num_gpus": num_gpus
+            "num_gpus": num_gpus,
+            "memory_mb": memory_mb
         }
 
-        update_project_json(user, project_name, run_metadata)
+        get_store(user, project_name).put("runs", run_metadata)
 
         return jsonify({"message": "Run created successfully."}), 201
 
@@ -174,15 +165,12 @@ def list_runs():
         if not user:
             return jsonify({"error": "User session is not set."}), 401
 
-        project_json_path = os.path.join('workspace', user, project_name, 'project.json')
+        store = get_store(user, project_name)
 
-        if not os.path.exists(project_json_path):
+        if not store.exists():
             return jsonify({"error": f"Project '{project_name}' not found for user '{user}'."}), 404
 
-        with open(project_json_path, 'r') as f:
-            project_data = json.load(f)
-
-        return jsonify({"runs": project_data.get("runs", [])}), 200
+        return jsonify({"runs": store.list("runs")}), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -191,62 +179,87 @@ def list_runs():
 # Remaining functions like start, stop, delete, logs, edit_run would follow similar modular refactoring, ensuring readability and reusability.
 
 
-@runs.route('/start', methods=['POST'])
-@session_required
-def start_run():
-    try:
-        data = request.get_json()
-        project_name = data.get("project_name")
-        run_name = data.get("run_name")
-        if not project_name or not run_name:
-            raise ValueError("Project name or run name is missing.")
+def starting_micro_batch_size(store, run):
+    """Micro-batch size a run starts at: its own last one, else the latest one
+    recorded for a run of the same model and dataset, else None (batch_size)"""
+    if run.get("micro_batch_size"):
+        return run["micro_batch_size"]
+    candidates = [
+        other for other in store.list("runs")
+        if other.get("micro_batch_size") and other.get("model_name") == run.get("model_name")
+        and other.get("dataset_name") == run.get("dataset_name")
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda other: other.get("finished_date") or "")["micro_batch_size"]
+
+def compile_cache_env(user, project_name, runs_dir, model_name):
+    """Cache directories for torch.compile shared by all runs of the same model package"""
+    model_dir = os.path.join(runs_dir, 'model', model_name or '')
+    if not model_name or not os.path.isdir(model_dir):
+        return {}
+    cache_dir = os.path.abspath(os.path.join('workspace', user, project_name, COMPILE_CACHE_DIR,
+                                             f"{model_name}-{tree_digest(model_dir)[:16]}"))
+    os.makedirs(cache_dir, exist_ok=True)
+    return {
+        'TORCHINDUCTOR_CACHE_DIR': cache_dir,
+        'TORCHINDUCTOR_FX_GRAPH_CACHE': '1',
+        'TORCHINDUCTOR_AUTOGRAD_CACHE': '1',
+        'TRITON_CACHE_DIR': os.path.join(cache_dir, 'triton')
+    }
+
+def launch_run(entry, device_ids):
+    """Start engine.py of a queued run on the devices the scheduler allocated"""
+    user, project_name, run_name = entry["user"], entry["project_name"], entry["run_name"]
+    runs_dir = os.path.join('workspace', user, project_name, 'runs', run_name)
+    log_file_path = os.path.join(runs_dir, 'logs', 'run.log')
+    config_yaml_path = os.path.join(runs_dir, 'config.yaml')
+    store = get_store(user, project_name)
 
-        user = session["user"]
-        workspace_dir = os.path.join('workspace', user, project_name)
-        runs_dir = os.path.join(workspace_dir, 'runs', run_name)
-        log_file_path = os.path.join(runs_dir, 'logs', 'run.log')
-
-        config_yaml_path = os.path.join(runs_dir, 'config.yaml')
-        engine_py_path = os.path.join(runs_dir, 'engine.py')
-
-        if not os.path.exists(engine_py_path):
-            return jsonify({"error": f"engine.py not found for run '{run_name}'"}), 400
-
-        # Read run metadata from project.json
-        project_json_path = os.path.join(workspace_dir, 'project.json')
-        if not os.path.exists(project_json_path):
-            return jsonify({"error": "Project not found."}), 404
-
-        with open(project_json_path, 'r') as f:
-            project_data = json.load(f)
-
-        run = next((r for r in project_data.get("runs", []) if r["run_name"] == run_name), None)
-        if not run:
-            return jsonify({"error": f"Run '{run_name}' not found."}), 404
-
-        if run["status"] == "Running":
-            return jsonify({"error": f"Run '{run_name}' is already running."}), 400
-
-        # Check GPU availability first
-        if not torch.cuda.is_available():
-            return jsonify({"error": "No CUDA-capable GPUs available on this system"}), 503
-
-        # Allocate GPUs based on run's num_gpus
-        num_gpus = run.get('num_gpus', 1)
-        gpu_ids = gpu_manager.allocate_gpus(num_gpus)
-        if gpu_ids is None:
-            available_gpus = sum(not in_use for in_use in gpu_manager.gpu_status.values())
-            return jsonify({"error": f"Requested {num_gpus} GPUs, but only {available_gpus} available."}), 503
-
-        # Set up environment variables for GPU
+    try:
+        if not os.path.exists(os.path.join(runs_dir, 'engine.py')):
+            raise FileNotFoundError(f"engine.py not found for run '{run_name}'")
+        run = store.get("runs", run_name) or {}
+        # Hardlinked package files share their inode with every other snapshot
+        for package in ('model', 'dataset', 'optimization'):
+            package_dir = os.path.join(runs_dir, package)
+            modified = verify_snapshot(package_dir) if os.path.isdir(package_dir) else []
+            if modified:
+                raise RuntimeError(f"Snapshot files of run '{run_name}' were modified in place: "
+                                   f"{', '.join(modified)}. Recreate the run from its packages.")
+
+        fields = gpu_manager.allocation_fields(device_ids, entry["memory_mb"])
+        gpu_ids = fields["gpu_ids"]
+
+        # Set up environment variables for GPU (empty on CPU slots)
         env = os.environ.copy()
         gpu_list = ','.join(map(str, gpu_ids))
         env['CUDA_VISIBLE_DEVICES'] = gpu_list
         env['NVIDIA_VISIBLE_DEVICES'] = gpu_list  # For container compatibility
-        
-        # Log GPU allocation
+        # Match the nvidia-smi numbering the memory readings come from
+        env['CUDA_DEVICE_ORDER'] = 'PCI_BUS_ID'
+        # Picked up by trainer.fit(ckpt_path=...) in the runs template
+        env.pop('EDGEAI_RESUME_CHECKPOINT', None)
+        if run.get("resume_checkpoint"):
+            env['EDGEAI_RESUME_CHECKPOINT'] = os.path.abspath(os.path.join(runs_dir, run["resume_checkpoint"]))
+        # Starting point of the template's micro-batch search
+        env.pop('EDGEAI_MICRO_BATCH_SIZE', None)
+        micro_batch_size = starting_micro_batch_size(store, run)
+        if micro_batch_size:
+            env['EDGEAI_MICRO_BATCH_SIZE'] = str(micro_batch_size)
+        env.update(compile_cache_env(user, project_name, runs_dir, run.get("model_name")))
+        env['EDGEAI_DATASET_CACHE'] = os.path.abspath(DATASET_CACHE_ROOT)
+
+        # Log device allocation
         with open(log_file_path, 'a') as log_file:
-            log_file.write(f"\nStarting run with GPUs: {gpu_list}\n")
+            if gpu_ids:
+                log_file.write(f"\nStarting run with GPUs: {gpu_list}\n")
+                if entry["memory_mb"]:
+                    log_file.write(f"Reserved GPU memory: {entry['memory_mb']} MB per GPU (shared placement)\n")
+            elif device_ids:
+                log_file.write(f"\nStarting run on CPU slot: {','.join(map(str, device_ids))}\n")
+            else:
+                log_file.write("\nStarting run on CPU (num_gpus: 0)\n")
             log_file.write(f"CUDA available: {torch.cuda.is_available()}\n")
             log_file.write(f"Number of GPUs allocated: {len(gpu_ids)}\n")
             for gpu_id in gpu_ids:
@@ -257,12 +270,12 @@ def start_run():
         if os.path.exists(config_yaml_path):
             with open(config_yaml_path, 'r') as f:
                 config = yaml.safe_load(f)
-            
+
             # Update GPU settings in config
             if 'training' not in config:
                 config['training'] = {}
             config['training']['num_gpus'] = len(gpu_ids)
-            
+
             with open(config_yaml_path, 'w') as f:
                 yaml.dump(config, f, default_flow_style=False)
 
@@ -275,27 +288,116 @@ def start_run():
                 stderr=subprocess.STDOUT,
                 env=env,
                 bufsize=1,
-                universal_newlines=True
+                universal_newlines=True,
+                **popen_session_kwargs()
             )
+    except Exception as e:
+        store.update("runs", run_name, {"status": "Failed", "error": str(e)})
+        raise
+
+    # Update the run's metadata
+    started_at = time.time()
+    fields.update({
+        "pid": process.pid,
+        "status": "Running",
+        "error": None,
+        "started_date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(started_at))
+    })
+    store.update("runs", run_name, fields)
+
+    # Tracked after the metadata is written so a fast exit is not overwritten with "Running"
+    run_supervisor.track(user, project_name, run_name, process, device_ids, started_at, entry["memory_mb"])
+
+
+run_scheduler = RunScheduler(gpu_manager, RunQueue(), launch_run)
+run_supervisor = RunSupervisor(run_scheduler)
+run_supervisor.recover()
+run_supervisor.start()
+run_scheduler.start()
+
+
+@runs.route('/start', methods=['POST'])
+@session_required
+def start_run():
+    """Submit a run to the scheduler
+
+    The run starts immediately if enough devices are free, otherwise it is
+    queued (status "Queued") and launched by the dispatcher later. An
+    optional integer "priority" moves it ahead of lower priority runs.
+    A stopped or failed run resumes from its latest checkpoint unless
+    "resume" is false.
+    """
+    try:
+        data = request.get_json()
+        project_name = data.get("project_name")
+        run_name = data.get("run_name")
+        priority = int(data.get("priority", 0))
+        if not project_name or not run_name:
+            raise ValueError("Project name or run name is missing.")
 
-        # Update the run's metadata
-        run["pid"] = process.pid
-        run["status"] = "Running"
-        run["gpu_ids"] = gpu_ids
+        user = session["user"]
+        workspace_dir = os.path.join('workspace', user, project_name)
+        runs_dir = os.path.join(workspace_dir, 'runs', run_name)
+        engine_py_path = os.path.join(runs_dir, 'engine.py')
+
+        if not os.path.exists(engine_py_path):
+            return jsonify({"error": f"engine.py not found for run '{run_name}'"}), 400
 
-        with open(project_json_path, 'w') as f:
-            json.dump(project_data, f, indent=4)
+        # Read run metadata from the project store
+        store = get_store(user, project_name)
+        if not store.exists():
+            return jsonify({"error": "Project not found."}), 404
+
+        with store.lock():
+            run = store.get("runs", run_name)
+            if not run:
+                return jsonify({"error": f"Run '{run_name}' not found."}), 404
+
+            if run["status"] in ("Running", "Queued", "Stopping"):
+                return jsonify({"error": f"Run '{run_name}' is already {run['status'].lower()}."}), 400
+
+            # Mark as queued before submitting; the dispatcher may launch it at once
+            previous_status = run["status"]
+            checkpoint = None
+            if previous_status in ("Stopped", "Failed", "Finished") and data.get("resume", True):
+                checkpoint = resumable_checkpoint(runs_dir)
+            store.update("runs", run_name, {
+                "status": "Queued",
+                "priority": priority,
+                "queued_date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "resume_checkpoint": os.path.relpath(checkpoint["path"], runs_dir) if checkpoint else None
+            })
+
+        num_gpus = run.get('num_gpus', 1)
+        memory_mb = run.get('memory_mb')
+        try:
+            status = run_scheduler.submit(user, project_name, run_name, num_gpus, priority, memory_mb)
+        except ValueError as e:
+            run_scheduler.cancel(user, project_name, run_name)
+            store.update("runs", run_name, {"status": previous_status})
+            return jsonify({"error": str(e)}), 400
+
+        run = store.get("runs", run_name)
+        resume_message = ""
+        if checkpoint:
+            resume_message = f" Resuming from epoch {checkpoint['epoch']}, step {checkpoint['global_step']}."
+        if status == "Queued":
+            position = run_scheduler.run_queue.position(user, project_name, run_name)
+            return jsonify({
+                "message": f"Run '{run_name}' queued, waiting for {gpu_manager.devices_needed(num_gpus)} "
+                           f"free {gpu_manager.device_type.upper()} device(s).{resume_message}",
+                "status": "Queued",
+                "queue_position": position
+            }), 202
 
         return jsonify({
-            "message": f"Run '{run_name}' started successfully.", 
-            "pid": process.pid, 
-            "gpu_ids": gpu_ids
+            "message": f"Run '{run_name}' started successfully.{resume_message}",
+            "status": "Running",
+            "pid": run.get("pid"),
+            "gpu_ids": run.get("gpu_ids", [])
         }), 200
 
     except Exception as e:
-        # If there was an error, make sure to release any allocated GPUs
-        if 'gpu_ids' in locals():
-            gpu_manager.release_gpus(gpu_ids)
         return jsonify({"error": str(e)}), 500
 
 @runs.route('/stop', methods=['POST'])
@@ -310,48 +412,48 @@ def stop_run():
             return jsonify({"error": "Project name or run name is missing."}), 400
 
         user = session["user"]
-        workspace_dir = os.path.join('workspace', user, project_name)
-        project_json_path = os.path.join(workspace_dir, 'project.json')
+        store = get_store(user, project_name)
 
-        if not os.path.exists(project_json_path):
+        if not store.exists():
             return jsonify({"error": "Project not found."}), 404
 
-        with open(project_json_path, 'r') as f:
-            project_data = json.load(f)
-
-        run = next((r for r in project_data.get("runs", []) if r["run_name"] == run_name), None)
+        run = store.get("runs", run_name)
         if not run:
             return jsonify({"error": f"Run '{run_name}' not found."}), 404
 
-        pid = run.get("pid")
-        gpu_ids = run.get("gpu_ids", [])
+        # A queued run only has to leave the queue
+        if run["status"] == "Queued":
+            run_scheduler.cancel(user, project_name, run_name)
+            store.update("runs", run_name, {"status": "Stopped"})
+            return jsonify({"message": f"Run '{run_name}' removed from the queue."}), 200
+
+        # Marked Stopping before the signal, and only while still Running: the
+        # supervisor records the exit under the same lock, so a run that exits
+        # right away is not put back to Stopping after it was marked Stopped
+        with store.lock():
+            run = store.get("runs", run_name) or run
+            pid = run.get("pid")
 
-        # If no PID or run isn't in "Running" state, just return a message instead of an error
-        if not pid or run["status"] != "Running":
-            return jsonify({"message": f"Run '{run_name}' is not currently running."}), 200
-
-        # If we do have a PID and it's running, attempt to kill the process
-        try:
-            if os.name == 'nt':
-                subprocess.call(['taskkill', '/F', '/PID', str(pid)])
-            else:
-                # On Unix-like systems, ProcessLookupError is raised if the process does not exist
-                os.kill(pid, 9)
-        except ProcessLookupError:
-            # The process is already gone, so just proceed as if it's stopped
-            pass
-        except Exception as e:
-            # If it's another type of error, you can log it or handle it as you see fit
-            print(f"Warning: Could not kill process {pid}: {e}")
-
-        # Release the GPUs and update run status as before
-        gpu_manager.release_gpus(gpu_ids)
-        run["pid"] = None
-        run["status"] = "Stopped"
-        run["gpu_ids"] = []
-
-        with open(project_json_path, 'w') as f:
-            json.dump(project_data, f, indent=4)
+            # If no PID or run isn't in "Running" state, just return a message instead of an error
+            if not pid or run["status"] not in ("Running", "Stopping"):
+                return jsonify({"message": f"Run '{run_name}' is not currently running."}), 200
+            if run["status"] == "Running":
+                store.update("runs", run_name, {"status": "Stopping"})
+
+        # SIGTERM to the run's process group lets the engine checkpoint; the
+        # supervisor escalates to SIGKILL after the grace period, then marks
+        # the run Stopped and releases its devices
+        grace = float(data.get("grace_seconds", STOP_GRACE_SECONDS))
+        if run_supervisor.terminate(user, project_name, run_name, pid, grace):
+            return jsonify({
+                "message": f"Stopping run '{run_name}', saving a checkpoint (up to {grace:.0f}s).",
+                "status": "Stopping"
+            }), 202
+
+        # Not supervised (the process is already gone); clean up as before
+        run_supervisor.release(user, project_name, run_name, run)
+        store.update("runs", run_name, {"pid": None, "status": "Stopped", "gpu_ids": [], "cpu_slots": [],
+                                        "gpu_memory_mb": None})
 
         return jsonify({"message": f"Run '{run_name}' stopped successfully."}), 200
 
@@ -362,30 +464,44 @@ def stop_run():
 @runs.route('/logs', methods=['GET'])
 @session_required
 def logs_run():
+    """Return run log lines incrementally
+
+    Query parameters:
+        offset: byte offset returned by the previous call; only complete lines
+                written after it are returned (at most max_bytes per call).
+        tail: number of lines to return from the end of the log (at most
+              LOG_TAIL_LINES_LIMIT).
+    Without offset the last LOG_DEFAULT_TAIL_LINES lines are returned. The
+    response's offset is the value to pass on the next poll.
+    """
     try:
         project_name = request.args.get("project_name")
         run_name = request.args.get("run_name")
-        print(f"Fetching logs for project: {project_name}, run: {run_name}")  # Debug log
+        offset = request.args.get("offset", type=int)
+        tail = request.args.get("tail", type=int)
+        max_bytes = request.args.get("max_bytes", LOG_DEFAULT_MAX_BYTES, type=int)
 
         if not project_name or not run_name:
             raise ValueError("Project name or run name is missing.")
 
+        if (offset is not None and offset < 0) or (tail is not None and tail < 0) or max_bytes <= 0:
+            return jsonify({"error": "offset, tail and max_bytes must not be negative."}), 400
+        max_bytes = min(max_bytes, LOG_MAX_BYTES_LIMIT)
+        if tail is not None:
+            tail = min(tail, LOG_TAIL_LINES_LIMIT)
+
         user = session["user"]
         runs_dir = os.path.join('workspace', user, project_name, 'runs', run_name)
         log_file_path = os.path.join(runs_dir, 'logs', 'run.log')
 
-        print(f"Looking for log file at: {log_file_path}")  # Debug log
-
         if not os.path.exists(log_file_path):
-            print(f"Log file not found: {log_file_path}")  # Debug log
             return jsonify({"error": f"Log file for run '{run_name}' does not exist."}), 404
 
-        with open(log_file_path, 'r', errors='replace') as f:
-            lines = [line.rstrip() for line in f.readlines()]
-            print(f"Read {len(lines)} lines from log file")  # Debug log
+        if offset is not None and tail is None:
+            response = read_log_delta(log_file_path, offset, max_bytes)
+        else:
+            response = read_log_tail(log_file_path, LOG_DEFAULT_TAIL_LINES if tail is None else tail)
 
-        response = {"lines": lines}
-        print(f"Sending response with {len(response['lines'])} lines")  # Debug log
         return jsonify(response), 200
 
     except Exception as e:
@@ -393,6 +509,35 @@ def logs_run():
         return jsonify({"error": str(e)}), 500
 
 
+@runs.route('/events', methods=['GET'])
+@session_required
+def run_events():
+    """Server-Sent Events stream of a run's log lines, progress and values
+
+    Events: "log" ({lines, offset, reset}), "progress" (changed fields) and
+    "values" (points appended per key). Pass the offset of a previous
+    /runs/logs call as log_offset to receive the lines written since then.
+    All clients of a run share a single file watcher.
+    """
+    project_name = request.args.get("project_name")
+    run_name = request.args.get("run_name")
+    log_offset = request.args.get("log_offset", type=int)
+
+    if not project_name or not run_name:
+        return jsonify({"error": "Project name or run name is missing."}), 400
+
+    user = session["user"]
+    runs_dir = os.path.join('workspace', user, project_name, 'runs', run_name)
+    if not os.path.isdir(runs_dir):
+        return jsonify({"error": f"Run '{run_name}' does not exist."}), 404
+
+    return Response(
+        stream_with_context(stream_run_events(runs_dir, log_offset)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 # Delete a run
 @runs.route('/delete', methods=['POST'])
 @session_required
@@ -407,32 +552,24 @@ def delete_run():
         user = session["user"]
         workspace_dir = os.path.join('workspace', user, project_name)
         runs_dir = os.path.join(workspace_dir, 'runs', run_name)
-        project_json_path = os.path.join(workspace_dir, 'project.json')
+        store = get_store(user, project_name)
 
-        # Check if run exists in project.json
-        if not os.path.exists(project_json_path):
+        # Check if run exists in the project store
+        if not store.exists():
             return jsonify({"error": "Project not found."}), 404
 
-        with open(project_json_path, 'r') as f:
-            project_data = json.load(f)
-
-        run = next((r for r in project_data.get("runs", []) if r["run_name"] == run_name), None)
+        run = store.get("runs", run_name)
         if not run:
             return jsonify({"error": f"Run '{run_name}' not found."}), 404
 
-        # If the run is running, stop it first
+        # Drop it from the scheduler queue, or stop it first if it is running
+        run_scheduler.cancel(user, project_name, run_name)
         pid = run.get("pid")
-        gpu_ids = run.get("gpu_ids", [])
         if pid:
             try:
-                if os.name == 'nt':
-                    subprocess.call(['taskkill', '/F', '/PID', str(pid)])
-                else:
-                    os.kill(pid, 9)
-                run["pid"] = None
-                run["status"] = "Stopped"
-                gpu_manager.release_gpus(gpu_ids)
-                run["gpu_ids"] = []
+                # The run directory goes away, so there is no point in a checkpoint
+                run_supervisor.terminate(user, project_name, run_name, pid, grace=0, wait=True)
+                run_supervisor.release(user, project_name, run_name, run)
             except Exception as e:
                 return jsonify({"error": f"Failed to terminate process with PID {pid}: {str(e)}"}), 500
 
@@ -440,11 +577,8 @@ def delete_run():
         if os.path.exists(runs_dir):
             shutil.rmtree(runs_dir)
 
-        # Remove run from project.json
-        project_data["runs"] = [r for r in project_data.get("runs", []) if r["run_name"] != run_name]
-
-        with open(project_json_path, 'w') as f:
-            json.dump(project_data, f, indent=4)
+        # Remove run from the project store
+        store.delete("runs", run_name)
 
         return jsonify({"message": f"Run '{run_name}' deleted successfully"}), 200
 
@@ -464,6 +598,7 @@ def edit_run():
         dataset_name = data.get("dataset_name")
         optimization_name = data.get("optimization_name")
         num_gpus = data.get("num_gpus", 1)
+        memory_mb = data.get("memory_mb") or None
         misc = data.get("misc", {})
         engine_py_content = data.get("engine_py")
         config_yaml_content = data.get("config_yaml")
@@ -478,18 +613,36 @@ def edit_run():
         if not os.path.exists(runs_dir):
             return jsonify({"error": f"Run '{original_run_name}' does not exist."}), 404
 
-        project_json_path = os.path.join(workspace_dir, 'project.json')
-        if not os.path.exists(project_json_path):
+        store = get_store(user, project_name)
+        if not store.exists():
             return jsonify({"error": "Project not found."}), 404
 
-        with open(project_json_path, 'r') as f:
-            project_data = json.load(f)
-
         # Find the run
-        run = next((r for r in project_data.get("runs", []) if r["run_name"] == original_run_name), None)
+        run = store.get("runs", original_run_name)
         if not run:
             return jsonify({"error": f"Run '{original_run_name}' not found."}), 404
 
+        # A queued run is taken off the queue; it has to be started again after editing
+        if run["status"] == "Queued":
+            run_scheduler.cancel(user, project_name, original_run_name)
+            run["status"] = "Not Running"
+
+        # If the run is running, stop it before applying changes
+        if run["status"] in ("Running", "Stopping"):
+            pid = run.get("pid")
+            if pid:
+                try:
+                    # Waits for the checkpoint (up to the grace period) so the edited run can resume
+                    run_supervisor.terminate(user, project_name, original_run_name, pid, wait=True)
+                    run_supervisor.release(user, project_name, original_run_name, run)
+                    run["pid"] = None
+                    run["status"] = "Stopped"
+                    run["gpu_ids"] = []
+                    run["cpu_slots"] = []
+                    run["gpu_memory_mb"] = None
+                except Exception as e:
+                    return jsonify({"error": f"Failed to terminate process with PID {pid}: {str(e)}"}), 500
+
         # If run name is changed, rename the directory
         if original_run_name != run_name:
             new_runs_dir = os.path.join(workspace_dir, 'runs', run_name)
@@ -507,12 +660,14 @@ def edit_run():
         run["dataset_name"] = dataset_name
         run["optimization_name"] = optimization_name
         run["num_gpus"] = num_gpus
+        run["memory_mb"] = memory_mb
         run["misc"] = misc
 
         # Save updated engine.py
         engine_py_path = os.path.join(runs_dir, 'engine.py')
         with open(engine_py_path, 'w') as f:
             f.write(engine_py_content)
+        copy_engine_modules(runs_dir)
 
         # Save updated config.yaml if provided
         if config_yaml_content:
@@ -520,26 +675,8 @@ def edit_run():
             with open(config_yaml_path, 'w') as f:
                 f.write(config_yaml_content)
 
-        # If the run is running, stop it before applying changes
-        if run["status"] == "Running":
-            pid = run.get("pid")
-            gpu_ids = run.get("gpu_ids", [])
-            if pid:
-                try:
-                    if os.name == 'nt':
-                        subprocess.call(['taskkill', '/F', '/PID', str(pid)])
-                    else:
-                        os.kill(pid, 9)
-                    run["pid"] = None
-                    run["status"] = "Stopped"
-                    gpu_manager.release_gpus(gpu_ids)
-                    run["gpu_ids"] = []
-                except Exception as e:
-                    return jsonify({"error": f"Failed to terminate process with PID {pid}: {str(e)}"}), 500
-
-        # Save project.json
-        with open(project_json_path, 'w') as f:
-            json.dump(project_data, f, indent=4)
+        # Save the run record (a single row, renamed if needed)
+        store.update("runs", original_run_name, run)
 
         return jsonify({"message": f"Run '{run_name}' updated successfully."}), 200
 
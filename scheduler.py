@@ -0,0 +1,770 @@
+import os
+import time
+import sqlite3
+import contextlib
+import signal
+import psutil
+import subprocess
+from threading import Condition, Lock, Thread
+
+from metadata import WORKSPACE_ROOT, get_store, iter_projects
+from checkpoints import latest_checkpoint, recorded_micro_batch_size
+from edgeai.engine.dataset_cache import evict_unused
+
+# Materialized dataset caches (edgeai/engine/dataset_cache.py), one per node:
+# runs, their ranks and DataLoader workers all map the same entries
+DATASET_CACHE_ROOT = os.path.join(WORKSPACE_ROOT, '.dataset_cache')
+
+# Concurrent runs allowed on a host without CUDA devices
+CPU_SLOTS = int(os.environ.get('EDGEAI_CPU_SLOTS', 1))
+
+# Seconds the head of the queue may wait while smaller runs behind it are
+# backfilled onto free devices; after that nothing overtakes it
+BACKFILL_HEAD_WAIT = float(os.environ.get('EDGEAI_BACKFILL_HEAD_WAIT', 600))
+
+
+# Memory kept free on every GPU on top of the runs' estimates (MB)
+GPU_MEMORY_HEADROOM_MB = int(os.environ.get('EDGEAI_GPU_MEMORY_HEADROOM_MB', 512))
+
+
+class GPUtilInventory:
+    """Live per-device memory readings (MB) from nvidia-smi through GPUtil"""
+    def __init__(self, num_gpus=None):
+        self.num_gpus = num_gpus
+
+    def devices(self):
+        try:
+            import GPUtil
+            gpus = GPUtil.getGPUs()
+        except Exception as e:
+            print(f"Could not read GPU memory: {e}")
+            gpus = []
+        devices = {gpu.id: {"total_mb": int(gpu.memoryTotal), "free_mb": int(gpu.memoryFree)} for gpu in gpus}
+        if self.num_gpus is not None and len(devices) != self.num_gpus:
+            # nvidia-smi unavailable or disagreeing with CUDA; fall back to
+            # CUDA totals and let reservations alone decide
+            import torch
+            devices = {}
+            for i in range(self.num_gpus):
+                total_mb = torch.cuda.get_device_properties(i).total_memory // (1024 * 1024)
+                devices[i] = {"total_mb": total_mb, "free_mb": None}
+        return devices
+
+
+class SimulatedInventory:
+    """Device inventory for exercising the allocator without hardware
+
+    SimulatedInventory([81920] * 4) describes four 80 GB GPUs. set_used()
+    simulates memory taken by processes outside the scheduler.
+    """
+    def __init__(self, totals_mb):
+        self.totals_mb = list(totals_mb)
+        self.used_mb = [0] * len(self.totals_mb)
+
+    def set_used(self, gpu_id, used_mb):
+        self.used_mb[gpu_id] = used_mb
+
+    def devices(self):
+        return {i: {"total_mb": total, "free_mb": total - used}
+                for i, (total, used) in enumerate(zip(self.totals_mb, self.used_mb))}
+
+
+class GPUManager:
+    """Tracks the memory reserved on each device and places runs on them
+
+    A run that declares an estimated footprint (memory_mb per device) can
+    share a GPU with other runs as long as the reservations fit. A device's
+    capacity is the smaller of its unreserved memory and the live free
+    memory reading, minus GPU_MEMORY_HEADROOM_MB. Runs without an estimate
+    get whole idle devices, as before.
+
+    Placement is best-fit: the device (or contiguous window of devices for
+    multi-GPU runs) with the least capacity left after placing the run.
+    Ties prefer devices that are already shared and idle devices from the
+    shortest idle stretch, keeping long idle stretches for multi-GPU runs.
+
+    On a host without CUDA devices the manager hands out CPU slots instead
+    (one per run, CPU_SLOTS in total), so runs are scheduled the same way.
+    """
+    def __init__(self, num_gpus=None, cpu_slots=CPU_SLOTS, inventory=None):
+        if inventory is None:
+            if num_gpus is None:
+                import torch
+                num_gpus = torch.cuda.device_count()
+            inventory = GPUtilInventory(num_gpus) if num_gpus > 0 else None
+        self.inventory = inventory
+        self.lock = Lock()
+
+        devices = inventory.devices() if inventory is not None else {}
+        self.device_type = 'gpu' if devices else 'cpu'
+        if devices:
+            self.total_mb = {gpu_id: device["total_mb"] for gpu_id, device in devices.items()}
+        else:
+            # A CPU slot is one indivisible unit
+            self.total_mb = {i: 1 for i in range(cpu_slots)}
+        self.reserved_mb = {gpu_id: 0 for gpu_id in self.total_mb}
+        self.gpu_status = {gpu_id: False for gpu_id in self.total_mb}
+
+    def devices_needed(self, num_gpus):
+        if self.device_type == 'cpu':
+            return 1
+        # num_gpus 0 is a CPU-only run on a GPU host: no device to reserve
+        return max(0, int(num_gpus))
+
+    def can_ever_allocate(self, num_gpus, memory_mb=None):
+        if self.devices_needed(num_gpus) > len(self.total_mb):
+            return False
+        if memory_mb and self.device_type == 'gpu':
+            fitting = sum(total - GPU_MEMORY_HEADROOM_MB >= memory_mb for total in self.total_mb.values())
+            return fitting >= self.devices_needed(num_gpus)
+        return True
+
+    def available(self):
+        with self.lock:
+            return sum(reserved == 0 for reserved in self.reserved_mb.values())
+
+    def _capacity(self, live):
+        """Memory (MB) that can still be reserved on each device"""
+        capacity = {}
+        for gpu_id, total in self.total_mb.items():
+            free = total - self.reserved_mb[gpu_id]
+            if self.device_type == 'gpu':
+                live_free = (live.get(gpu_id) or {}).get("free_mb")
+                if live_free is not None:
+                    free = min(free, live_free)
+                free -= GPU_MEMORY_HEADROOM_MB
+            capacity[gpu_id] = free
+        return capacity
+
+    def _idle_stretches(self):
+        """Length of the contiguous stretch of idle devices each idle device belongs to"""
+        stretches = {}
+        ids = sorted(self.total_mb)
+        i = 0
+        while i < len(ids):
+            if self.reserved_mb[ids[i]] != 0:
+                i += 1
+                continue
+            j = i
+            while j + 1 < len(ids) and ids[j + 1] == ids[j] + 1 and self.reserved_mb[ids[j + 1]] == 0:
+                j += 1
+            for gpu_id in ids[i:j + 1]:
+                stretches[gpu_id] = j - i + 1
+            i = j + 1
+        return stretches
+
+    def _place(self, num_devices, memory_mb, capacity):
+        """Pick device ids for a request, or None if it does not fit now"""
+        ids = sorted(self.total_mb)
+        exclusive = not memory_mb or self.device_type == 'cpu'
+        stretches = self._idle_stretches()
+
+        def fits(gpu_id):
+            if exclusive:
+                return self.reserved_mb[gpu_id] == 0
+            return capacity[gpu_id] >= memory_mb
+
+        def leftover(gpu_id):
+            return 0 if exclusive else capacity[gpu_id] - memory_mb
+
+        candidates = []
+        # Windows of consecutive device ids, so multi-GPU runs stay on
+        # neighbouring devices (same switch / NVLink domain on most hosts)
+        for i in range(len(ids) - num_devices + 1):
+            window = ids[i:i + num_devices]
+            if window[-1] - window[0] != num_devices - 1 or not all(fits(gpu_id) for gpu_id in window):
+                continue
+            score = (
+                sum(leftover(gpu_id) for gpu_id in window),
+                sum(stretches.get(gpu_id, 0) for gpu_id in window),
+                window[0]
+            )
+            candidates.append((score, window))
+        if not candidates and num_devices > 1:
+            # No contiguous window left; any fitting devices, tightest first
+            fitting = sorted((gpu_id for gpu_id in ids if fits(gpu_id)),
+                             key=lambda gpu_id: (leftover(gpu_id), stretches.get(gpu_id, 0), gpu_id))
+            if len(fitting) >= num_devices:
+                return sorted(fitting[:num_devices])
+            return None
+        if not candidates:
+            return None
+        return min(candidates)[1]
+
+    def live_devices(self):
+        """One nvidia-smi reading of the devices, empty on CPU hosts"""
+        return self.inventory.devices() if self.device_type == 'gpu' else {}
+
+    def allocate_gpus(self, num_gpus=1, memory_mb=None, live=None):
+        """Reserve devices for a run, returns their ids or None if it does not fit now
+
+        memory_mb is the run's estimated footprint per device; without it
+        the run gets whole idle devices. live is a live_devices() reading
+        to reuse, e.g. one per dispatch pass; it is taken here if omitted.
+        """
+        num_devices = self.devices_needed(num_gpus)
+        if num_devices == 0:
+            return []
+        if live is None:
+            live = self.live_devices()
+        with self.lock:
+            allocated = self._place(num_devices, memory_mb, self._capacity(live))
+            if allocated is None:
+                return None
+            self._reserve(allocated, memory_mb)
+            return allocated
+
+    def _reserve(self, gpu_ids, memory_mb):
+        for gpu_id in gpu_ids:
+            if gpu_id not in self.total_mb:
+                continue
+            if memory_mb and self.device_type == 'gpu':
+                self.reserved_mb[gpu_id] += memory_mb
+            else:
+                self.reserved_mb[gpu_id] = self.total_mb[gpu_id]
+            self.gpu_status[gpu_id] = True
+
+    def mark_in_use(self, gpu_ids, memory_mb=None):
+        """Claim specific devices, e.g. those of runs that survived a server restart"""
+        with self.lock:
+            self._reserve(gpu_ids, memory_mb)
+
+    def release_gpus(self, gpu_ids, memory_mb=None):
+        with self.lock:
+            for gpu_id in gpu_ids:
+                if gpu_id not in self.total_mb:
+                    continue
+                if memory_mb and self.device_type == 'gpu':
+                    self.reserved_mb[gpu_id] = max(0, self.reserved_mb[gpu_id] - memory_mb)
+                else:
+                    self.reserved_mb[gpu_id] = 0
+                self.gpu_status[gpu_id] = self.reserved_mb[gpu_id] > 0
+
+    def allocation_fields(self, device_ids, memory_mb=None):
+        """Run metadata fields recording an allocation"""
+        if self.device_type == 'cpu':
+            return {"gpu_ids": [], "cpu_slots": device_ids, "gpu_memory_mb": None}
+        return {"gpu_ids": device_ids, "cpu_slots": [], "gpu_memory_mb": memory_mb or None}
+
+    def allocated_devices(self, run):
+        key = "cpu_slots" if self.device_type == 'cpu' else "gpu_ids"
+        return run.get(key) or []
+
+    def allocated_memory(self, run):
+        return run.get("gpu_memory_mb")
+
+
+class RunQueue:
+    """Pending runs of every user, persisted in workspace/queue.db
+
+    Entries are ordered by priority (higher first), then submission order.
+    """
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(WORKSPACE_ROOT, 'queue.db')
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS queue ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, user TEXT NOT NULL, project_name TEXT NOT NULL, '
+                'run_name TEXT NOT NULL, num_gpus INTEGER NOT NULL, priority INTEGER NOT NULL, '
+                'queued_at REAL NOT NULL, memory_mb INTEGER, UNIQUE (user, project_name, run_name))'
+            )
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(queue)')]
+            if 'memory_mb' not in columns:
+                conn.execute('ALTER TABLE queue ADD COLUMN memory_mb INTEGER')
+            conn.execute('CREATE INDEX IF NOT EXISTS queue_order ON queue (priority DESC, id)')
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode = WAL')
+            yield conn
+        finally:
+            conn.close()
+
+    def push(self, user, project_name, run_name, num_gpus, priority=0, memory_mb=None):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO queue (user, project_name, run_name, num_gpus, priority, queued_at, memory_mb) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (user, project_name, run_name, int(num_gpus), int(priority), time.time(),
+                 int(memory_mb) if memory_mb else None)
+            )
+
+    def remove(self, user, project_name, run_name):
+        with self._connect() as conn:
+            cursor = conn.execute('DELETE FROM queue WHERE user = ? AND project_name = ? AND run_name = ?',
+                                  (user, project_name, run_name))
+            return cursor.rowcount > 0
+
+    def entries(self):
+        with self._connect() as conn:
+            rows = conn.execute('SELECT id, user, project_name, run_name, num_gpus, priority, queued_at, memory_mb '
+                                'FROM queue ORDER BY priority DESC, id').fetchall()
+        keys = ("id", "user", "project_name", "run_name", "num_gpus", "priority", "queued_at", "memory_mb")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def position(self, user, project_name, run_name):
+        for i, entry in enumerate(self.entries()):
+            if (entry["user"], entry["project_name"], entry["run_name"]) == (user, project_name, run_name):
+                return i
+        return None
+
+
+class RunScheduler:
+    """Admits queued runs onto free devices
+
+    Admission is FIFO by priority with backfill: when the head of the queue
+    does not fit, later runs that fit the free devices may start first,
+    until the head has waited BACKFILL_HEAD_WAIT seconds. A dispatcher
+    thread re-evaluates the queue whenever devices are released, a run is
+    submitted, or every `interval` seconds.
+
+    launcher(entry, device_ids) starts the run and records its metadata
+    (entry["memory_mb"] is the per-device reservation it was placed with);
+    if it raises, the devices are released and the entry is dropped.
+    """
+    def __init__(self, gpu_manager, run_queue, launcher, interval=5.0):
+        self.gpu_manager = gpu_manager
+        self.run_queue = run_queue
+        self.launcher = launcher
+        self.interval = interval
+        self.cond = Condition()
+        self.dispatch_lock = Lock()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = Thread(target=self._loop, daemon=True)
+            self.thread.start()
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                self.cond.wait(self.interval)
+            try:
+                self.dispatch()
+            except Exception as e:
+                print(f"Run dispatcher error: {e}")
+
+    def wake(self):
+        with self.cond:
+            self.cond.notify_all()
+
+    def submit(self, user, project_name, run_name, num_gpus=1, priority=0, memory_mb=None):
+        """Queue a run and try to start it right away
+
+        Returns "Running" if it was launched by this call and "Queued" if it
+        waits for devices. Launch errors of this run are re-raised.
+        """
+        if not self.gpu_manager.can_ever_allocate(num_gpus, memory_mb):
+            if memory_mb:
+                raise ValueError(f"Requested {num_gpus} GPUs with {memory_mb} MB each, but this host "
+                                 f"does not have enough GPUs that large.")
+            raise ValueError(f"Requested {num_gpus} GPUs, but this host only has "
+                             f"{len(self.gpu_manager.gpu_status)}.")
+        self.run_queue.push(user, project_name, run_name, num_gpus, priority, memory_mb)
+        results = self.dispatch()
+        key = (user, project_name, run_name)
+        if key in results:
+            if results[key] is not None:
+                raise results[key]
+            return "Running"
+        return "Queued"
+
+    def cancel(self, user, project_name, run_name):
+        """Remove a run from the queue, returns False if it was not queued"""
+        return self.run_queue.remove(user, project_name, run_name)
+
+    def release(self, run):
+        """Free the devices recorded in a run's metadata and wake the dispatcher"""
+        self.release_devices(self.gpu_manager.allocated_devices(run), self.gpu_manager.allocated_memory(run))
+
+    def release_devices(self, device_ids, memory_mb=None):
+        self.gpu_manager.release_gpus(device_ids, memory_mb)
+        self.wake()
+
+    def dispatch(self):
+        """One admission pass, returns {(user, project, run): error or None} for launched runs"""
+        results = {}
+        with self.dispatch_lock:
+            blocked_since = None
+            entries = self.run_queue.entries()
+            # One device reading per pass rather than one nvidia-smi call per queued run
+            live = self.gpu_manager.live_devices() if entries else {}
+            for entry in entries:
+                if blocked_since is not None and time.time() - blocked_since > BACKFILL_HEAD_WAIT:
+                    # Drain devices for the oldest blocked run instead of backfilling
+                    break
+
+                device_ids = self.gpu_manager.allocate_gpus(entry["num_gpus"], entry["memory_mb"], live)
+                if device_ids is None:
+                    if blocked_since is None:
+                        blocked_since = entry["queued_at"]
+                    continue
+
+                key = (entry["user"], entry["project_name"], entry["run_name"])
+                self.run_queue.remove(*key)
+                try:
+                    self.launcher(entry, device_ids)
+                    results[key] = None
+                except Exception as e:
+                    self.gpu_manager.release_gpus(device_ids, entry["memory_mb"])
+                    print(f"Failed to launch queued run {'/'.join(key)}: {e}")
+                    results[key] = e
+        return results
+
+
+# Seconds a stopped run gets to checkpoint after SIGTERM before SIGKILL
+STOP_GRACE_SECONDS = float(os.environ.get('EDGEAI_STOP_GRACE_SECONDS', 30))
+
+# signal.SIGKILL does not exist on Windows, where taskkill /F is used instead
+SIGKILL = getattr(signal, 'SIGKILL', None)
+
+
+def popen_session_kwargs():
+    """Popen arguments that start a run in its own session / process group
+
+    Every process the run spawns (DDP ranks, DataLoader workers) inherits
+    the group, so the whole tree can be signalled at once.
+    """
+    if os.name == 'nt':
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def signal_process_tree(pid, sig):
+    """Send sig to pid and everything it spawned, returns False if nothing was alive"""
+    if os.name == 'nt':
+        # taskkill /T walks the tree; anything but SIGTERM forces it
+        command = ['taskkill', '/T', '/PID', str(pid)]
+        if sig != signal.SIGTERM:
+            command.insert(1, '/F')
+        return subprocess.call(command) == 0
+    if _is_group_leader(pid):
+        # Started by popen_session_kwargs()
+        try:
+            os.killpg(pid, sig)
+            return True
+        except ProcessLookupError:
+            return False
+    # Started without its own group (e.g. by an older server); walk the tree
+    try:
+        parent = psutil.Process(pid)
+        processes = parent.children(recursive=True) + [parent]
+    except psutil.Error:
+        return False
+    for process in processes:
+        try:
+            process.send_signal(sig)
+        except psutil.Error:
+            pass
+    return True
+
+
+def wait_process_tree(pid, timeout):
+    """Wait until pid and its descendants exit, returns False on timeout"""
+    try:
+        parent = psutil.Process(pid)
+        processes = [parent] + parent.children(recursive=True)
+    except psutil.Error:
+        return True
+    _, alive = psutil.wait_procs(processes, timeout=timeout)
+    return not alive
+
+
+def _is_group_leader(pid):
+    if os.name == 'nt':
+        return False
+    try:
+        return os.getpgid(pid) == pid
+    except ProcessLookupError:
+        return False
+
+
+def _kill_process_group(pgid):
+    """SIGKILL whatever is left of a run's process group after its main process exited"""
+    if os.name == 'nt':
+        return
+    try:
+        os.killpg(pgid, SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _process_tree_rss(pid):
+    """Resident memory of a process and all of its children (DDP ranks, DataLoader workers)"""
+    try:
+        parent = psutil.Process(pid)
+        processes = [parent] + parent.children(recursive=True)
+    except psutil.Error:
+        return 0
+    rss = 0
+    for process in processes:
+        try:
+            rss += process.memory_info().rss
+        except psutil.Error:
+            pass
+    return rss
+
+
+class AdoptedProcess:
+    """Handle for a run process started by a previous server instance
+
+    It is not our child, so its exit code cannot be read; only whether it
+    is still alive.
+    """
+    def __init__(self, pid):
+        self.pid = pid
+        self.process = psutil.Process(pid)
+
+    def is_alive(self):
+        try:
+            return self.process.is_running() and self.process.status() != psutil.STATUS_ZOMBIE
+        except psutil.Error:
+            return False
+
+
+def _exit_status(process):
+    """(exited, returncode) of a Popen or AdoptedProcess, returncode None if unknown"""
+    if isinstance(process, AdoptedProcess):
+        return not process.is_alive(), None
+    returncode = process.poll()
+    return returncode is not None, returncode
+
+
+class RunSupervisor:
+    """Owns the processes of running runs and reaps them when they exit
+
+    Every `interval` seconds each supervised process is polled and its
+    process tree's RSS sampled. When a run exits, its metadata gets the exit
+    code, duration and peak RSS, its status becomes "Completed" (exit code
+    0), "Failed" (non-zero), "Stopped" (after terminate()) or "Finished"
+    (exit code unknown, for runs adopted after a restart), and its devices
+    are released right away. Processes the run left behind in its process
+    group are killed.
+    """
+    def __init__(self, run_scheduler, interval=1.0):
+        self.run_scheduler = run_scheduler
+        self.interval = interval
+        self.lock = Lock()
+        self.processes = {}
+        self.orphans = []
+        self.thread = None
+        # Dataset cache eviction runs off the polling thread, one sweep at a time
+        self.eviction_thread = None
+        self.eviction_pending = False
+
+    def start(self):
+        if self.thread is None:
+            self.thread = Thread(target=self._loop, daemon=True)
+            self.thread.start()
+
+    def _request_eviction(self):
+        with self.lock:
+            self.eviction_pending = True
+            if self.eviction_thread is not None and self.eviction_thread.is_alive():
+                # The running sweep picks the request up when it finishes
+                return
+            self.eviction_thread = Thread(target=self._evict_loop, daemon=True)
+            self.eviction_thread.start()
+
+    def _evict_loop(self):
+        while True:
+            with self.lock:
+                if not self.eviction_pending:
+                    self.eviction_thread = None
+                    return
+                self.eviction_pending = False
+            try:
+                evicted = evict_unused(os.path.abspath(DATASET_CACHE_ROOT))
+                if evicted:
+                    print(f"Evicted unused dataset cache entries: {', '.join(evicted)}")
+            except Exception as e:
+                print(f"Failed to evict dataset cache entries: {e}")
+
+    def track(self, user, project_name, run_name, process, device_ids, started_at=None, memory_mb=None,
+              process_group=True):
+        with self.lock:
+            self.processes[(user, project_name, run_name)] = {
+                "process": process,
+                "device_ids": list(device_ids),
+                "memory_mb": memory_mb,
+                "started_at": started_at or time.time(),
+                "peak_rss": 0,
+                "process_group": process_group,
+                "kill_deadline": None
+            }
+
+    def terminate(self, user, project_name, run_name, pid, grace=STOP_GRACE_SECONDS, wait=False):
+        """Stop a run's whole process tree: SIGTERM now, SIGKILL after grace seconds
+
+        The engine checkpoints on SIGTERM. With wait=False the escalation and
+        reaping happen in poll() and the run ends as "Stopped"; the return
+        value tells whether the run was supervised at all. With wait=True the
+        call blocks until the tree is gone (for delete and edit), and the
+        caller releases the devices.
+        """
+        key = (user, project_name, run_name)
+        with self.lock:
+            tracked = self.processes.get(key)
+            if tracked is not None:
+                tracked["stop_requested"] = True
+                deadline = time.time() + grace
+                if tracked["kill_deadline"] is None or deadline < tracked["kill_deadline"]:
+                    tracked["kill_deadline"] = deadline
+
+        signal_process_tree(pid, signal.SIGTERM if grace > 0 else SIGKILL)
+        if wait and not wait_process_tree(pid, grace):
+            print(f"Run {'/'.join(key)} did not exit within {grace}s, killing it")
+            signal_process_tree(pid, SIGKILL)
+            wait_process_tree(pid, 5)
+        return tracked is not None
+
+    def release(self, user, project_name, run_name, run=None):
+        """Stop supervising a run that a user stopped or deleted and free its devices
+
+        Devices are released exactly once, whichever of this call and the
+        exit of the process comes first. Untracked runs fall back to the
+        devices recorded in `run`.
+        """
+        with self.lock:
+            tracked = self.processes.pop((user, project_name, run_name), None)
+            if tracked is not None:
+                # Still reaped by the loop so no zombie is left behind
+                self.orphans.append(tracked["process"])
+        if tracked is not None:
+            self.run_scheduler.release_devices(tracked["device_ids"], tracked["memory_mb"])
+        elif run is not None:
+            self.run_scheduler.release(run)
+
+    def _loop(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Run supervisor error: {e}")
+            time.sleep(self.interval)
+
+    def poll(self):
+        with self.lock:
+            self.orphans = [p for p in self.orphans if not _exit_status(p)[0]]
+            items = list(self.processes.items())
+
+        for key, tracked in items:
+            process = tracked["process"]
+            exited, returncode = _exit_status(process)
+            if not exited:
+                tracked["peak_rss"] = max(tracked["peak_rss"], _process_tree_rss(process.pid))
+                if tracked["kill_deadline"] is not None and time.time() > tracked["kill_deadline"]:
+                    print(f"Run {'/'.join(key)} did not stop within its grace period, killing it")
+                    signal_process_tree(process.pid, SIGKILL)
+                    tracked["kill_deadline"] = None
+                continue
+
+            if tracked["process_group"]:
+                # DDP ranks or DataLoader workers orphaned by the main process
+                _kill_process_group(process.pid)
+
+            with self.lock:
+                if self.processes.get(key) is not tracked:
+                    # Released by a user request in the meantime
+                    continue
+                del self.processes[key]
+
+            self.run_scheduler.release_devices(tracked["device_ids"], tracked["memory_mb"])
+            self._record_exit(key, tracked, returncode)
+
+    def _record_exit(self, key, tracked, returncode):
+        user, project_name, run_name = key
+        if tracked.get("stop_requested"):
+            status = "Stopped"
+        elif returncode is None:
+            status = "Finished"
+        else:
+            status = "Completed" if returncode == 0 else "Failed"
+        fields = {
+            "status": status,
+            "pid": None,
+            "gpu_ids": [],
+            "cpu_slots": [],
+            "gpu_memory_mb": None,
+            "exit_code": returncode,
+            "finished_date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "duration_sec": round(time.time() - tracked["started_at"], 1),
+            "peak_rss_mb": round(tracked["peak_rss"] / (1024 * 1024), 1)
+        }
+        runs_dir = os.path.join(WORKSPACE_ROOT, user, project_name, 'runs', run_name)
+        checkpoint = latest_checkpoint(runs_dir)
+        if checkpoint:
+            fields["checkpoint_epoch"] = checkpoint["epoch"]
+            fields["checkpoint_step"] = checkpoint["global_step"]
+        # Next start of this run (or a new one of the same model) begins there
+        micro_batch_size = recorded_micro_batch_size(runs_dir)
+        if micro_batch_size:
+            fields["micro_batch_size"] = micro_batch_size
+        try:
+            store = get_store(user, project_name)
+            if store.exists():
+                # Same lock as stop_run's Running -> Stopping check
+                with store.lock():
+                    store.update("runs", run_name, fields)
+        except Exception as e:
+            print(f"Failed to record exit of run {'/'.join(key)}: {e}")
+        # The run no longer references its dataset cache entries; sweeping
+        # them can take a while and must not hold up reaping other runs
+        self._request_eviction()
+
+    def recover(self):
+        """Rebuild device state from runs still marked Running or Stopping after a server restart
+
+        Runs whose engine.py process is still alive are adopted and their
+        devices claimed; the others are marked Finished, or Stopped if they
+        were being stopped. Adopted Stopping runs get SIGTERM again with a
+        fresh grace period, since the escalation deadline was lost.
+        """
+        gpu_manager = self.run_scheduler.gpu_manager
+        for user, project_name in iter_projects():
+            store = get_store(user, project_name)
+            if not store.exists():
+                continue
+            for run in store.list_by_status("runs", "Running") + store.list_by_status("runs", "Stopping"):
+                device_ids = gpu_manager.allocated_devices(run)
+                memory_mb = gpu_manager.allocated_memory(run)
+                stopping = run["status"] == "Stopping"
+                process = self._adopt(run.get("pid"))
+                if process is None:
+                    store.update("runs", run["run_name"], {
+                        "status": "Stopped" if stopping else "Finished",
+                        "pid": None,
+                        "gpu_ids": [],
+                        "cpu_slots": [],
+                        "gpu_memory_mb": None,
+                        "exit_code": None,
+                        "error": "Run exited while the web server was down."
+                    })
+                    continue
+                gpu_manager.mark_in_use(device_ids, memory_mb)
+                self.track(user, project_name, run["run_name"], process, device_ids,
+                           started_at=process.process.create_time(), memory_mb=memory_mb,
+                           process_group=_is_group_leader(process.pid))
+                if stopping:
+                    self.terminate(user, project_name, run["run_name"], process.pid)
+
+    @staticmethod
+    def _adopt(pid):
+        if not pid:
+            return None
+        try:
+            process = AdoptedProcess(pid)
+            cmdline = process.process.cmdline()
+        except psutil.AccessDenied:
+            # Alive but not inspectable; trust the recorded PID
+            return process
+        except psutil.Error:
+            return None
+        # Guard against the PID having been reused by an unrelated process
+        if not any(part.endswith('engine.py') for part in cmdline):
+            return None
+        return process
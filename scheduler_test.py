@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import scheduler
+from scheduler import GPUManager, RunQueue, RunScheduler, SimulatedInventory, GPU_MEMORY_HEADROOM_MB
+
+
+class CountingInventory(SimulatedInventory):
+    def __init__(self, totals_mb):
+        super().__init__(totals_mb)
+        self.reads = 0
+
+    def devices(self):
+        self.reads += 1
+        return super().devices()
+
+
+class GPUManagerTest(unittest.TestCase):
+    def test_whole_devices_without_estimate(self):
+        manager = GPUManager(inventory=SimulatedInventory([16000] * 4))
+        pair = manager.allocate_gpus(2)
+        self.assertEqual(len(pair), 2)
+        self.assertEqual(pair[1] - pair[0], 1)
+        rest = manager.allocate_gpus(2)
+        self.assertEqual(sorted(pair + rest), [0, 1, 2, 3])
+        self.assertIsNone(manager.allocate_gpus(1))
+        manager.release_gpus(pair)
+        self.assertEqual(manager.available(), 2)
+
+    def test_best_fit_packs_estimated_runs(self):
+        manager = GPUManager(inventory=SimulatedInventory([10000, 10000]))
+        first = manager.allocate_gpus(1, memory_mb=4000)
+        # The device already holding a run is the tighter fit
+        self.assertEqual(manager.allocate_gpus(1, memory_mb=4000), first)
+        other = manager.allocate_gpus(1, memory_mb=4000)
+        self.assertNotEqual(other, first)
+        self.assertIsNone(manager.allocate_gpus(1, memory_mb=10000 - GPU_MEMORY_HEADROOM_MB + 1))
+
+    def test_live_usage_limits_capacity(self):
+        inventory = SimulatedInventory([10000, 10000])
+        manager = GPUManager(inventory=inventory)
+        inventory.set_used(0, 9000)
+        self.assertEqual(manager.allocate_gpus(1, memory_mb=4000), [1])
+
+    def test_zero_gpus_is_an_empty_allocation(self):
+        manager = GPUManager(inventory=SimulatedInventory([16000] * 2))
+        self.assertEqual(manager.allocate_gpus(0), [])
+        self.assertEqual(manager.available(), 2)
+        self.assertTrue(manager.can_ever_allocate(0))
+
+    def test_can_ever_allocate(self):
+        manager = GPUManager(inventory=SimulatedInventory([16000] * 2))
+        self.assertTrue(manager.can_ever_allocate(2))
+        self.assertFalse(manager.can_ever_allocate(3))
+        self.assertFalse(manager.can_ever_allocate(1, memory_mb=16000))
+
+    def test_cpu_slots(self):
+        manager = GPUManager(num_gpus=0, cpu_slots=2)
+        self.assertEqual(manager.device_type, 'cpu')
+        slots = [manager.allocate_gpus(1), manager.allocate_gpus(4)]
+        self.assertEqual(sorted(slot for ids in slots for slot in ids), [0, 1])
+        self.assertIsNone(manager.allocate_gpus(1))
+
+
+class RunSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.queue = RunQueue(os.path.join(self.directory, 'queue.db'))
+        self.inventory = CountingInventory([16000] * 2)
+        self.manager = GPUManager(inventory=self.inventory)
+        self.launched = []
+        self.scheduler = RunScheduler(self.manager, self.queue,
+                                      lambda entry, device_ids: self.launched.append((entry["run_name"], device_ids)))
+
+    def test_backfills_behind_a_blocked_head(self):
+        self.manager.allocate_gpus(1)
+        self.queue.push('u', 'p', 'big', 2)
+        self.queue.push('u', 'p', 'small', 1)
+        self.scheduler.dispatch()
+        self.assertEqual([name for name, _ in self.launched], ['small'])
+        self.assertEqual([entry["run_name"] for entry in self.queue.entries()], ['big'])
+
+    def test_head_stops_backfill_after_waiting(self):
+        self.manager.allocate_gpus(1)
+        self.queue.push('u', 'p', 'big', 2)
+        self.queue.push('u', 'p', 'small', 1)
+        with mock.patch.object(scheduler, 'BACKFILL_HEAD_WAIT', -1):
+            self.scheduler.dispatch()
+        self.assertEqual(self.launched, [])
+
+    def test_priority_order(self):
+        self.queue.push('u', 'p', 'low', 2)
+        self.queue.push('u', 'p', 'high', 2, priority=5)
+        self.scheduler.dispatch()
+        self.assertEqual([name for name, _ in self.launched], ['high'])
+
+    def test_failed_launch_releases_devices(self):
+        def fail(entry, device_ids):
+            raise RuntimeError("engine.py missing")
+        self.scheduler.launcher = fail
+        self.queue.push('u', 'p', 'broken', 2)
+        results = self.scheduler.dispatch()
+        self.assertIsInstance(results[('u', 'p', 'broken')], RuntimeError)
+        self.assertEqual(self.manager.available(), 2)
+        self.assertEqual(self.queue.entries(), [])
+
+    def test_one_inventory_read_per_pass(self):
+        for i in range(5):
+            self.queue.push('u', 'p', f'run{i}', 1, memory_mb=1000)
+        reads = self.inventory.reads
+        self.scheduler.dispatch()
+        self.assertEqual(self.inventory.reads - reads, 1)
+        self.assertEqual(len(self.launched), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import shutil
+import tempfile
+import unittest
+import importlib.util
+
+HAS_TORCH = importlib.util.find_spec('torch') is not None and importlib.util.find_spec('numpy') is not None
+if HAS_TORCH:
+    import numpy as np
+    from edgeai.engine.shards import ShardedDataset, from_numpy
+
+
+def record_owners(counts, readers):
+    """How many readers read each record of shards with the given record counts"""
+    shards = [{"name": f"s{i}", "count": count} for i, count in enumerate(counts)]
+    seen = {(shard["name"], record): 0 for shard in shards for record in range(shard["count"])}
+    for reader in range(readers):
+        for shard, index, parts in ShardedDataset._parts(shards, readers, reader):
+            start, end = shard["count"] * index // parts, shard["count"] * (index + 1) // parts
+            for record in range(start, end):
+                seen[(shard["name"], record)] += 1
+    return seen
+
+
+@unittest.skipUnless(HAS_TORCH, "needs numpy and torch")
+class PartsTest(unittest.TestCase):
+    def test_every_record_read_once(self):
+        for counts in ([10] * 8, [10] * 3, [7, 3, 12, 1, 9], [5], [0, 4]):
+            for readers in (1, 2, 3, 4, 8, 16):
+                owners = record_owners(counts, readers)
+                self.assertEqual(set(owners.values()) or {1}, {1}, (counts, readers))
+
+    def test_whole_shards_when_they_divide_evenly(self):
+        shards = [{"name": f"s{i}", "count": 10} for i in range(4)]
+        for reader in range(2):
+            self.assertTrue(all(parts == 1 for _, _, parts in ShardedDataset._parts(shards, 2, reader)))
+
+    def test_part_count(self):
+        shard = {"count": 10}
+        self.assertEqual([ShardedDataset._part_count((shard, i, 3)) for i in range(3)], [3, 3, 4])
+
+
+@unittest.skipUnless(HAS_TORCH, "needs numpy and torch")
+class QuotasTest(unittest.TestCase):
+    def test_sums_to_per_rank(self):
+        for per_rank, counts in ((100, [30, 30, 40]), (7, [1, 1, 1]), (10, [0, 0, 0]), (5, [9])):
+            self.assertEqual(sum(ShardedDataset._quotas(per_rank, counts)), per_rank)
+
+    def test_proportional_and_remainder_to_largest(self):
+        self.assertEqual(ShardedDataset._quotas(10, [5, 5, 10]), [2, 2, 6])
+        quotas = ShardedDataset._quotas(11, [2, 2, 7])
+        self.assertEqual(quotas[2], max(quotas))
+        self.assertEqual(sum(quotas), 11)
+
+    def test_workers_without_records_get_nothing(self):
+        self.assertEqual(ShardedDataset._quotas(9, [0, 5, 4, 0]), [0, 5, 4, 0])
+        self.assertEqual(ShardedDataset._quotas(10, [0, 5, 4, 0])[0], 0)
+
+
+@unittest.skipUnless(HAS_TORCH, "needs numpy and torch")
+class ShardedDatasetTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        count = 60
+        data = np.repeat(np.arange(count, dtype=np.uint8), 4).reshape(count, 2, 2)
+        # 10 records of 4 bytes per shard
+        from_numpy(data, list(range(count)), self.root, shard_bytes=40)
+
+    def _labels(self, dataset):
+        return [label for _, label in dataset]
+
+    def test_ranks_cover_the_dataset(self):
+        labels = []
+        for rank in range(2):
+            dataset = ShardedDataset(self.root, shuffle=False)
+            dataset.set_distributed(2, rank)
+            rank_labels = self._labels(dataset)
+            self.assertEqual(len(rank_labels), len(dataset))
+            labels += rank_labels
+        self.assertEqual(sorted(labels), list(range(60)))
+
+    def test_samples_match_labels(self):
+        for sample, label in ShardedDataset(self.root, shuffle=False):
+            self.assertTrue(bool((sample == label).all()))
+
+    def test_shuffled_epochs_differ_but_cover_everything(self):
+        dataset = ShardedDataset(self.root, shuffle=True, shuffle_buffer=8)
+        first = self._labels(dataset)
+        dataset.set_epoch(1)
+        second = self._labels(dataset)
+        self.assertNotEqual(first, second)
+        self.assertEqual(sorted(first), sorted(second))
+
+    def test_skip_applies_to_its_epoch(self):
+        dataset = ShardedDataset(self.root, shuffle=False)
+        full = self._labels(dataset)
+        dataset.skip = 25
+        self.assertEqual(self._labels(dataset), full[25:])
+        dataset.set_epoch(1)
+        self.assertEqual(len(self._labels(dataset)), 60)
+
+    def test_evaluation_copy_has_its_own_position(self):
+        dataset = ShardedDataset(self.root, shuffle=True)
+        dataset.set_epoch(3)
+        dataset.skip = 10
+        evaluation = dataset.evaluation_copy()
+        self.assertFalse(evaluation.shuffle)
+        self.assertEqual((evaluation.epoch, evaluation.skip), (0, 0))
+        evaluation.set_epoch(7)
+        self.assertEqual((dataset.epoch, dataset.skip), (3, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,281 @@
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import contextlib
+
+from metadata import WORKSPACE_ROOT
+
+# Content-addressed blobs shared by every run snapshot
+SNAPSHOT_ROOT = os.path.join(WORKSPACE_ROOT, '.snapshots')
+OBJECTS_DIR = os.path.join(SNAPSHOT_ROOT, 'objects')
+INDEX_PATH = os.path.join(SNAPSHOT_ROOT, 'index.db')
+
+# Unreferenced blobs younger than this are kept by gc(), so a snapshot being
+# built concurrently can still link them
+GC_GRACE_SECONDS = 3600
+
+# Generated files that are never snapshotted
+IGNORED_DIRS = {'__pycache__', '.ipynb_checkpoints'}
+IGNORED_SUFFIXES = ('.pyc',)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Without reflinks, only large artifacts of these types share their blob's
+# inode (hardlink); everything else, code and config in particular, gets a
+# private copy that a run may edit
+HARDLINK_SUFFIXES = ('.ckpt', '.pt', '.pth', '.bin', '.safetensors', '.onnx', '.tflite', '.pb',
+                     '.h5', '.npy', '.npz', '.tar', '.zip', '.gz')
+HARDLINK_MIN_BYTES = 1024 * 1024
+
+# Linux FICLONE ioctl (btrfs, XFS, bcachefs); turned off after the first failure
+FICLONE = 0x40049409
+_reflink_supported = sys.platform.startswith('linux')
+
+
+@contextlib.contextmanager
+def _index():
+    os.makedirs(SNAPSHOT_ROOT, exist_ok=True)
+    conn = sqlite3.connect(INDEX_PATH, timeout=30, isolation_level=None)
+    try:
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, '
+            'inode INTEGER NOT NULL, digest TEXT NOT NULL)'
+        )
+        # Last time a snapshot used each blob, for gc(); not the blob's mtime,
+        # which hardlinked run files share
+        conn.execute('CREATE TABLE IF NOT EXISTS blobs (name TEXT PRIMARY KEY, last_used REAL NOT NULL)')
+        yield conn
+    finally:
+        conn.close()
+
+
+def _hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _file_digest(conn, path, st):
+    """sha256 of a file, rehashed only when its size, mtime or inode changed"""
+    key = os.path.abspath(path)
+    row = conn.execute('SELECT size, mtime_ns, inode, digest FROM files WHERE path = ?', (key,)).fetchone()
+    if row is not None and tuple(row[:3]) == (st.st_size, st.st_mtime_ns, st.st_ino):
+        return row[3]
+    digest = _hash_file(path)
+    conn.execute('INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, digest) VALUES (?, ?, ?, ?, ?)',
+                 (key, st.st_size, st.st_mtime_ns, st.st_ino, digest))
+    return digest
+
+
+def _blob_path(digest, executable):
+    # The executable bit is part of the blob name since hardlinks share modes
+    name = digest + ('.x' if executable else '')
+    return os.path.join(OBJECTS_DIR, digest[:2], name)
+
+
+def _store_blob(conn, src, blob):
+    """Copy src into the object store under blob unless it is already there"""
+    # Recorded so gc() treats it as recently used
+    conn.execute('INSERT OR REPLACE INTO blobs (name, last_used) VALUES (?, ?)',
+                 (os.path.basename(blob), time.time()))
+    if os.path.exists(blob):
+        return False
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(blob), suffix='.tmp')
+    os.close(fd)
+    shutil.copyfile(src, tmp)
+    os.chmod(tmp, 0o555 if blob.endswith('.x') else 0o444)
+    try:
+        os.link(tmp, blob)
+    except FileExistsError:
+        # Stored by a concurrent snapshot in the meantime
+        pass
+    finally:
+        os.remove(tmp)
+    return True
+
+
+def _reflink(src, dst):
+    global _reflink_supported
+    if not _reflink_supported:
+        return False
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            _reflink_supported = False
+    if not _reflink_supported:
+        os.remove(dst)
+        return False
+    # A reflink is a private copy-on-write file, so it may stay writable
+    os.chmod(dst, 0o755 if src.endswith('.x') else 0o644)
+    return True
+
+
+def _shareable(path, size):
+    """True for files hardlinked when reflinks are unavailable, see HARDLINK_SUFFIXES"""
+    return size >= HARDLINK_MIN_BYTES and path.lower().endswith(HARDLINK_SUFFIXES)
+
+
+def _link(blob, dst, shareable=False):
+    """Place a blob at dst: reflink (copy-on-write), hardlink for shareable artifacts, else copy
+
+    A hardlink is not copy-on-write: the blob's read-only mode does not
+    stop root or a chmod, and a write would reach every run linking it.
+    """
+    if _reflink(blob, dst):
+        return 'reflink'
+    if shareable:
+        try:
+            os.link(blob, dst)
+            return 'hardlink'
+        except OSError:
+            # Different filesystem or links not supported
+            pass
+    shutil.copyfile(blob, dst)
+    os.chmod(dst, 0o755 if blob.endswith('.x') else 0o644)
+    return 'copy'
+
+
+def _walk(src):
+    for dirpath, dirnames, filenames in os.walk(src):
+        dirnames[:] = sorted(d for d in dirnames if d not in IGNORED_DIRS)
+        for filename in sorted(filenames):
+            if filename.endswith(IGNORED_SUFFIXES):
+                continue
+            yield os.path.join(dirpath, filename)
+
+
+def snapshot_tree(src, dst):
+    """Recreate directory src at dst from content-addressed blobs
+
+    Each file is hashed only when its size, mtime or inode changed since the
+    last snapshot (recorded in index.db), so an unchanged package costs one
+    stat per file. Identical content is stored once under OBJECTS_DIR. dst
+    receives its own directories, so files written there stay private to
+    the run. Files are reflinked where the filesystem supports it. Otherwise
+    large artifacts (HARDLINK_SUFFIXES) are hardlinked read-only, which
+    verify_snapshot() checks, and all other files are copied.
+
+    Returns counts of files, newly stored bytes and link method used.
+    """
+    stats = {"files": 0, "bytes": 0, "new_bytes": 0, "methods": {}}
+    with _index() as conn:
+        for path in _walk(src):
+            st = os.stat(path)
+            executable = bool(st.st_mode & 0o111)
+            digest = _file_digest(conn, path, st)
+
+            blob = _blob_path(digest, executable)
+            if _store_blob(conn, path, blob):
+                stats["new_bytes"] += st.st_size
+
+            target = os.path.join(dst, os.path.relpath(path, src))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            method = _link(blob, target, _shareable(path, st.st_size))
+            if method == 'hardlink':
+                # Recorded so verify_snapshot() can tell an in-place write to the shared blob
+                target_st = os.stat(target)
+                conn.execute('INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, digest) VALUES (?, ?, ?, ?, ?)',
+                             (os.path.abspath(target), target_st.st_size, target_st.st_mtime_ns,
+                              target_st.st_ino, digest))
+            stats["methods"][method] = stats["methods"].get(method, 0) + 1
+            stats["files"] += 1
+            stats["bytes"] += st.st_size
+
+    # Empty directories are part of a package too
+    for dirpath, dirnames, _ in os.walk(src):
+        dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+        os.makedirs(os.path.join(dst, os.path.relpath(dirpath, src)), exist_ok=True)
+    return stats
+
+
+def verify_snapshot(dst):
+    """Relative paths of hardlinked files under dst whose shared blob was modified in place
+
+    A file still on its blob's inode with a changed size or mtime is
+    rehashed; if the content no longer matches, every snapshot linking that
+    blob is affected. Its name is dropped from the object store, so later
+    snapshots store the content again instead of linking the damaged inode.
+    Files replaced by a new inode (e.g. os.replace) are private and skipped.
+    """
+    modified = []
+    with _index() as conn:
+        for path in _walk(dst):
+            key = os.path.abspath(path)
+            row = conn.execute('SELECT size, mtime_ns, inode, digest FROM files WHERE path = ?', (key,)).fetchone()
+            st = os.stat(path)
+            if row is None or st.st_ino != row[2] or (st.st_size, st.st_mtime_ns) == tuple(row[:2]):
+                continue
+            if _hash_file(path) == row[3]:
+                # Touched but unchanged
+                conn.execute('UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?', (st.st_size, st.st_mtime_ns, key))
+                continue
+            modified.append(os.path.relpath(path, dst))
+            blob = _blob_path(row[3], bool(st.st_mode & 0o111))
+            if os.path.exists(blob) and os.stat(blob).st_ino == st.st_ino:
+                os.remove(blob)
+    return modified
+
+
+def tree_digest(src):
+    """sha256 over the relative paths and contents of directory src
+
+    Equal for two copies of the same package, e.g. a model directory and
+    its snapshot in a run.
+    """
+    hasher = hashlib.sha256()
+    with _index() as conn:
+        for path in _walk(src):
+            digest = _file_digest(conn, path, os.stat(path))
+            hasher.update(f"{os.path.relpath(path, src)}\0{digest}\n".encode())
+    return hasher.hexdigest()
+
+
+def gc(grace_seconds=GC_GRACE_SECONDS):
+    """Delete blobs no run links to any more, returns (blobs, bytes) removed
+
+    A hardlinked blob is unreferenced once its link count is back to 1.
+    Reflinked copies are independent files, so their blobs only serve
+    future snapshots and are removed after the grace period as well.
+    """
+    removed, freed = 0, 0
+    if not os.path.exists(OBJECTS_DIR):
+        return removed, freed
+    cutoff = time.time() - grace_seconds
+    with _index() as conn:
+        last_used = dict(conn.execute('SELECT name, last_used FROM blobs').fetchall())
+        for dirpath, _, filenames in os.walk(OBJECTS_DIR):
+            for filename in filenames:
+                blob = os.path.join(dirpath, filename)
+                st = os.stat(blob)
+                used = last_used.get(filename, st.st_mtime)
+                if (filename.endswith('.tmp') or st.st_nlink == 1) and used < cutoff:
+                    os.remove(blob)
+                    conn.execute('DELETE FROM blobs WHERE name = ?', (filename,))
+                    removed += 1
+                    freed += st.st_size
+        # Index rows pointing at removed blobs are harmless (the blob is
+        # stored again on next use), but stale source paths are dropped
+        for (path,) in conn.execute('SELECT path FROM files').fetchall():
+            if not os.path.exists(path):
+                conn.execute('DELETE FROM files WHERE path = ?', (path,))
+    return removed, freed
+
+
+if __name__ == '__main__':
+    # python snapshots.py gc
+    if len(sys.argv) > 1 and sys.argv[1] == 'gc':
+        blobs, freed = gc()
+        print(f"Removed {blobs} blobs ({freed / (1024 * 1024):.1f} MB)")
+    else:
+        print("usage: python snapshots.py gc")
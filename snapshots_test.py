@@ -0,0 +1,102 @@
+import os
+import time
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import snapshots
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        store = os.path.join(self.root, '.snapshots')
+        for name, value in (('SNAPSHOT_ROOT', store), ('OBJECTS_DIR', os.path.join(store, 'objects')),
+                            ('INDEX_PATH', os.path.join(store, 'index.db')), ('_reflink_supported', False)):
+            patcher = mock.patch.object(snapshots, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.src = os.path.join(self.root, 'model')
+        os.makedirs(os.path.join(self.src, 'sub'))
+        os.makedirs(os.path.join(self.src, 'empty'))
+        os.makedirs(os.path.join(self.src, '__pycache__'))
+        self._write('model.py', 'x = 1\n')
+        self._write('sub/config.yaml', 'lr: 0.1\n')
+        self._write('__pycache__/model.cpython-311.pyc', 'ignored')
+        self._write('weights.pt', b'\0' * (snapshots.HARDLINK_MIN_BYTES + 1))
+
+    def _write(self, name, content):
+        with open(os.path.join(self.src, name), 'wb' if isinstance(content, bytes) else 'w') as f:
+            f.write(content)
+
+    def _run(self, name):
+        return os.path.join(self.root, 'runs', name, 'model')
+
+    def test_snapshot_recreates_tree(self):
+        stats = snapshots.snapshot_tree(self.src, self._run('r1'))
+        self.assertEqual(stats["files"], 3)
+        self.assertEqual(stats["methods"], {"copy": 2, "hardlink": 1})
+        with open(os.path.join(self._run('r1'), 'sub', 'config.yaml')) as f:
+            self.assertEqual(f.read(), 'lr: 0.1\n')
+        self.assertTrue(os.path.isdir(os.path.join(self._run('r1'), 'empty')))
+        self.assertFalse(os.path.exists(os.path.join(self._run('r1'), '__pycache__')))
+        self.assertEqual(snapshots.tree_digest(self.src), snapshots.tree_digest(self._run('r1')))
+
+    def test_content_is_stored_once(self):
+        first = snapshots.snapshot_tree(self.src, self._run('r1'))
+        second = snapshots.snapshot_tree(self.src, self._run('r2'))
+        self.assertGreater(first["new_bytes"], 0)
+        self.assertEqual(second["new_bytes"], 0)
+
+    def test_editing_one_snapshot_leaves_siblings_alone(self):
+        snapshots.snapshot_tree(self.src, self._run('r1'))
+        snapshots.snapshot_tree(self.src, self._run('r2'))
+        with open(os.path.join(self._run('r1'), 'model.py'), 'a') as f:
+            f.write('y = 2\n')
+        with open(os.path.join(self._run('r2'), 'model.py')) as f:
+            self.assertEqual(f.read(), 'x = 1\n')
+        self.assertEqual(snapshots.verify_snapshot(self._run('r2')), [])
+
+    def test_verify_reports_in_place_writes_to_hardlinked_artifacts(self):
+        snapshots.snapshot_tree(self.src, self._run('r1'))
+        snapshots.snapshot_tree(self.src, self._run('r2'))
+        weights = os.path.join(self._run('r1'), 'weights.pt')
+        os.chmod(weights, 0o644)
+        with open(weights, 'r+b') as f:
+            f.write(b'\1')
+        self.assertEqual(snapshots.verify_snapshot(self._run('r2')), ['weights.pt'])
+
+    def test_resnapshot_does_not_touch_linked_files(self):
+        snapshots.snapshot_tree(self.src, self._run('r1'))
+        weights = os.path.join(self._run('r1'), 'weights.pt')
+        mtime = os.stat(weights).st_mtime_ns
+        snapshots.snapshot_tree(self.src, self._run('r2'))
+        self.assertEqual(os.stat(weights).st_mtime_ns, mtime)
+
+    def test_gc_keeps_linked_and_recent_blobs(self):
+        snapshots.snapshot_tree(self.src, self._run('r1'))
+        self.assertEqual(snapshots.gc(grace_seconds=3600), (0, 0))
+        # Only the hardlinked weights blob is still referenced by a run
+        removed, _ = snapshots.gc(grace_seconds=-1)
+        self.assertEqual(removed, 2)
+        shutil.rmtree(os.path.dirname(self._run('r1')))
+        removed, _ = snapshots.gc(grace_seconds=-1)
+        self.assertEqual(removed, 1)
+
+    def test_gc_uses_recorded_last_use(self):
+        snapshots.snapshot_tree(self.src, self._run('r1'))
+        shutil.rmtree(os.path.dirname(self._run('r1')))
+        conn = sqlite3.connect(snapshots.INDEX_PATH)
+        with conn:
+            conn.execute('UPDATE blobs SET last_used = ?', (time.time() - 7200,))
+        conn.close()
+        removed, _ = snapshots.gc(grace_seconds=3600)
+        self.assertEqual(removed, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -74,12 +74,26 @@ $(document).ready(function () {
   log_dir: ./logs
   checkpoint_dir: ./checkpoints
 
+checkpoint:
+  every_n_steps: null
+  every_n_minutes: 10
+
 training:
   epochs: 10
   num_gpus: 1
   batch_size: 32
+  effective_batch_size: null
+  precision: fp32
   loss_function: CrossEntropyLoss
 
+dataloader:
+  num_workers: 4
+  autotune: false
+
+compile:
+  enabled: false
+  mode: default
+
 optimization:
   optimizer:
     name: Adam
@@ -97,6 +111,7 @@ model:
 
         $('#id_run_name').val('');
         $('#id_num_gpus').val('1');
+        $('#id_memory_mb').val('');
         $('#id_generate_engine_code').prop('disabled', true);
     });
 
@@ -210,12 +225,26 @@ misc:
   log_dir: ./logs
   checkpoint_dir: ./checkpoints
 
+checkpoint:
+  every_n_steps: null
+  every_n_minutes: 10
+
 training:
   epochs: 10
   num_gpus: ${numGpus}
   batch_size: 32
+  effective_batch_size: null
+  precision: fp32
   loss_function: CrossEntropyLoss
 
+dataloader:
+  num_workers: 4
+  autotune: false
+
+compile:
+  enabled: false
+  mode: default
+
 optimization:
   optimizer:
     name: Adam
@@ -291,6 +320,7 @@ ${engineTxt}
         const datasetName      = $('#id_select_dataset').val();
         const optimizationName = $('#id_select_optimization').val();
         const numGpus          = parseInt($('#id_num_gpus').val())||1;
+        const memoryMb         = parseInt($('#id_memory_mb').val())||null;
 
         if(!runName||!modelName||!datasetName||!optimizationName){
             toastr.error("Please fill in all required fields.");
@@ -315,6 +345,7 @@ ${engineTxt}
             dataset_name:datasetName,
             optimization_name:optimizationName,
             num_gpus:numGpus,
+            memory_mb:memoryMb,
             misc:{seed:42},
             engine_py:enginePyContent,
             config_yaml:configYamlContent
@@ -370,6 +401,7 @@ ${engineTxt}
             }
             $('#id_edit_run_name').val(run.run_name).data('original-name',run.run_name);
             $('#id_edit_num_gpus').val(run.num_gpus||1);
+            $('#id_edit_memory_mb').val(run.memory_mb||'');
             $('#id_edit_select_model').val(run.model_name);
             $('#id_edit_select_dataset').val(run.dataset_name);
             $('#id_edit_select_optimization').val(run.optimization_name);
@@ -416,6 +448,7 @@ ${engineTxt}
         const datasetName=$('#id_edit_select_dataset').val();
         const optimizationName=$('#id_edit_select_optimization').val();
         const numGpus=parseInt($('#id_edit_num_gpus').val())||1;
+        const memoryMb=parseInt($('#id_edit_memory_mb').val())||null;
 
         if(!runName||!modelName||!datasetName||!optimizationName){
             toastr.error("Please fill in all required fields.");
@@ -436,6 +469,7 @@ ${engineTxt}
             dataset_name:datasetName,
             optimization_name:optimizationName,
             num_gpus:numGpus,
+            memory_mb:memoryMb,
             misc:{seed:42},
             engine_py:enginePyContent,
             config_yaml:configYamlContent
@@ -556,7 +590,7 @@ ${engineTxt}
             const status=run.status||'Not Running';
             const gpuList=run.gpu_ids?.join(', ')||'N/A';
             let actions='';
-            if(status==='Running'){
+            if(status==='Running'||status==='Queued'||status==='Stopping'){
                 actions=`
                     <button class="btn btn-sm btn-danger me-1" onclick="stopRun('${run.run_name}')">Stop</button>
                     <button class="btn btn-sm btn-secondary me-1" onclick="editRun('${run.run_name}')">Edit</button>
@@ -625,7 +659,7 @@ ${engineTxt}
             });
             const data=await resp.json();
             if(!data.error){
-                toastr.success(`Run '${run_name}' started successfully.`);
+                toastr.success(data.message||`Run '${run_name}' started successfully.`);
                 loadRunList();
             } else {
                 toastr.error(data.error);
@@ -648,7 +682,7 @@ ${engineTxt}
             });
             const data=await resp.json();
             if(!data.error){
-                toastr.success(`Run '${run_name}' stopped successfully.`);
+                toastr.success(data.message||`Run '${run_name}' stopped successfully.`);
                 loadRunList();
             } else {
                 toastr.error(data.error);
@@ -697,6 +731,8 @@ ${engineTxt}
                 // scroll to bottom
                 const lastLine=logViewerAce.session.getLength();
                 logViewerAce.gotoLine(lastLine,0,false);
+                // receive only the lines appended after data.offset
+                startLogStream(projectName,run_name,data.offset);
             }
             $('#id_modal_log_viewer').modal('show');
         }catch(err){
@@ -705,6 +741,78 @@ ${engineTxt}
         }
     };
 
+    let logPollTimer = null;
+    let logEventSource = null;
+
+    function appendLogLines(lines){
+        if(!lines.length)return;
+        const session=logViewerAce.session;
+        const text=(session.getValue().length?"\n":"")+lines.join("\n");
+        session.insert({row:session.getLength(),column:0},text);
+        logViewerAce.gotoLine(session.getLength(),0,false);
+    }
+
+    // Server push of appended lines; falls back to polling /runs/logs
+    function startLogStream(projectName,run_name,offset){
+        stopLogPolling();
+        if(!window.EventSource){
+            startLogPolling(projectName,run_name,offset);
+            return;
+        }
+        const url=`/runs/events?project_name=${encodeURIComponent(projectName)}&run_name=${encodeURIComponent(run_name)}&log_offset=${offset}`;
+        logEventSource=new EventSource(url);
+        logEventSource.addEventListener('log',function(e){
+            const data=JSON.parse(e.data);
+            if(data.reset)logViewerAce.setValue("",-1);
+            appendLogLines(data.lines||[]);
+            offset=data.offset;
+        });
+        logEventSource.onerror=function(){
+            // a reconnect would replay from the original offset, poll from the last one instead
+            stopLogPolling();
+            if(currentLogRunName===run_name)startLogPolling(projectName,run_name,offset);
+        };
+    }
+
+    function startLogPolling(projectName,run_name,offset){
+        stopLogPolling();
+        let polling=false;
+        logPollTimer=setInterval(async function(){
+            if(polling||currentLogRunName!==run_name)return;
+            polling=true;
+            try{
+                const url=`/runs/logs?project_name=${encodeURIComponent(projectName)}&run_name=${encodeURIComponent(run_name)}&offset=${offset}`;
+                const resp=await fetch(url);
+                const data=await resp.json();
+                if(!data.error){
+                    if(data.reset)logViewerAce.setValue("",-1);
+                    appendLogLines(data.lines||[]);
+                    offset=data.offset;
+                }
+            }catch(err){
+                // transient failure, retried on the next tick
+            }finally{
+                polling=false;
+            }
+        },2000);
+    }
+
+    function stopLogPolling(){
+        if(logEventSource){
+            logEventSource.close();
+            logEventSource=null;
+        }
+        if(logPollTimer){
+            clearInterval(logPollTimer);
+            logPollTimer=null;
+        }
+    }
+
+    $('#id_modal_log_viewer').on('hidden.bs.modal',function(){
+        stopLogPolling();
+        currentLogRunName=null;
+    });
+
     // ============================================================
     // 5) STARTUP
     // ============================================================
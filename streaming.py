@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import queue
+from threading import Lock, Thread
+
+from edgeai.engine.metrics_log import METRICS_DIR, read_values
+
+LOG_DEFAULT_TAIL_LINES = 1000
+LOG_TAIL_LINES_LIMIT = 10000
+LOG_DEFAULT_MAX_BYTES = 1024 * 1024
+LOG_MAX_BYTES_LIMIT = 8 * 1024 * 1024
+
+
+def _split_log_lines(chunk):
+    return [line.rstrip() for line in chunk.decode('utf-8', errors='replace').splitlines()]
+
+
+def read_log_delta(log_file_path, offset, max_bytes=LOG_DEFAULT_MAX_BYTES):
+    """Read complete lines appended to a log after byte offset
+
+    At most max_bytes are read and the chunk is cut after its last newline,
+    so a line that is still being written is returned by the next call.
+    If the file shrank below offset (it was truncated), reading restarts at 0.
+    """
+    size = os.path.getsize(log_file_path)
+    reset = offset > size
+    if reset:
+        offset = 0
+
+    with open(log_file_path, 'rb') as f:
+        f.seek(offset)
+        chunk = f.read(min(max_bytes, size - offset))
+
+    end = chunk.rfind(b'\n')
+    if end >= 0:
+        chunk = chunk[:end + 1]
+    elif len(chunk) < max_bytes:
+        # A partial last line is only returned once it fills a whole chunk
+        chunk = b''
+
+    next_offset = offset + len(chunk)
+    return {
+        "lines": _split_log_lines(chunk),
+        "offset": next_offset,
+        "size": size,
+        "eof": next_offset >= size,
+        "reset": reset
+    }
+
+
+def read_log_tail(log_file_path, num_lines, block_size=64 * 1024):
+    """Read the last num_lines lines of a log by seeking backwards from EOF"""
+    with open(log_file_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        position = size
+        data = b''
+        while position > 0 and data.count(b'\n') <= num_lines:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+
+    # A line still being written is left for the next delta read
+    end = data.rfind(b'\n') + 1
+    lines = _split_log_lines(data[:end])
+    if position > 0:
+        # The first line is incomplete unless the scan reached the start of the file
+        lines = lines[1:]
+    next_offset = position + end
+    return {
+        "lines": lines[-num_lines:] if num_lines > 0 else [],
+        "offset": next_offset,
+        "size": size,
+        "eof": next_offset >= size,
+        "reset": False
+    }
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class RunWatcher(Thread):
+    """Watches one run directory and fans changes out to its subscribers
+
+    A stat loop (no inotify dependency) checks logs/run.log, progress.json
+    and the metric series (metrics/ segments, or legacy values.json). The
+    interval starts at MIN_INTERVAL, doubles up to MAX_INTERVAL while
+    nothing changes and drops back on the next change.
+    Only appended log lines, changed progress fields and new values points
+    are published. The thread exits once its last subscriber is gone.
+    """
+    MIN_INTERVAL = 0.25
+    MAX_INTERVAL = 2.0
+    QUEUE_SIZE = 1000
+
+    def __init__(self, runs_dir, on_idle):
+        super().__init__(daemon=True)
+        self.runs_dir = runs_dir
+        self.on_idle = on_idle
+        self.paths = {
+            "log": os.path.join(runs_dir, 'logs', 'run.log'),
+            "progress": os.path.join(runs_dir, 'progress.json'),
+            "values": os.path.join(runs_dir, 'values.json')
+        }
+        self.lock = Lock()
+        self.subscribers = []
+        self.signatures = {}
+        # Start after the last complete line so a partial one is not split
+        self.log_offset = read_log_tail(self.paths["log"], 0)["offset"] if os.path.exists(self.paths["log"]) else 0
+        self.progress = self._refresh_json("progress") or {}
+        self.values = {}
+        self.values_cursor = None
+        if os.path.isdir(os.path.join(runs_dir, METRICS_DIR)):
+            self.values, self.values_cursor = read_values(runs_dir)
+        else:
+            self.values = self._refresh_json("values") or {}
+
+    def subscribe(self):
+        """Register a subscriber
+
+        Returns its queue plus the log offset and snapshots the queue starts
+        from, so the caller can send catch-up data without gaps.
+        """
+        q = queue.Queue(maxsize=self.QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.append(q)
+            return q, self.log_offset, dict(self.progress), dict(self.values)
+
+    def unsubscribe(self, q):
+        with self.lock:
+            if q in self.subscribers:
+                self.subscribers.remove(q)
+
+    def _publish(self, event, data):
+        message = format_sse(event, data)
+        with self.lock:
+            for q in self.subscribers:
+                try:
+                    q.put_nowait(message)
+                except queue.Full:
+                    # A stalled client loses events rather than blocking the others
+                    pass
+
+    def _signature(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _refresh_json(self, target):
+        """Reload a JSON file if it changed, returns the parsed data or None"""
+        signature = self._signature(self.paths[target])
+        if signature is None or signature == self.signatures.get(target):
+            return None
+        try:
+            with open(self.paths[target], 'r') as f:
+                data = json.load(f)
+        except ValueError:
+            # Caught mid-write, the next tick sees the complete file
+            return None
+        self.signatures[target] = signature
+        return data
+
+    def _check_log(self):
+        if not os.path.exists(self.paths["log"]):
+            return False
+        changed = False
+        while True:
+            delta = read_log_delta(self.paths["log"], self.log_offset)
+            if not delta["lines"] and not delta["reset"]:
+                return changed
+            with self.lock:
+                self.log_offset = delta["offset"]
+            self._publish("log", {"lines": delta["lines"], "offset": delta["offset"], "reset": delta["reset"]})
+            changed = True
+            if delta["eof"]:
+                return changed
+
+    def _check_progress(self):
+        data = self._refresh_json("progress")
+        if not isinstance(data, dict):
+            return False
+        changes = {key: value for key, value in data.items() if self.progress.get(key) != value}
+        with self.lock:
+            self.progress = data
+        if changes:
+            self._publish("progress", changes)
+        return bool(changes)
+
+    def _check_values(self):
+        if self.values_cursor is not None or os.path.isdir(os.path.join(self.runs_dir, METRICS_DIR)):
+            # Segment format: only the bytes appended since the cursor are read
+            appended, cursor = read_values(self.runs_dir, self.values_cursor)
+            if cursor is None:
+                # No segment written yet
+                return False
+            with self.lock:
+                self.values_cursor = cursor
+                for key, points in appended.items():
+                    self.values[key] = self.values.get(key, []) + points
+            if appended:
+                self._publish("values", appended)
+            return bool(appended)
+
+        data = self._refresh_json("values")
+        if not isinstance(data, dict):
+            return False
+        appended = {}
+        for key, points in data.items():
+            previous = self.values.get(key)
+            if isinstance(points, list) and isinstance(previous, list) and len(points) >= len(previous):
+                if len(points) > len(previous):
+                    appended[key] = points[len(previous):]
+            elif points != previous:
+                appended[key] = points
+        with self.lock:
+            self.values = data
+        if appended:
+            self._publish("values", appended)
+        return bool(appended)
+
+    def run(self):
+        interval = self.MIN_INTERVAL
+        while True:
+            if not self.subscribers and self.on_idle(self):
+                return
+            changed = False
+            try:
+                changed |= self._check_log()
+                changed |= self._check_progress()
+                changed |= self._check_values()
+            except OSError:
+                # The run directory may be renamed or deleted under us
+                pass
+            interval = self.MIN_INTERVAL if changed else min(interval * 2, self.MAX_INTERVAL)
+            time.sleep(interval)
+
+
+class RunWatcherRegistry:
+    """One shared RunWatcher per run directory, however many clients listen"""
+    def __init__(self):
+        self.lock = Lock()
+        self.watchers = {}
+
+    def subscribe(self, runs_dir):
+        with self.lock:
+            watcher = self.watchers.get(runs_dir)
+            if watcher is None:
+                watcher = RunWatcher(runs_dir, self._remove)
+                self.watchers[runs_dir] = watcher
+                watcher.start()
+            return (watcher,) + watcher.subscribe()
+
+    def _remove(self, watcher):
+        # Called by an idle watcher; returning False keeps it alive because a
+        # subscribe() raced with the shutdown. Locks are taken registry first,
+        # watcher second, the same order as subscribe().
+        with self.lock:
+            with watcher.lock:
+                if watcher.subscribers:
+                    return False
+            if self.watchers.get(watcher.runs_dir) is watcher:
+                del self.watchers[watcher.runs_dir]
+            return True
+
+
+run_watchers = RunWatcherRegistry()
+
+
+def stream_run_events(runs_dir, log_offset=None, heartbeat=15.0):
+    """Generator of Server-Sent Events for one run
+
+    If log_offset is given, log lines between it and the shared watcher's
+    position are sent first. Progress and values snapshots are sent once on
+    connect; after that only changes follow.
+    """
+    watcher, q, watcher_offset, progress, values = run_watchers.subscribe(runs_dir)
+    try:
+        if progress:
+            yield format_sse("progress", progress)
+        if values:
+            yield format_sse("values", values)
+
+        log_path = watcher.paths["log"]
+        if log_offset is not None and log_offset < watcher_offset and os.path.exists(log_path):
+            offset = log_offset
+            while offset < watcher_offset:
+                delta = read_log_delta(log_path, offset, min(LOG_DEFAULT_MAX_BYTES, watcher_offset - offset))
+                if delta["reset"] or delta["offset"] <= offset:
+                    break
+                yield format_sse("log", {"lines": delta["lines"], "offset": delta["offset"], "reset": False})
+                offset = delta["offset"]
+
+        while True:
+            try:
+                yield q.get(timeout=heartbeat)
+            except queue.Empty:
+                # Comment line keeps proxies from closing the connection and
+                # lets the server notice clients that went away
+                yield ": keepalive\n\n"
+    finally:
+        watcher.unsubscribe(q)
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from streaming import read_log_delta, read_log_tail
+
+
+class LogReadTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, 'run.log')
+
+    def _write(self, content, mode='wb'):
+        with open(self.path, mode) as f:
+            f.write(content)
+
+    def test_tail_returns_last_lines(self):
+        self._write(b''.join(f"line {i}\n".encode() for i in range(100)))
+        result = read_log_tail(self.path, 3)
+        self.assertEqual(result["lines"], ["line 97", "line 98", "line 99"])
+        self.assertEqual(result["offset"], os.path.getsize(self.path))
+        self.assertTrue(result["eof"])
+
+    def test_tail_across_blocks_drops_the_cut_line(self):
+        self._write(b''.join(f"line {i:04d}\n".encode() for i in range(1000)))
+        result = read_log_tail(self.path, 50, block_size=64)
+        self.assertEqual(result["lines"], [f"line {i:04d}" for i in range(950, 1000)])
+
+    def test_tail_of_a_short_log(self):
+        self._write(b"a\nb\n")
+        self.assertEqual(read_log_tail(self.path, 10)["lines"], ["a", "b"])
+
+    def test_tail_leaves_partial_line_for_delta(self):
+        self._write(b"a\nb\npart")
+        result = read_log_tail(self.path, 10)
+        self.assertEqual(result["lines"], ["a", "b"])
+        self.assertEqual(result["offset"], 4)
+        self.assertFalse(result["eof"])
+        self._write(b"ial\n", 'ab')
+        self.assertEqual(read_log_delta(self.path, result["offset"])["lines"], ["partial"])
+
+    def test_zero_lines_gives_the_resume_offset(self):
+        self._write(b"a\nb\n")
+        result = read_log_tail(self.path, 0)
+        self.assertEqual(result["lines"], [])
+        self.assertEqual(result["offset"], 4)
+
+    def test_delta_restarts_after_truncation(self):
+        self._write(b"new\n")
+        result = read_log_delta(self.path, 100)
+        self.assertTrue(result["reset"])
+        self.assertEqual(result["lines"], ["new"])
+
+    def test_delta_respects_max_bytes(self):
+        self._write(b"aaaa\nbbbb\ncccc\n")
+        result = read_log_delta(self.path, 0, max_bytes=12)
+        self.assertEqual(result["lines"], ["aaaa", "bbbb"])
+        self.assertEqual(result["offset"], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()